@@ -0,0 +1,23 @@
+"""
+Runs the agent application under uvicorn. Event loop lag is exported to `/metrics` by the agent's loop
+watchdog (`agent_event_loop_lag_seconds`), blocked call sites as `agent_event_loop_blocked_total`.
+With `--workers` > 1 `/metrics` reflects the worker that served the scrape.
+
+Usage:
+    python -m benchmarks.agent_runner --port 5030 [--workers 1]
+"""
+import argparse
+
+from task.app import run
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=5030)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    run(host="127.0.0.1", port=args.port, workers=args.workers, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
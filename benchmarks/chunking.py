@@ -0,0 +1,104 @@
+"""
+Compares RagTool's token-aware `TextChunker` with langchain's `RecursiveCharacterTextSplitter` (500 characters,
+the splitter RagTool used before): import time, chunking throughput on tests/microwave_manual.txt repeated
+to `--megabytes`, chunks longer than the embedding model window (truncated by the model) and retrieval hit rate
+on `benchmarks/rag_queries.jsonl`. The langchain baseline runs only when `langchain-text-splitters` is installed.
+
+Usage:
+    python -m benchmarks.chunking [--megabytes 5] [--k 3] [--backend torch]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from benchmarks.embedding_backends import _MANUAL_PATH
+from benchmarks.rag_retrieval import _QUERIES_PATH, evaluate
+from task.tools.rag.chunker import TextChunker, estimate_tokens, load_tokenizer
+from task.tools.rag.embedding_service import EMBEDDING_MODEL_NAME, load_sentence_transformer
+
+# all-MiniLM-L6-v2 max_seq_length without [CLS] and [SEP]
+_MODEL_WINDOW_TOKENS = 254
+
+
+def _import_seconds(module: str) -> float:
+    code = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def _langchain_splitter() -> Optional[Callable[[str], list[str]]]:
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:
+        return None
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=500, chunk_overlap=50, length_function=len, separators=["\n\n", "\n", ". ", " ", ""]
+    )
+    return splitter.split_text
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megabytes", type=float, default=5, help="Size of the text for throughput")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--backend", default="torch")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--json", help="Write reports to this file")
+    args = parser.parse_args()
+
+    text = _MANUAL_PATH.read_text(encoding="utf-8")
+    large_text = text * int(args.megabytes * 1024 * 1024 / len(text) + 1)
+    queries = [json.loads(line) for line in _QUERIES_PATH.read_text().splitlines() if line.strip()]
+    count_tokens = load_tokenizer(args.model)
+
+    splitters: dict[str, tuple[str, Callable[[str], list[str]]]] = {
+        "TextChunker": ("task.tools.rag.chunker", TextChunker(count_tokens=count_tokens).split_text),
+    }
+    langchain_split = _langchain_splitter()
+    if langchain_split:
+        splitters["langchain 500 chars"] = ("langchain_text_splitters", langchain_split)
+    else:
+        print("langchain-text-splitters is not installed, baseline skipped")
+
+    model = load_sentence_transformer(args.model, args.backend)
+    reports = []
+    for name, (module, split) in splitters.items():
+        started = time.perf_counter()
+        large_chunks = split(large_text)
+        split_seconds = time.perf_counter() - started
+
+        chunks = split(text)
+        tokens = (count_tokens or estimate_tokens)(chunks)
+        hit_rates = {
+            report["configuration"]: report["hit_rate"] for report in evaluate(chunks, queries, model.encode, args.k)
+        }
+        reports.append({
+            "splitter": name,
+            "import_seconds": _import_seconds(module),
+            "megabytes_per_second": len(large_text) / split_seconds / 1024 / 1024,
+            "chunks_per_megabyte": len(large_chunks) / (len(large_text) / 1024 / 1024),
+            "chunks": len(chunks),
+            "max_tokens": max(tokens),
+            "truncated_chunks": sum(count > _MODEL_WINDOW_TOKENS for count in tokens),
+            f"vector_hit_at_{args.k}": hit_rates["vector"],
+            f"hybrid_mmr_hit_at_{args.k}": hit_rates["hybrid+mmr"],
+        })
+
+    print(f"{'splitter':>20} | {'import s':>8} | {'MB/s':>6} | {'chunks':>6} | {'max tokens':>10} | "
+          f"{'truncated':>9} | {'vector hit@' + str(args.k):>12} | {'hybrid hit@' + str(args.k):>12}")
+    for report in reports:
+        print(
+            f"{report['splitter']:>20} | {report['import_seconds']:>8.2f} | {report['megabytes_per_second']:>6.2f} | "
+            f"{report['chunks']:>6} | {report['max_tokens']:>10} | {report['truncated_chunks']:>9} | "
+            f"{report[f'vector_hit_at_{args.k}']:>12.2f} | {report[f'hybrid_mmr_hit_at_{args.k}']:>12.2f}"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+How fast the agent releases upstream work when clients disconnect mid-request: starts the agent against local
+stub DIAL Core and MCP servers, sends streaming and non-streaming requests, drops every connection after
+`--disconnect-after` seconds and polls stub stats until no LLM stream or MCP tool call of theirs is active.
+Stub answers and tool calls are long (`--answer-tokens`, `--mcp-delay`), so work left running after disconnect
+shows up as not released within `--release-timeout`.
+
+Usage:
+    python -m benchmarks.disconnect [--only chat,web_search] [--requests 8] [--disconnect-after 1]
+        [--answer-tokens 2000] [--mcp-delay 30] [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Optional
+
+import httpx
+
+from benchmarks.load_test import (
+    _COMPLETIONS_PATH, _DEFAULT_SCENARIOS, _build_request, _counter_total, _free_port, _start, _wait_for_port,
+)
+
+_CANCELLATIONS_METRIC = "agent_cancellations_total"
+
+
+async def _disconnect(client: httpx.AsyncClient, url: str, scenario: dict[str, Any], stream: bool, after: float):
+    body = {**_build_request(scenario), "stream": stream}
+    headers = {"Api-Key": "stub", "x-conversation-id": uuid.uuid4().hex}
+    try:
+        # cancelling the request closes its connection, like a closed browser tab
+        await asyncio.wait_for(client.post(url, json=body, headers=headers), after)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def _warm_up(client: httpx.AsyncClient, url: str) -> None:
+    """Tools (embedding model, MCP sessions) are created on the first request, waits for its first content."""
+    body = _build_request({"message": "warm up"})
+    async with client.stream("POST", url, json=body, headers={"Api-Key": "stub"}, timeout=300) as response:
+        async for line in response.aiter_lines():
+            if '"content"' in line:
+                return
+
+
+async def _active(client: httpx.AsyncClient, stats_urls: list[str]) -> int:
+    total = 0
+    for url in stats_urls:
+        stats = (await client.get(url)).json()
+        total += stats.get("active_streams", 0) + stats.get("active_calls", 0)
+    return total
+
+
+async def _release_seconds(client: httpx.AsyncClient, stats_urls: list[str], timeout: float) -> Optional[float]:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if not await _active(client, stats_urls):
+            return time.perf_counter() - started
+        await asyncio.sleep(0.02)
+    return None
+
+
+async def main_async(args: argparse.Namespace) -> list[dict[str, Any]]:
+    scenarios = {}
+    for line in Path(_DEFAULT_SCENARIOS).read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            scenario = json.loads(line)
+            scenarios.setdefault(scenario["scenario"], scenario)
+    names = args.only.split(",")
+
+    dial_port, ddg_port, interpreter_port, agent_port = (_free_port() for _ in range(4))
+    processes = [
+        _start("benchmarks.stubs.dial_stub", "--port", str(dial_port), "--token-delay", str(args.token_delay),
+               "--answer-tokens", str(args.answer_tokens)),
+        _start("benchmarks.stubs.mcp_stub", "--kind", "ddg", "--port", str(ddg_port),
+               "--delay", str(args.mcp_delay)),
+        _start("benchmarks.stubs.mcp_stub", "--kind", "interpreter", "--port", str(interpreter_port),
+               "--delay", str(args.mcp_delay)),
+    ]
+    stats_urls = [f"http://127.0.0.1:{port}/stub/stats" for port in (dial_port, ddg_port, interpreter_port)]
+    try:
+        for process, port in zip(processes, (dial_port, ddg_port, interpreter_port)):
+            await _wait_for_port(port, process)
+        agent = _start("benchmarks.agent_runner", "--port", str(agent_port), env={
+            "DIAL_ENDPOINT": f"http://127.0.0.1:{dial_port}",
+            "DDG_MCP_URL": f"http://127.0.0.1:{ddg_port}/mcp",
+            "PY_INTERPRETER_MCP_URL": f"http://127.0.0.1:{interpreter_port}/mcp",
+            "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+        })
+        processes.append(agent)
+        await _wait_for_port(agent_port, agent)
+
+        base_url = f"http://127.0.0.1:{agent_port}"
+        reports = []
+        async with httpx.AsyncClient(timeout=args.release_timeout) as client:
+            await _warm_up(client, base_url + _COMPLETIONS_PATH)
+            await _release_seconds(client, stats_urls, args.release_timeout)
+
+            for name in names:
+                for stream in (True, False):
+                    metrics_before = (await client.get(base_url + "/metrics")).text
+                    await asyncio.gather(*(
+                        _disconnect(client, base_url + _COMPLETIONS_PATH, scenarios[name], stream,
+                                    args.disconnect_after)
+                        for _ in range(args.requests)
+                    ))
+                    release_seconds = await _release_seconds(client, stats_urls, args.release_timeout)
+                    # cancellations are counted when cancelled work finishes unwinding
+                    await asyncio.sleep(0.2)
+                    metrics_after = (await client.get(base_url + "/metrics")).text
+                    reports.append({
+                        "scenario": name,
+                        "stream": stream,
+                        "requests": args.requests,
+                        "release_ms": release_seconds * 1000 if release_seconds is not None else None,
+                        **{
+                            f"cancelled_{operation}": _counter_total(
+                                metrics_after, _CANCELLATIONS_METRIC, f'operation="{operation}"'
+                            ) - _counter_total(metrics_before, _CANCELLATIONS_METRIC, f'operation="{operation}"')
+                            for operation in ("request", "llm_stream", "tool_call", "mcp_call")
+                        },
+                    })
+                    if release_seconds is None:
+                        # don't let leftovers of this run count against the next one
+                        await _release_seconds(client, stats_urls, args.mcp_delay + args.answer_tokens * args.token_delay)
+        return reports
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except Exception:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", default="chat,web_search", help="Comma-separated scenario names")
+    parser.add_argument("--requests", type=int, default=8, help="Requests per scenario and mode")
+    parser.add_argument("--disconnect-after", type=float, default=1.0, help="Seconds before disconnect")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Delay between stub LLM tokens, seconds")
+    parser.add_argument("--answer-tokens", type=int, default=2000, help="Length of stub LLM answers, tokens")
+    parser.add_argument("--mcp-delay", type=float, default=30, help="Latency of stub MCP tools, seconds")
+    parser.add_argument("--release-timeout", type=float, default=10, help="Max wait for upstream work to stop")
+    parser.add_argument("--json", help="Write reports to this file")
+    args = parser.parse_args()
+
+    reports = asyncio.run(main_async(args))
+    print(f"{'scenario':>12} | {'stream':>6} | {'req':>4} | {'release ms':>10} | {'request':>7} | "
+          f"{'llm':>5} | {'tool':>5} | {'mcp':>5}")
+    for report in reports:
+        release = f"{report['release_ms']:.0f}" if report["release_ms"] is not None else "not released"
+        print(
+            f"{report['scenario']:>12} | {str(report['stream']):>6} | {report['requests']:>4} | {release:>10} | "
+            f"{report['cancelled_request']:>7.0f} | {report['cancelled_llm_stream']:>5.0f} | "
+            f"{report['cancelled_tool_call']:>5.0f} | {report['cancelled_mcp_call']:>5.0f}"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Compares embedding backends of RagTool on CPU: indexing throughput (chunks per second), resident memory
+and recall@k of every backend against full precision torch on `benchmarks/rag_queries.jsonl`.
+Every backend runs in its own process so memory numbers don't include other backends.
+
+Usage:
+    python -m benchmarks.embedding_backends [--backends torch,torch-int8,onnx,onnx-int8] [--chunks 2000] [--k 3]
+"""
+import argparse
+import json
+import multiprocessing
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from task.tools.rag.chunker import TextChunker, load_tokenizer
+from task.tools.rag.embedding_service import EMBEDDING_BACKENDS, EMBEDDING_MODEL_NAME, load_sentence_transformer
+
+_MANUAL_PATH = Path(__file__).parent.parent / "tests" / "microwave_manual.txt"
+_QUERIES_PATH = Path(__file__).parent / "rag_queries.jsonl"
+
+
+def manual_chunks(text: str | None = None, model_name: str = EMBEDDING_MODEL_NAME) -> list[str]:
+    """Chunks of tests/microwave_manual.txt (or of the given text) split the same way as RagTool does."""
+    chunker = TextChunker(count_tokens=load_tokenizer(model_name))
+    return chunker.split_text(text if text is not None else _MANUAL_PATH.read_text(encoding="utf-8"))
+
+
+def _rss_kb() -> int:
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1])
+    return 0
+
+
+def _measure(backend: str, model_name: str, chunks: list[str], queries: list[str], total_chunks: int) -> dict[str, Any]:
+    rss_before = _rss_kb()
+    started = time.perf_counter()
+    model = load_sentence_transformer(model_name, backend)
+    load_seconds = time.perf_counter() - started
+    rss_loaded = _rss_kb()
+
+    chunk_embeddings = model.encode(chunks)
+    corpus = (chunks * (total_chunks // len(chunks) + 1))[:total_chunks]
+    started = time.perf_counter()
+    model.encode(corpus, batch_size=32)
+    encode_seconds = time.perf_counter() - started
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "chunks_per_second": total_chunks / encode_seconds,
+        "model_rss_mb": (rss_loaded - rss_before) / 1024,
+        "rss_mb": _rss_kb() / 1024,
+        "chunk_embeddings": np.asarray(chunk_embeddings, dtype="float32"),
+        "query_embeddings": np.asarray(model.encode(queries), dtype="float32"),
+    }
+
+
+def _top_k(chunk_embeddings: np.ndarray, query_embeddings: np.ndarray, k: int) -> list[set[int]]:
+    distances = ((query_embeddings[:, None, :] - chunk_embeddings[None, :, :]) ** 2).sum(axis=-1)
+    return [set(row[:k]) for row in np.argsort(distances, axis=1)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default=",".join(EMBEDDING_BACKENDS))
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--chunks", type=int, default=2000, help="Chunks to embed for throughput")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--json", help="Write reports to this file")
+    args = parser.parse_args()
+
+    chunks = manual_chunks(model_name=args.model)
+    queries = [json.loads(line)["query"] for line in _QUERIES_PATH.read_text().splitlines() if line.strip()]
+    backends = args.backends.split(",")
+    if "torch" not in backends:
+        backends.insert(0, "torch")
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for backend in backends:
+        # fresh process per backend, otherwise RSS includes previously loaded runtimes
+        with context.Pool(1) as pool:
+            try:
+                results[backend] = pool.apply(_measure, (backend, args.model, chunks, queries, args.chunks))
+            except Exception as e:
+                print(f"{backend}: skipped, {type(e).__name__}: {e}")
+
+    baseline = results["torch"]
+    baseline_top_k = _top_k(baseline["chunk_embeddings"], baseline["query_embeddings"], args.k)
+    reports = []
+    for backend, result in results.items():
+        top_k = _top_k(result["chunk_embeddings"], result["query_embeddings"], args.k)
+        recall = np.mean([len(a & b) / args.k for a, b in zip(top_k, baseline_top_k)])
+        a, b = result["chunk_embeddings"], baseline["chunk_embeddings"]
+        cosine = np.mean((a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)))
+        reports.append({
+            "backend": backend,
+            "chunks_per_second": result["chunks_per_second"],
+            "load_seconds": result["load_seconds"],
+            "model_rss_mb": result["model_rss_mb"],
+            "rss_mb": result["rss_mb"],
+            f"recall_at_{args.k}_vs_torch": float(recall),
+            "cosine_vs_torch": float(cosine),
+        })
+
+    print(f"{'backend':>12} | {'chunks/s':>9} | {'load s':>7} | {'model MB':>9} | {'RSS MB':>8} | "
+          f"{'recall@' + str(args.k):>9} | {'cosine':>7}")
+    for report in reports:
+        print(
+            f"{report['backend']:>12} | {report['chunks_per_second']:>9.1f} | {report['load_seconds']:>7.1f} | "
+            f"{report['model_rss_mb']:>9.1f} | {report['rss_mb']:>8.1f} | "
+            f"{report[f'recall_at_{args.k}_vs_torch']:>9.3f} | {report['cosine_vs_torch']:>7.4f}"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Re-indexing edited copies of tests/microwave_manual.txt with the chunk embedding cache: every edit is indexed
+after the original document, like v2 of a document uploaded to the same conversation. Reports how many chunks
+had to be embedded (cache misses), cache hit rate and indexing time with and without the cache.
+
+Usage:
+    python -m benchmarks.embedding_cache [--backend torch] [--disk-path /tmp/embeddings.sqlite]
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from benchmarks.embedding_backends import _MANUAL_PATH, manual_chunks
+from task.tools.rag.embedding_cache import CachedEmbeddingModel, EmbeddingCache
+from task.tools.rag.embedding_service import EMBEDDING_MODEL_NAME, load_sentence_transformer
+
+
+def edited_versions(text: str) -> dict[str, str]:
+    """Original manual and typical v2 edits of it."""
+    paragraphs = text.split("\n\n")
+    middle = len(paragraphs) // 2
+    changed = list(paragraphs)
+    changed[middle] = changed[middle].replace(".", ", as updated in revision 2.", 1)
+    inserted = paragraphs[:middle] + ["NOTE: This paragraph was added in revision 2 of the manual."] + paragraphs[middle:]
+    return {
+        "original": text,
+        "paragraph changed": "\n\n".join(changed),
+        "paragraph inserted": "\n\n".join(inserted),
+        "section appended": text + "\n\nREVISION HISTORY\n\nRevision 2 clarifies defrost and cleaning instructions.",
+        "original again": text,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", default="torch")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--disk-path", help="SQLite file of the on-disk cache, in-memory only if omitted")
+    parser.add_argument("--json", help="Write reports to this file")
+    args = parser.parse_args()
+
+    model = load_sentence_transformer(args.model, args.backend)
+    model.encode(["warm up"])
+    cached_model = CachedEmbeddingModel(model, f"{args.model}:{args.backend}", EmbeddingCache(disk_path=args.disk_path))
+
+    reports = []
+    for name, text in edited_versions(_MANUAL_PATH.read_text(encoding="utf-8")).items():
+        chunks = manual_chunks(text, args.model)
+
+        started = time.perf_counter()
+        model.encode(chunks)
+        uncached_seconds = time.perf_counter() - started
+
+        cached_before = cached_model.cache.size()
+        started = time.perf_counter()
+        cached_model.encode(chunks)
+        cached_seconds = time.perf_counter() - started
+        # every embedded chunk becomes a new cache entry, the cache is large enough to never evict here
+        misses = cached_model.cache.size() - cached_before
+
+        reports.append({
+            "version": name,
+            "chunks": len(chunks),
+            "embedded": misses,
+            "hit_rate": 1 - misses / len(chunks),
+            "uncached_ms": uncached_seconds * 1000,
+            "cached_ms": cached_seconds * 1000,
+        })
+
+    print(f"{'version':>18} | {'chunks':>6} | {'embedded':>8} | {'hit rate':>8} | {'no cache ms':>11} | {'cache ms':>8}")
+    for report in reports:
+        print(
+            f"{report['version']:>18} | {report['chunks']:>6} | {report['embedded']:>8} | "
+            f"{report['hit_rate']:>8.2f} | {report['uncached_ms']:>11.1f} | {report['cached_ms']:>8.1f}"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
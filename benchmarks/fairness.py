@@ -0,0 +1,132 @@
+"""
+Whether one user flooding the agent degrades others: a heavy API key sends `--heavy-requests` multi-document RAG
+requests at once, while a light key sends `--light-requests` short chat requests one after another. Runs the
+agent without admission control and with `--max-concurrent` slots (`--max-active-per-key` of them for one key)
+shared by weighted fair queuing, and reports
+latency of both users and requests rejected with 429.
+
+Usage:
+    python -m benchmarks.fairness [--heavy-requests 32] [--light-requests 8] [--max-concurrent 4]
+        [--max-active-per-key 3] [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from benchmarks.load_test import (
+    _COMPLETIONS_PATH, _DEFAULT_SCENARIOS, _free_port, _percentile, _send, _start, _wait_for_port,
+)
+
+
+def _latencies(results: list[dict[str, Any]]) -> dict[str, float]:
+    latencies = [r["latency"] for r in results if not r["error"]]
+    return {
+        "p50_ms": (_percentile(latencies, 0.5) or 0) * 1000,
+        "p95_ms": (_percentile(latencies, 0.95) or 0) * 1000,
+    }
+
+
+async def _measure(name: str, admission: dict[str, str], args: argparse.Namespace) -> dict[str, Any]:
+    scenarios = {}
+    for line in Path(_DEFAULT_SCENARIOS).read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            scenario = json.loads(line)
+            scenarios.setdefault(scenario["scenario"], scenario)
+
+    dial_port, ddg_port, interpreter_port, agent_port = (_free_port() for _ in range(4))
+    processes = [
+        _start("benchmarks.stubs.dial_stub", "--port", str(dial_port), "--token-delay", str(args.token_delay)),
+        _start("benchmarks.stubs.mcp_stub", "--kind", "ddg", "--port", str(ddg_port)),
+        _start("benchmarks.stubs.mcp_stub", "--kind", "interpreter", "--port", str(interpreter_port)),
+    ]
+    try:
+        for process, port in zip(processes, (dial_port, ddg_port, interpreter_port)):
+            await _wait_for_port(port, process)
+        agent = _start("benchmarks.agent_runner", "--port", str(agent_port), env={
+            "DIAL_ENDPOINT": f"http://127.0.0.1:{dial_port}",
+            "DDG_MCP_URL": f"http://127.0.0.1:{ddg_port}/mcp",
+            "PY_INTERPRETER_MCP_URL": f"http://127.0.0.1:{interpreter_port}/mcp",
+            "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+            **admission,
+        })
+        processes.append(agent)
+        await _wait_for_port(agent_port, agent)
+
+        url = f"http://127.0.0.1:{agent_port}{_COMPLETIONS_PATH}"
+        async with httpx.AsyncClient(timeout=600, limits=httpx.Limits(max_connections=None)) as client:
+            # tools (embedding model, MCP sessions) are created on the first request
+            warmup = await _send(client, url, {"message": "warm up"})
+            if warmup["error"]:
+                raise RuntimeError(f"Warm-up request failed: {warmup['error']}")
+
+            async def light_user() -> list[dict[str, Any]]:
+                # starts once the heavy requests are in
+                await asyncio.sleep(0.5)
+                return [
+                    await _send(client, url, scenarios["chat"], api_key="light") for _ in range(args.light_requests)
+                ]
+
+            heavy, light = await asyncio.gather(
+                asyncio.gather(*(
+                    _send(client, url, scenarios["rag_multi"], api_key="heavy") for _ in range(args.heavy_requests)
+                )),
+                light_user(),
+            )
+        return {
+            "admission": name,
+            **{f"light_{key}": value for key, value in _latencies(light).items()},
+            **{f"heavy_{key}": value for key, value in _latencies(heavy).items()},
+            "heavy_rejected": sum(bool(r["error"]) and "429" in r["error"] for r in heavy),
+            "errors": sum(bool(r["error"]) and "429" not in r["error"] for r in heavy + light),
+        }
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except Exception:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--heavy-requests", type=int, default=32)
+    parser.add_argument("--light-requests", type=int, default=8)
+    parser.add_argument("--max-concurrent", type=int, default=4)
+    parser.add_argument("--max-active-per-key", type=int, default=3)
+    parser.add_argument("--max-queued-per-key", type=int, default=24)
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Delay between stub LLM tokens, seconds")
+    parser.add_argument("--json", help="Write reports to this file")
+    args = parser.parse_args()
+
+    settings = {
+        "off": {"ADMISSION_MAX_CONCURRENT": "0"},
+        f"{args.max_concurrent}/{args.max_active_per_key} slots": {
+            "ADMISSION_MAX_CONCURRENT": str(args.max_concurrent),
+            # the benchmark's API keys stand for users, DIAL Core would send a new key per request
+            "ADMISSION_KEY_HEADER": "api-key",
+            "ADMISSION_MAX_ACTIVE_PER_KEY": str(args.max_active_per_key),
+            "ADMISSION_MAX_QUEUED_PER_KEY": str(args.max_queued_per_key),
+        },
+    }
+    reports = [asyncio.run(_measure(name, env, args)) for name, env in settings.items()]
+    print(f"{'admission':>10} | {'light p50':>9} | {'light p95':>9} | {'heavy p50':>9} | {'heavy p95':>9} | "
+          f"{'429':>4} | {'errors':>6}")
+    for report in reports:
+        print(
+            f"{report['admission']:>10} | {report['light_p50_ms']:>9.0f} | {report['light_p95_ms']:>9.0f} | "
+            f"{report['heavy_p50_ms']:>9.0f} | {report['heavy_p95_ms']:>9.0f} | {report['heavy_rejected']:>4} | "
+            f"{report['errors']:>6}"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Tail latency of LLM calls under upstream latency spikes and outages, with and without `LLMRouter` hedging and
+fallback: the stub delays the first chunk of a share of `gpt-4o` completions, `gpt-4o-backup` is always fast.
+Replays the chat scenario and reports latency percentiles and upstream completion requests per agent request.
+
+Usage:
+    python -m benchmarks.hedging [--requests 100] [--concurrency 4] [--spike-probability 0.05] [--spike-seconds 3]
+        [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from benchmarks.load_test import (
+    _COMPLETIONS_PATH, _DEFAULT_SCENARIOS, _free_port, _percentile, _run_scenario, _send, _start, _wait_for_port,
+)
+
+_SINGLE = {"LLM_DEPLOYMENTS": "gpt-4o", "LLM_HEDGE_QUANTILE": "0"}
+_ROUTED = {"LLM_DEPLOYMENTS": "gpt-4o,gpt-4o-backup"}
+
+
+async def _measure(
+        name: str, spikes: dict[str, list[float]], agent_env: dict[str, str], args: argparse.Namespace
+) -> dict[str, Any]:
+    scenarios = [
+        json.loads(line) for line in Path(_DEFAULT_SCENARIOS).read_text(encoding="utf-8").splitlines()
+        if line.strip() and json.loads(line)["scenario"] == "chat"
+    ]
+    dial_port, ddg_port, interpreter_port, agent_port = (_free_port() for _ in range(4))
+    processes = [
+        _start("benchmarks.stubs.dial_stub", "--port", str(dial_port), "--spikes", json.dumps(spikes)),
+        _start("benchmarks.stubs.mcp_stub", "--kind", "ddg", "--port", str(ddg_port)),
+        _start("benchmarks.stubs.mcp_stub", "--kind", "interpreter", "--port", str(interpreter_port)),
+    ]
+    try:
+        for process, port in zip(processes, (dial_port, ddg_port, interpreter_port)):
+            await _wait_for_port(port, process)
+        agent = _start("benchmarks.agent_runner", "--port", str(agent_port), env={
+            "DIAL_ENDPOINT": f"http://127.0.0.1:{dial_port}",
+            "DDG_MCP_URL": f"http://127.0.0.1:{ddg_port}/mcp",
+            "PY_INTERPRETER_MCP_URL": f"http://127.0.0.1:{interpreter_port}/mcp",
+            "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+            "LLM_FIRST_TOKEN_TIMEOUT_MS": str(args.first_token_timeout_ms),
+            "LLM_HEDGE_QUANTILE": str(args.hedge_quantile),
+            **agent_env,
+        })
+        processes.append(agent)
+        await _wait_for_port(agent_port, agent)
+
+        base_url = f"http://127.0.0.1:{agent_port}"
+        async with httpx.AsyncClient(timeout=300) as client:
+            # tools (embedding model, MCP sessions) are created on the first request
+            warmup = await _send(client, base_url + _COMPLETIONS_PATH, {"message": "warm up"})
+            if warmup["error"]:
+                raise RuntimeError(f"Warm-up request failed: {warmup['error']}")
+            requests_before = (await client.get(f"http://127.0.0.1:{dial_port}/stub/stats")).json()["requests"]
+            results, _ = await _run_scenario(client, base_url, scenarios, args.requests, args.concurrency)
+            requests_after = (await client.get(f"http://127.0.0.1:{dial_port}/stub/stats")).json()["requests"]
+        latencies = [r["latency"] for r in results if not r["error"]]
+        upstream = sum(requests_after.values()) - sum(requests_before.values())
+        return {
+            "setting": name,
+            "errors": sum(bool(r["error"]) for r in results),
+            **{f"latency_p{q}_ms": (_percentile(latencies, q / 100) or 0) * 1000 for q in (50, 95, 99)},
+            "upstream_per_request": upstream / len(results),
+        }
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except Exception:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--spike-probability", type=float, default=0.05)
+    parser.add_argument("--spike-seconds", type=float, default=3.0)
+    parser.add_argument("--hedge-quantile", type=float, default=0.9)
+    parser.add_argument("--first-token-timeout-ms", type=float, default=5000)
+    parser.add_argument("--json", help="Write reports to this file")
+    args = parser.parse_args()
+
+    spikes = {"gpt-4o": [args.spike_probability, args.spike_seconds]}
+    # primary deployment never answers in time
+    outage = {"gpt-4o": [1.0, 60.0]}
+    settings = [
+        ("spikes, single", spikes, _SINGLE),
+        ("spikes, hedged", spikes, _ROUTED),
+        ("outage, fallback", outage, {**_ROUTED, "LLM_HEDGE_QUANTILE": "0"}),
+        ("outage, hedged", outage, _ROUTED),
+    ]
+    reports = [asyncio.run(_measure(name, spikes, env, args)) for name, spikes, env in settings]
+    print(f"{'setting':>18} | {'err':>4} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7} | {'upstream/req':>12}")
+    for report in reports:
+        print(
+            f"{report['setting']:>18} | {report['errors']:>4} | {report['latency_p50_ms']:>7.0f} | "
+            f"{report['latency_p95_ms']:>7.0f} | {report['latency_p99_ms']:>7.0f} | "
+            f"{report['upstream_per_request']:>12.2f}"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Compares HTML text extraction of `HtmlTextExtractor` (lxml, incremental) with the BeautifulSoup `html.parser` path
+DialFileContentExtractor used before, on the pages in tests/ (saved web page, search results, broken legacy
+markup): throughput, peak memory of a fresh process and whether the text is the same. The body of each page is
+repeated up to `--megabytes`.
+
+Usage:
+    python -m benchmarks.html_extraction [--megabytes 10] [--repeats 3] [--json results.json]
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from task.utils.html_extractor import HtmlTextExtractor
+
+_CORPUS = sorted((Path(__file__).parent.parent / "tests").glob("*.html"))
+
+
+def beautifulsoup_text(content: bytes) -> str:
+    soup = BeautifulSoup(content.decode('utf-8', errors='ignore'), features='html.parser')
+    for script in soup(["script", "style"]):
+        script.decompose()
+    return soup.get_text(separator='\n', strip=True)
+
+
+def lxml_text(content: bytes) -> str:
+    return HtmlTextExtractor().extract_text(content)
+
+
+ENGINES = {"bs4 html.parser": beautifulsoup_text, "lxml incremental": lxml_text}
+
+
+def scale(content: bytes, megabytes: float) -> bytes:
+    """Repeats the body of the page, so the page structure stays the same."""
+    lower = content.lower()
+    start = lower.find(b">", lower.find(b"<body")) + 1 if b"<body" in lower else 0
+    end = lower.rfind(b"</body>") if b"</body>" in lower else len(content)
+    body = content[start:end]
+    copies = max(1, int(megabytes * 1024 * 1024 / max(1, len(body))))
+    return content[:start] + body * copies + content[end:]
+
+
+def _run(engine: str, path: str, megabytes: float, repeats: int) -> dict:
+    """Runs in a fresh process, so peak RSS is of this engine only."""
+    content = scale(Path(path).read_bytes(), megabytes)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    for _ in range(repeats):
+        text = ENGINES[engine](content)
+    seconds = (time.perf_counter() - started) / repeats
+    return {
+        "mb": len(content) / 1024 / 1024,
+        "seconds": seconds,
+        "peak_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_kb) / 1024,
+        "text": text,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--megabytes", type=float, default=10, help="Size each page is scaled to")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", help="Write reports to this file")
+    args = parser.parse_args()
+
+    reports = []
+    for path in _CORPUS:
+        texts = {}
+        for engine in ENGINES:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                result = executor.submit(_run, engine, str(path), args.megabytes, args.repeats).result()
+            texts[engine] = result.pop("text")
+            reports.append({"page": path.name, "engine": engine, **result})
+        baseline = texts["bs4 html.parser"]
+        for report in reports[-len(ENGINES):]:
+            report["same_text"] = texts[report["engine"]] == baseline
+
+    print(f"{'page':>22} | {'engine':>16} | {'MB':>5} | {'MB/s':>6} | {'peak MB':>7} | same text")
+    for report in reports:
+        print(
+            f"{report['page']:>22} | {report['engine']:>16} | {report['mb']:>5.1f} | "
+            f"{report['mb'] / report['seconds']:>6.1f} | {report['peak_mb']:>7.0f} | {report['same_text']}"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Image generation calls and latency when users retry and regenerate, with and without the image result cache:
+the stub's `dall-e-3` takes `--image-delay` seconds per image, requests per phase go through the agent and
+`dall-e-3` requests are counted from stub stats. Phases:
+- burst: `--requests` identical requests at once (client retries, double clicks);
+- regenerate: the same request again, one after another;
+- variant: the same prompt with extra whitespace and the default size set explicitly;
+- other user: the same request with another API key, which must not reuse the first user's image.
+
+Usage:
+    python -m benchmarks.image_dedup [--requests 8] [--image-delay 5] [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from benchmarks.load_test import (
+    _COMPLETIONS_PATH, _DEFAULT_SCENARIOS, _free_port, _percentile, _send, _start, _wait_for_port,
+)
+
+
+def _phases(scenario: dict[str, Any], requests: int) -> list[tuple[str, list[dict[str, Any]], str, bool]]:
+    """Name, scenarios, API key and whether they are sent at once."""
+    arguments = scenario["tool_call"]["arguments"]
+    variant = {**scenario, "tool_call": {**scenario["tool_call"], "arguments": {
+        **arguments, "prompt": f"  {arguments['prompt']}  ".replace(" ", "  "), "size": "1024x1024",
+    }}}
+    return [
+        ("burst", [scenario] * requests, "user-a", True),
+        ("regenerate", [scenario] * requests, "user-a", False),
+        ("variant", [variant], "user-a", False),
+        ("other user", [scenario], "user-b", False),
+    ]
+
+
+async def _measure(name: str, agent_env: dict[str, str], args: argparse.Namespace) -> list[dict[str, Any]]:
+    scenario = next(
+        json.loads(line) for line in Path(_DEFAULT_SCENARIOS).read_text(encoding="utf-8").splitlines()
+        if line.strip() and json.loads(line)["scenario"] == "image_generation"
+    )
+    dial_port, ddg_port, interpreter_port, agent_port = (_free_port() for _ in range(4))
+    processes = [
+        _start("benchmarks.stubs.dial_stub", "--port", str(dial_port), "--image-delay", str(args.image_delay)),
+        _start("benchmarks.stubs.mcp_stub", "--kind", "ddg", "--port", str(ddg_port)),
+        _start("benchmarks.stubs.mcp_stub", "--kind", "interpreter", "--port", str(interpreter_port)),
+    ]
+    stats_url = f"http://127.0.0.1:{dial_port}/stub/stats"
+    try:
+        for process, port in zip(processes, (dial_port, ddg_port, interpreter_port)):
+            await _wait_for_port(port, process)
+        agent = _start("benchmarks.agent_runner", "--port", str(agent_port), env={
+            "DIAL_ENDPOINT": f"http://127.0.0.1:{dial_port}",
+            "DDG_MCP_URL": f"http://127.0.0.1:{ddg_port}/mcp",
+            "PY_INTERPRETER_MCP_URL": f"http://127.0.0.1:{interpreter_port}/mcp",
+            "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+            # the benchmark's API keys stand for users, DIAL Core would send a new key per request
+            "USER_ID_HEADER": "api-key",
+            **agent_env,
+        })
+        processes.append(agent)
+        await _wait_for_port(agent_port, agent)
+
+        url = f"http://127.0.0.1:{agent_port}{_COMPLETIONS_PATH}"
+        reports = []
+        async with httpx.AsyncClient(timeout=300) as client:
+            # tools (embedding model, MCP sessions) are created on the first request
+            warmup = await _send(client, url, {"message": "warm up"})
+            if warmup["error"]:
+                raise RuntimeError(f"Warm-up request failed: {warmup['error']}")
+            for phase, scenarios, api_key, concurrent in _phases(scenario, args.requests):
+                before = (await client.get(stats_url)).json()["requests"].get("dall-e-3", 0)
+                if concurrent:
+                    results = await asyncio.gather(*(_send(client, url, s, api_key) for s in scenarios))
+                else:
+                    results = [await _send(client, url, s, api_key) for s in scenarios]
+                after = (await client.get(stats_url)).json()["requests"].get("dall-e-3", 0)
+                latencies = [r["latency"] for r in results if not r["error"]]
+                reports.append({
+                    "setting": name,
+                    "phase": phase,
+                    "requests": len(results),
+                    "errors": sum(bool(r["error"]) for r in results),
+                    "image_calls": after - before,
+                    "latency_p50_ms": (_percentile(latencies, 0.5) or 0) * 1000,
+                })
+        return reports
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except Exception:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=8, help="Requests of burst and regenerate phases")
+    parser.add_argument("--image-delay", type=float, default=5.0, help="Seconds the stub takes per image")
+    parser.add_argument("--json", help="Write reports to this file")
+    args = parser.parse_args()
+
+    settings = [
+        ("in-flight only", {"IMAGE_CACHE_TTL_SECONDS": "0"}),
+        ("cached", {"IMAGE_CACHE_TTL_SECONDS": "3600"}),
+    ]
+    reports = []
+    for name, env in settings:
+        reports.extend(asyncio.run(_measure(name, env, args)))
+    print(f"{'setting':>14} | {'phase':>10} | {'req':>4} | {'err':>4} | {'image calls':>11} | {'p50 ms':>7}")
+    for report in reports:
+        print(
+            f"{report['setting']:>14} | {report['phase']:>10} | {report['requests']:>4} | {report['errors']:>4} | "
+            f"{report['image_calls']:>11} | {report['latency_p50_ms']:>7.0f}"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
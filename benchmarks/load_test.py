@@ -0,0 +1,354 @@
+"""
+End-to-end load test: starts the agent against local stub DIAL Core and MCP servers and replays scenarios
+at configurable concurrency. Reports throughput, latency percentiles, event loop lag and RSS per scenario.
+
+Usage:
+    python -m benchmarks.load_test [--scenarios benchmarks/scenarios.jsonl] [--only rag,chat]
+        [--requests 40] [--concurrency 8] [--workers 1] [--token-delay 0.01] [--mcp-delay 0.2]
+        [--json results.json]
+
+Every scenario line is a JSON object with `scenario`, `message` and optional `attachments` and `tool_call`
+(the tool call the stub model makes before answering).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Optional
+
+import httpx
+
+from benchmarks.stubs.dial_stub import STUB_TOOL_CALL_PREFIX
+
+_ROOT = Path(__file__).parent.parent
+_DEFAULT_SCENARIOS = Path(__file__).parent / "scenarios.jsonl"
+_COMPLETIONS_PATH = "/openai/deployments/general-purpose-agent/chat/completions"
+_LAG_METRIC = "agent_event_loop_lag_seconds"
+_TOKENS_METRIC = "agent_llm_tokens_total"
+_METRIC_LINE = re.compile(r'^(?P<name>[a-zA-Z_:][\w:]*)(?:\{(?P<labels>[^}]*)\})? (?P<value>\S+)$')
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_for_port(port: int, process: subprocess.Popen, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process {process.args} exited with code {process.returncode}")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"Port {port} is not ready after {timeout}s")
+
+
+def _percentile(values: list[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def _process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    for task_dir in Path(f"/proc/{pid}/task").glob("*"):
+        try:
+            children = (task_dir / "children").read_text().split()
+        except OSError:
+            continue
+        for child in children:
+            pids.extend(_process_tree(int(child)))
+    return pids
+
+
+def _read_memory_kb(pid: int) -> dict[str, Optional[int]]:
+    """
+    Current (VmRSS), peak (VmHWM) and proportional (Pss) resident memory summed over the process and its
+    children (workers, embedding service, PDF pool), Linux only. Pss splits shared pages between processes,
+    so unlike RSS it doesn't count shared model memory several times.
+    """
+    fields = {"VmRSS:": "rss_kb", "VmHWM:": "peak_rss_kb", "Pss:": "pss_kb"}
+    result: dict[str, Optional[int]] = {key: None for key in fields.values()}
+    for process_id in _process_tree(pid):
+        for path in (f"/proc/{process_id}/status", f"/proc/{process_id}/smaps_rollup"):
+            try:
+                lines = Path(path).read_text().splitlines()
+            except OSError:
+                continue
+            for line in lines:
+                name, *values = line.split()
+                if name in fields and values:
+                    key = fields[name]
+                    result[key] = (result[key] or 0) + int(values[0])
+    return result
+
+
+def _cpu_seconds(pid: int) -> float:
+    """User and system CPU time of the process and its children, Linux only."""
+    total_ticks = 0
+    for process_id in _process_tree(pid):
+        try:
+            # fields after the command name, which may contain spaces; utime and stime are 14th and 15th
+            fields = Path(f"/proc/{process_id}/stat").read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        total_ticks += int(fields[11]) + int(fields[12])
+    return total_ticks / os.sysconf("SC_CLK_TCK")
+
+
+def _parse_histogram(metrics_text: str, name: str) -> tuple[dict[float, float], float, float]:
+    buckets: dict[float, float] = {}
+    total_sum = total_count = 0.0
+    for line in metrics_text.splitlines():
+        match = _METRIC_LINE.match(line)
+        if not match:
+            continue
+        metric, labels, value = match.group("name"), match.group("labels") or "", float(match.group("value"))
+        if metric == f"{name}_bucket":
+            le = re.search(r'le="([^"]+)"', labels).group(1)
+            buckets[math.inf if le == "+Inf" else float(le)] = value
+        elif metric == f"{name}_sum":
+            total_sum = value
+        elif metric == f"{name}_count":
+            total_count = value
+    return buckets, total_sum, total_count
+
+
+def _counter_total(metrics_text: str, name: str, label_filter: str = "") -> float:
+    total = 0.0
+    for line in metrics_text.splitlines():
+        match = _METRIC_LINE.match(line)
+        if match and match.group("name") == name and label_filter in (match.group("labels") or ""):
+            total += float(match.group("value"))
+    return total
+
+
+def _tokens_per_request(before: str, after: str, requests: int) -> dict[str, float]:
+    """LLM tokens of the agent loop and nested tool calls (e.g. RAG answer generation) per request."""
+    return {
+        f"{token_type}_tokens_per_request": (
+            _counter_total(after, _TOKENS_METRIC, f'type="{token_type}"')
+            - _counter_total(before, _TOKENS_METRIC, f'type="{token_type}"')
+        ) / max(requests, 1)
+        for token_type in ("prompt", "completion")
+    }
+
+
+def _lag_stats(before: str, after: str) -> dict[str, Optional[float]]:
+    """Loop lag between two scrapes: mean and p99 upper bound estimated from histogram bucket deltas."""
+    buckets_before, sum_before, count_before = _parse_histogram(before, _LAG_METRIC)
+    buckets_after, sum_after, count_after = _parse_histogram(after, _LAG_METRIC)
+    count = count_after - count_before
+    if count <= 0:
+        return {"loop_lag_mean_ms": None, "loop_lag_p99_ms": None}
+    p99 = None
+    for bound in sorted(buckets_after):
+        if buckets_after[bound] - buckets_before.get(bound, 0.0) >= 0.99 * count:
+            p99 = bound
+            break
+    return {
+        "loop_lag_mean_ms": (sum_after - sum_before) / count * 1000,
+        "loop_lag_p99_ms": p99 * 1000 if p99 is not None and not math.isinf(p99) else p99,
+    }
+
+
+def _build_request(scenario: dict[str, Any]) -> dict[str, Any]:
+    content = scenario["message"]
+    if tool_call := scenario.get("tool_call"):
+        content += f"\n{STUB_TOOL_CALL_PREFIX}{json.dumps(tool_call)}"
+    message: dict[str, Any] = {"role": "user", "content": content}
+    if attachments := scenario.get("attachments"):
+        message["custom_content"] = {"attachments": attachments}
+    return {"messages": [message], "stream": True}
+
+
+async def _send(
+        client: httpx.AsyncClient, url: str, scenario: dict[str, Any], api_key: str = "stub"
+) -> dict[str, Any]:
+    started = time.perf_counter()
+    ttfb = None
+    error = None
+    events = 0
+    headers = {"Api-Key": api_key, "x-conversation-id": uuid.uuid4().hex}
+    try:
+        async with client.stream("POST", url, json=_build_request(scenario), headers=headers) as response:
+            if response.status_code != 200:
+                error = f"HTTP {response.status_code}"
+            async for line in response.aiter_lines():
+                if ttfb is None and line.startswith("data:"):
+                    ttfb = time.perf_counter() - started
+                if line.startswith("data:") and line[5:].strip() != "[DONE]":
+                    events += 1
+                if line.startswith("data:") and '"error"' in line:
+                    error = line[5:].strip()[:200]
+    except httpx.HTTPError as e:
+        error = f"{type(e).__name__}: {e}"
+    return {"latency": time.perf_counter() - started, "ttfb": ttfb, "error": error, "events": events}
+
+
+async def _run_scenario(
+        client: httpx.AsyncClient,
+        base_url: str,
+        scenarios: list[dict[str, Any]],
+        requests: int,
+        concurrency: int,
+) -> tuple[list[dict[str, Any]], float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> dict[str, Any]:
+        async with semaphore:
+            return await _send(client, base_url + _COMPLETIONS_PATH, scenarios[i % len(scenarios)])
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(requests)))
+    return results, time.perf_counter() - started
+
+
+def _start(module: str, *args: str, env: Optional[dict[str, str]] = None) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", module, *args],
+        cwd=_ROOT,
+        env={**os.environ, **(env or {})},
+    )
+
+
+async def main_async(args: argparse.Namespace) -> list[dict[str, Any]]:
+    scenarios_by_name: dict[str, list[dict[str, Any]]] = defaultdict(list)
+    for line in Path(args.scenarios).read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            scenario = json.loads(line)
+            scenarios_by_name[scenario["scenario"]].append(scenario)
+    names = args.only.split(",") if args.only else list(scenarios_by_name)
+
+    dial_port, ddg_port, interpreter_port, agent_port = (_free_port() for _ in range(4))
+    processes = [
+        _start("benchmarks.stubs.dial_stub", "--port", str(dial_port), "--token-delay", str(args.token_delay),
+               "--answer-tokens", str(args.answer_tokens)),
+        _start("benchmarks.stubs.mcp_stub", "--kind", "ddg", "--port", str(ddg_port),
+               "--delay", str(args.mcp_delay)),
+        _start("benchmarks.stubs.mcp_stub", "--kind", "interpreter", "--port", str(interpreter_port),
+               "--delay", str(args.mcp_delay)),
+    ]
+    try:
+        for process, port in zip(processes, (dial_port, ddg_port, interpreter_port)):
+            await _wait_for_port(port, process)
+        agent = _start("benchmarks.agent_runner", "--port", str(agent_port), "--workers", str(args.workers), env={
+            "DIAL_ENDPOINT": f"http://127.0.0.1:{dial_port}",
+            "DDG_MCP_URL": f"http://127.0.0.1:{ddg_port}/mcp",
+            "PY_INTERPRETER_MCP_URL": f"http://127.0.0.1:{interpreter_port}/mcp",
+            "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+        })
+        processes.append(agent)
+        await _wait_for_port(agent_port, agent)
+
+        base_url = f"http://127.0.0.1:{agent_port}"
+        reports = []
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            # tools (embedding model, MCP sessions) are created on first request of every worker
+            warmups = await asyncio.gather(*(
+                _send(client, base_url + _COMPLETIONS_PATH, {"message": "warm up"}) for _ in range(args.workers * 2)
+            ))
+            if errors := [warmup["error"] for warmup in warmups if warmup["error"]]:
+                raise RuntimeError(f"Warm-up request failed: {errors[0]}")
+
+            for name in names:
+                metrics_before = (await client.get(base_url + "/metrics")).text
+                cpu_before = _cpu_seconds(agent.pid)
+                results, elapsed = await _run_scenario(
+                    client, base_url, scenarios_by_name[name], args.requests, args.concurrency
+                )
+                cpu_seconds = _cpu_seconds(agent.pid) - cpu_before
+                metrics_after = (await client.get(base_url + "/metrics")).text
+                latencies = [r["latency"] for r in results if not r["error"]]
+                ttfbs = [r["ttfb"] for r in results if not r["error"] and r["ttfb"] is not None]
+                errors = [r["error"] for r in results if r["error"]]
+                report = {
+                    "scenario": name,
+                    "requests": len(results),
+                    "errors": len(errors),
+                    "concurrency": args.concurrency,
+                    "workers": args.workers,
+                    "throughput_rps": len(results) / elapsed,
+                    "latency_p50_ms": (_percentile(latencies, 0.5) or 0) * 1000,
+                    "latency_p95_ms": (_percentile(latencies, 0.95) or 0) * 1000,
+                    "latency_p99_ms": (_percentile(latencies, 0.99) or 0) * 1000,
+                    "ttfb_p50_ms": (_percentile(ttfbs, 0.5) or 0) * 1000,
+                    "events_per_request": sum(r["events"] for r in results) / len(results),
+                    "cpu_ms_per_request": cpu_seconds / len(results) * 1000,
+                    **_tokens_per_request(metrics_before, metrics_after, len(results)),
+                    **_lag_stats(metrics_before, metrics_after),
+                    **_read_memory_kb(agent.pid),
+                }
+                if errors:
+                    report["first_error"] = errors[0]
+                reports.append(report)
+        return reports
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def _print_reports(reports: list[dict[str, Any]]) -> None:
+    def fmt(value: Any) -> str:
+        if value is None:
+            return "-"
+        return f"{value:.1f}" if isinstance(value, float) else str(value)
+
+    columns = [
+        ("scenario", "scenario"), ("requests", "req"), ("errors", "err"), ("throughput_rps", "rps"),
+        ("latency_p50_ms", "p50 ms"), ("latency_p95_ms", "p95 ms"), ("latency_p99_ms", "p99 ms"),
+        ("ttfb_p50_ms", "ttfb p50"), ("events_per_request", "events/req"), ("cpu_ms_per_request", "cpu ms/req"),
+        ("prompt_tokens_per_request", "prompt tok"),
+        ("completion_tokens_per_request", "compl tok"), ("loop_lag_mean_ms", "lag avg ms"), ("loop_lag_p99_ms", "lag p99 ms"),
+        ("rss_kb", "RSS KB"), ("pss_kb", "PSS KB"), ("peak_rss_kb", "peak RSS KB"),
+    ]
+    print(" | ".join(f"{title:>12}" for _, title in columns))
+    for report in reports:
+        print(" | ".join(f"{fmt(report.get(key)):>12}" for key, _ in columns))
+        if report.get("first_error"):
+            print(f"    first error: {report['first_error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=str(_DEFAULT_SCENARIOS))
+    parser.add_argument("--only", help="Comma-separated scenario names")
+    parser.add_argument("--requests", type=int, default=40, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Delay between stub LLM tokens, seconds")
+    parser.add_argument("--answer-tokens", type=int, default=60, help="Length of stub LLM answers, tokens")
+    parser.add_argument("--mcp-delay", type=float, default=0.2, help="Latency of stub MCP tools, seconds")
+    parser.add_argument("--workers", type=int, default=1, help="Agent server processes")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--json", help="Write reports to this file")
+    args = parser.parse_args()
+
+    reports = asyncio.run(main_async(args))
+    _print_reports(reports)
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
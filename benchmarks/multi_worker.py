@@ -0,0 +1,51 @@
+"""
+Throughput per GB of RAM for single and multi-worker agent deployments: runs the load test for every worker
+count and relates requests per second to proportional memory (PSS) of the whole process tree, in which
+the shared embedding service is counted once.
+
+Usage:
+    python -m benchmarks.multi_worker [--workers 1,2,4] [--only chat,rag] [--requests 80] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import json
+from pathlib import Path
+
+from benchmarks.load_test import _DEFAULT_SCENARIOS, main_async
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+    parser.add_argument("--scenarios", default=str(_DEFAULT_SCENARIOS))
+    parser.add_argument("--only", default="chat,rag")
+    parser.add_argument("--requests", type=int, default=80)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--mcp-delay", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--json", help="Write reports to this file")
+    args = parser.parse_args()
+
+    reports = []
+    for workers in (int(value) for value in args.workers.split(",")):
+        for report in asyncio.run(main_async(argparse.Namespace(**{**vars(args), "workers": workers}))):
+            memory_gb = (report["pss_kb"] or report["rss_kb"] or 0) / 1024 / 1024
+            report["memory_gb"] = memory_gb
+            report["rps_per_gb"] = report["throughput_rps"] / memory_gb if memory_gb else None
+            reports.append(report)
+
+    print(f"{'scenario':>16} | {'workers':>7} | {'rps':>8} | {'p95 ms':>8} | {'PSS GB':>7} | {'rps/GB':>8}")
+    for report in reports:
+        rps_per_gb = f"{report['rps_per_gb']:.1f}" if report["rps_per_gb"] else "-"
+        print(
+            f"{report['scenario']:>16} | {report['workers']:>7} | {report['throughput_rps']:>8.1f} | "
+            f"{report['latency_p95_ms']:>8.1f} | {report['memory_gb']:>7.2f} | {rps_per_gb:>8}"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Measures PDF text extraction throughput (pages per second) against number of worker processes.
+
+Usage:
+    python -m benchmarks.pdf_extraction [path/to/file.pdf] [--pages 400] [--repeats 3]
+
+Without a path a synthetic text-only PDF is generated from tests/microwave_manual.txt.
+"""
+import argparse
+import io
+import os
+import time
+from pathlib import Path
+
+import pdfplumber
+
+from task.utils.pdf_extractor import PdfTextExtractor
+
+_MANUAL_PATH = Path(__file__).parent.parent / "tests" / "microwave_manual.txt"
+
+
+def _escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(pages: int, lines_per_page: int = 45) -> bytes:
+    """Builds a minimal multi-page PDF with Helvetica text, no external dependencies needed."""
+    source_lines = [
+        line.encode("latin-1", errors="ignore").decode("latin-1")[:95]
+        for line in _MANUAL_PATH.read_text(encoding="utf-8").splitlines() if line.strip()
+    ]
+    objects: list[bytes] = []
+    page_ids = [4 + i * 2 for i in range(pages)]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {pages} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for page in range(pages):
+        lines = [source_lines[(page * lines_per_page + i) % len(source_lines)] for i in range(lines_per_page)]
+        stream = "BT /F1 10 Tf 40 800 Td 14 TL " + " ".join(f"({_escape(line)}) '" for line in lines) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_ids[page] + 1} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode("latin-1"))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs="?")
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--pages-per-shard", type=int, default=8)
+    args = parser.parse_args()
+
+    pdf_content = Path(args.path).read_bytes() if args.path else build_pdf(args.pages)
+    with pdfplumber.open(io.BytesIO(pdf_content)) as pdf:
+        total_pages = len(pdf.pages)
+
+    cpu_count = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, 8, cpu_count} & set(range(1, cpu_count + 1)))
+    print(f"Pages: {total_pages}, CPUs: {cpu_count}, pages per shard: {args.pages_per_shard}")
+    print(f"{'workers':>8} {'best, s':>10} {'pages/s':>10} {'speedup':>8}")
+
+    baseline = None
+    for workers in worker_counts:
+        extractor = PdfTextExtractor(workers=workers, pages_per_shard=args.pages_per_shard)
+        # warm up the pool, spawning processes is not part of the measurement
+        extractor.extract_text(pdf_content)
+        timings = []
+        for _ in range(args.repeats):
+            started = time.perf_counter()
+            extractor.extract_text(pdf_content)
+            timings.append(time.perf_counter() - started)
+        best = min(timings)
+        baseline = baseline or best
+        print(f"{workers:>8} {best:>10.3f} {total_pages / best:>10.1f} {baseline / best:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
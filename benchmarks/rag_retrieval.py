@@ -0,0 +1,71 @@
+"""
+Retrieval quality of RagTool configurations on tests/microwave_manual.txt and `benchmarks/rag_queries.jsonl`:
+hit rate (the expected passage is among retrieved chunks) and the number of misses, every miss is a question
+the model would have to search for again with another `rag_search` call.
+
+Usage:
+    python -m benchmarks.rag_retrieval [--k 3] [--backend torch]
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from benchmarks.embedding_backends import manual_chunks
+from task.tools.rag.embedding_service import EMBEDDING_MODEL_NAME, load_sentence_transformer
+from task.tools.rag.retrieval import HybridIndex, HybridRetriever
+
+_QUERIES_PATH = Path(__file__).parent / "rag_queries.jsonl"
+
+CONFIGURATIONS = {
+    "vector": dict(bm25_weight=0.0, mmr_lambda=1.0),
+    "vector+mmr": dict(bm25_weight=0.0),
+    "hybrid": dict(mmr_lambda=1.0),
+    "hybrid+mmr": dict(),
+}
+
+
+def evaluate(chunks: list[str], queries: list[dict], encode, k: int) -> list[dict]:
+    index = HybridIndex.build(encode(chunks), chunks)
+    query_embeddings = encode([query["query"] for query in queries])
+    reports = []
+    for name, settings in CONFIGURATIONS.items():
+        retriever = HybridRetriever(top_k=k, **settings)
+        hits = 0
+        started = time.perf_counter()
+        for query, query_embedding in zip(queries, query_embeddings):
+            retrieved = [chunks[chunk_id] for chunk_id in retriever.search(index, query_embedding, query["query"])]
+            hits += any(query["expected"] in chunk for chunk in retrieved)
+        reports.append({
+            "configuration": name,
+            "hit_rate": hits / len(queries),
+            "repeat_searches": len(queries) - hits,
+            "search_ms": (time.perf_counter() - started) / len(queries) * 1000,
+        })
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--backend", default="torch")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--json", help="Write reports to this file")
+    args = parser.parse_args()
+
+    queries = [json.loads(line) for line in _QUERIES_PATH.read_text().splitlines() if line.strip()]
+    model = load_sentence_transformer(args.model, args.backend)
+    reports = evaluate(manual_chunks(model_name=args.model), queries, model.encode, args.k)
+
+    print(f"{'configuration':>14} | {'hit@' + str(args.k):>6} | {'repeat searches':>15} | {'search ms':>9}")
+    for report in reports:
+        print(
+            f"{report['configuration']:>14} | {report['hit_rate']:>6.2f} | "
+            f"{report['repeat_searches']:>15} | {report['search_ms']:>9.2f}"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Size of the request the client sends back after `--turns` turns with tool calls, and time the agent spends on the
+tool call history of it: parsing request messages, restoring compacted history (`StateCompactor.expand`) and
+`unpack_messages`. Each turn's state holds `--calls` tool results: file pages of tests/microwave_manual.txt and
+interpreter JSON of tests/report.csv, `--result-chars` each. Runs in process with the local tool result store,
+DIAL file store adds a download per result not yet cached by the agent process.
+
+Usage:
+    python -m benchmarks.state_compaction [--turns 20] [--calls 2] [--result-chars 12000] [--repeats 20]
+"""
+import argparse
+import asyncio
+import csv
+import json
+import time
+from pathlib import Path
+from typing import Optional
+
+from aidial_sdk.chat_completion import Message
+
+from benchmarks.embedding_backends import _MANUAL_PATH
+from task.utils.constants import TOOL_CALL_HISTORY_KEY
+from task.utils.history import unpack_messages
+from task.utils.state_compaction import StateCompactor, ToolResultStore
+
+_REPORT_PATH = Path(__file__).parent.parent / "tests" / "report.csv"
+
+
+def _tool_results(count: int, chars: int) -> list[str]:
+    """Distinct file pages and interpreter outputs, like a conversation reading through documents."""
+    manual = _MANUAL_PATH.read_text(encoding="utf-8")
+    with _REPORT_PATH.open(encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    results = []
+    for i in range(count):
+        if i % 2 == 0:
+            start = (i * chars // 3) % max(1, len(manual) - chars)
+            results.append((manual * 2)[start:start + chars])
+        else:
+            output = {"success": True, "session_id": i, "output": []}
+            while len(json.dumps(output)) < chars:
+                output["output"].append({**rows[len(output["output"]) % len(rows)], "run": i})
+            results.append(json.dumps(output)[:chars])
+    return results
+
+
+async def _conversation(
+        compactor: Optional[StateCompactor], turns: int, calls: int, chars: int
+) -> list[dict]:
+    results = iter(_tool_results(turns * calls, chars))
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"Question {turn} about the documents"})
+        tool_calls = [{
+            "id": f"call_{turn}_{i}",
+            "type": "function",
+            "function": {"name": "file_content_extraction", "arguments": json.dumps({"page": turn * calls + i})},
+        } for i in range(calls)]
+        history = [{"role": "assistant", "tool_calls": tool_calls}]
+        history.extend({"role": "tool", "tool_call_id": call["id"], "content": next(results)} for call in tool_calls)
+        state = {TOOL_CALL_HISTORY_KEY: history}
+        if compactor:
+            state = await compactor.compact(state, "stub")
+        messages.append({"role": "assistant", "content": f"Answer {turn}", "custom_content": {"state": state}})
+    messages.append({"role": "user", "content": "One more question"})
+    return messages
+
+
+async def _measure(name: str, compactor: Optional[StateCompactor], args: argparse.Namespace) -> dict:
+    body = json.dumps({"messages": await _conversation(compactor, args.turns, args.calls, args.result_chars)})
+    parse_seconds = expand_seconds = unpack_seconds = 0.0
+    prompt = None
+    for _ in range(args.repeats):
+        started = time.perf_counter()
+        messages = [Message.parse_obj(message) for message in json.loads(body)["messages"]]
+        parsed = time.perf_counter()
+        if compactor:
+            await compactor.expand(messages, "stub")
+        expanded = time.perf_counter()
+        prompt = unpack_messages(messages, [])
+        unpack_seconds += time.perf_counter() - expanded
+        expand_seconds += expanded - parsed
+        parse_seconds += parsed - started
+    return {
+        "mode": name,
+        "request_bytes": len(body),
+        "parse_ms": parse_seconds / args.repeats * 1000,
+        "expand_ms": expand_seconds / args.repeats * 1000,
+        "unpack_ms": unpack_seconds / args.repeats * 1000,
+        "prompt": prompt,
+    }
+
+
+async def main_async(args: argparse.Namespace) -> list[dict]:
+    modes = {
+        "inline": None,
+        "compressed": StateCompactor(None, compress=True),
+        "by reference": StateCompactor(ToolResultStore(), min_chars=args.min_chars, compress=False),
+        "by ref + compressed": StateCompactor(ToolResultStore(), min_chars=args.min_chars, compress=True),
+    }
+    reports = [await _measure(name, compactor, args) for name, compactor in modes.items()]
+    # the model must get the same prompt whatever the state looks like, or upstream prompt caching breaks
+    inline_prompt = reports[0]["prompt"]
+    for report in reports:
+        report["same_prompt"] = report.pop("prompt") == inline_prompt
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20, help="Assistant turns with tool calls in the request")
+    parser.add_argument("--calls", type=int, default=2, help="Tool calls per turn")
+    parser.add_argument("--result-chars", type=int, default=12_000, help="Length of each tool result")
+    parser.add_argument("--min-chars", type=int, default=2000, help="Tool results stored by reference from")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--json", help="Write reports to this file")
+    args = parser.parse_args()
+
+    reports = asyncio.run(main_async(args))
+    print(f"{'mode':>20} | {'request KB':>10} | {'parse ms':>8} | {'expand ms':>9} | {'unpack ms':>9} | same prompt")
+    for report in reports:
+        print(
+            f"{report['mode']:>20} | {report['request_bytes'] / 1024:>10.1f} | {report['parse_ms']:>8.2f} | "
+            f"{report['expand_ms']:>9.2f} | {report['unpack_ms']:>9.2f} | {report['same_prompt']}"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
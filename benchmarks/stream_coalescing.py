@@ -0,0 +1,92 @@
+"""
+CPU cost of streaming an answer to the client with and without `BufferedWriter`, in process and without upstream:
+a DIAL app streams `--tokens` pieces with `--token-delay` between them, the client reads the SSE stream.
+Reports SSE events, CPU time (server and client) and latency per request. ASGI transport delivers the response
+at once, so time to first token is measured by `benchmarks/load_test.py` against a real server.
+
+Usage:
+    python -m benchmarks.stream_coalescing [--tokens 1000] [--requests 20] [--token-delay 0.001]
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import httpx
+from aidial_sdk import DIALApp
+from aidial_sdk.chat_completion import ChatCompletion, Request, Response
+
+from task.utils.stream_writer import StreamBufferConfig, StreamBufferSettings
+
+SETTINGS = {
+    "no coalescing": StreamBufferSettings(flush_interval=0),
+    "20 ms / 1 KB": StreamBufferSettings(),
+    "50 ms / 4 KB": StreamBufferSettings(flush_interval=0.05, flush_bytes=4096),
+}
+
+
+class _StreamingApplication(ChatCompletion):
+
+    def __init__(self, settings: StreamBufferSettings, tokens: int, token_delay: float):
+        self.buffers = StreamBufferConfig(settings)
+        self.tokens = tokens
+        self.token_delay = token_delay
+
+    async def chat_completion(self, request: Request, response: Response) -> None:
+        with response.create_single_choice() as choice:
+            writer = self.buffers.wrap(choice)
+            for i in range(self.tokens):
+                writer.append_content(f"token{i} ")
+                await asyncio.sleep(self.token_delay)
+            writer.flush()
+
+
+async def _measure(name: str, settings: StreamBufferSettings, args: argparse.Namespace) -> dict:
+    app = DIALApp()
+    app.add_chat_completion("stream", _StreamingApplication(settings, args.tokens, args.token_delay))
+    transport = httpx.ASGITransport(app=app)
+    body = {"messages": [{"role": "user", "content": "hi"}], "stream": True}
+    events = 0
+    latency_seconds = 0.0
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=300) as client:
+        cpu_started = time.process_time()
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            async with client.stream(
+                    "POST", "/openai/deployments/stream/chat/completions", json=body, headers={"Api-Key": "stub"}
+            ) as response:
+                async for line in response.aiter_lines():
+                    if line.startswith("data:") and line[5:].strip() != "[DONE]":
+                        events += 1
+            latency_seconds += time.perf_counter() - started
+        cpu_seconds = time.process_time() - cpu_started
+    return {
+        "settings": name,
+        "events_per_request": events / args.requests,
+        "cpu_ms_per_request": cpu_seconds / args.requests * 1000,
+        "latency_ms": latency_seconds / args.requests * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--token-delay", type=float, default=0.001)
+    parser.add_argument("--json", help="Write reports to this file")
+    args = parser.parse_args()
+
+    reports = [asyncio.run(_measure(name, settings, args)) for name, settings in SETTINGS.items()]
+    print(f"{'settings':>14} | {'events/req':>10} | {'cpu ms/req':>10} | {'latency ms':>10}")
+    for report in reports:
+        print(
+            f"{report['settings']:>14} | {report['events_per_request']:>10.1f} | "
+            f"{report['cpu_ms_per_request']:>10.1f} | {report['latency_ms']:>10.1f}"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
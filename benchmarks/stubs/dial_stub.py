@@ -0,0 +1,197 @@
+"""
+Local stand-in for DIAL Core: scripted streaming chat completions, file storage and bucket endpoints.
+
+Completion script:
+- the last user message may contain a line `STUB_TOOL_CALL: {"name": ..., "arguments": {...}}`,
+  then the first agent iteration streams this tool call, and once the tool result is in the history
+  the final answer is streamed;
+- RAG augmentation calls and any other calls get a plain streamed answer;
+- `dall-e-3` streams an image attachment.
+
+Uploaded files are kept in memory and downloaded by their URL, other downloads are served from `tests/`.
+`GET /stub/stats` reports completion streams in progress, finished and dropped by the client before the end,
+and requests by deployment. `--spikes '{"gpt-4o": [0.05, 3.0]}'` delays the first chunk of 5% of gpt-4o
+completions by 3 seconds, to emulate upstream latency spikes. `--image-delay` is how long an image takes.
+
+Usage:
+    python -m benchmarks.stubs.dial_stub --port 8090 [--token-delay 0.01] [--answer-tokens 60] [--spikes '{}']
+        [--image-delay 0.5]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+FILES_DIR = Path(__file__).parent.parent.parent / "tests"
+STUB_TOOL_CALL_PREFIX = "STUB_TOOL_CALL:"
+BUCKET = "stub-bucket"
+
+
+def _chunk(delta: dict, finish_reason: str | None = None, usage: dict | None = None) -> str:
+    body = {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": "stub",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage:
+        body["usage"] = usage
+    return f"data: {json.dumps(body)}\n\n"
+
+
+def _prompt_tokens(body: dict) -> int:
+    return len(json.dumps(body.get("messages", []))) // 4 + len(json.dumps(body.get("tools", []))) // 4
+
+
+def _find_tool_call(messages: list[dict]) -> dict | None:
+    if not messages or messages[-1].get("role") != "user":
+        return None
+    content = messages[-1].get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    for line in content.splitlines():
+        if line.startswith(STUB_TOOL_CALL_PREFIX):
+            return json.loads(line[len(STUB_TOOL_CALL_PREFIX):])
+    return None
+
+
+def create_app(
+        token_delay: float,
+        answer_tokens: int,
+        spikes: dict[str, tuple[float, float]] | None = None,
+        image_delay: float | None = None,
+) -> FastAPI:
+    """
+    :param spikes: probability and seconds of first chunk delay by deployment
+    :param image_delay: seconds before the image attachment, 50 token delays if None
+    """
+    app = FastAPI()
+    words = ("The stub model streams this answer token by token to emulate an upstream LLM. " * 20).split()
+    stats = {"active_streams": 0, "completed_streams": 0, "cancelled_streams": 0, "requests": {}}
+    uploads: dict[str, bytes] = {}
+
+    async def tracked(stream, deployment: str):
+        stats["active_streams"] += 1
+        stats["requests"][deployment] = stats["requests"].get(deployment, 0) + 1
+        completed = False
+        try:
+            probability, delay = (spikes or {}).get(deployment, (0, 0))
+            if random.random() < probability:
+                await asyncio.sleep(delay)
+            async for chunk in stream:
+                yield chunk
+            completed = True
+        finally:
+            stats["active_streams"] -= 1
+            stats["completed_streams" if completed else "cancelled_streams"] += 1
+
+    async def stream_answer(body: dict):
+        yield _chunk({"role": "assistant"})
+        for i in range(answer_tokens):
+            await asyncio.sleep(token_delay)
+            yield _chunk({"content": words[i % len(words)] + " "})
+        usage = {"prompt_tokens": _prompt_tokens(body), "completion_tokens": answer_tokens}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        yield _chunk({}, finish_reason="stop", usage=usage)
+        yield "data: [DONE]\n\n"
+
+    async def stream_tool_call(body: dict, tool_call: dict):
+        yield _chunk({"role": "assistant"})
+        await asyncio.sleep(token_delay)
+        arguments = json.dumps(tool_call.get("arguments", {}))
+        yield _chunk({"tool_calls": [{
+            "index": 0,
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": tool_call["name"], "arguments": ""},
+        }]})
+        # arguments arrive in several deltas like in real streaming
+        for start in range(0, len(arguments), 16):
+            await asyncio.sleep(token_delay)
+            yield _chunk({"tool_calls": [{"index": 0, "function": {"arguments": arguments[start:start + 16]}}]})
+        usage = {"prompt_tokens": _prompt_tokens(body), "completion_tokens": len(arguments) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        yield _chunk({}, finish_reason="tool_calls", usage=usage)
+        yield "data: [DONE]\n\n"
+
+    async def stream_image(body: dict):
+        yield _chunk({"role": "assistant"})
+        await asyncio.sleep(image_delay if image_delay is not None else token_delay * 50)
+        yield _chunk({"custom_content": {"attachments": [{
+            "type": "image/png",
+            "title": "Generated image",
+            "url": f"files/{BUCKET}/images/{uuid.uuid4().hex}.png",
+        }]}})
+        yield _chunk({}, finish_reason="stop", usage={"prompt_tokens": 10, "completion_tokens": 0, "total_tokens": 10})
+        yield "data: [DONE]\n\n"
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request):
+        body = await request.json()
+        if deployment == "dall-e-3":
+            stream = stream_image(body)
+        elif tool_call := _find_tool_call(body.get("messages", [])):
+            stream = stream_tool_call(body, tool_call)
+        else:
+            stream = stream_answer(body)
+        return StreamingResponse(tracked(stream, deployment), media_type="text/event-stream")
+
+    @app.get("/stub/stats")
+    async def stub_stats():
+        return stats
+
+    @app.get("/v1/bucket")
+    async def bucket():
+        return {"bucket": BUCKET, "appdata": f"{BUCKET}/appdata/general-purpose-agent"}
+
+    @app.get("/v1/files/{path:path}")
+    async def download(path: str):
+        if path in uploads:
+            return Response(uploads[path], media_type="application/octet-stream")
+        file_path = FILES_DIR / Path(path).name
+        if not file_path.is_file():
+            return JSONResponse({"error": "not found"}, status_code=404)
+        return Response(file_path.read_bytes(), media_type="application/octet-stream")
+
+    @app.put("/v1/files/{path:path}")
+    async def upload(path: str, file: UploadFile, request: Request):
+        content = await file.read()
+        if path in uploads and request.headers.get("if-none-match") == "*":
+            return JSONResponse({"error": "already exists"}, status_code=412)
+        uploads[path] = content
+        return {
+            "name": Path(path).name,
+            "parentPath": str(Path(path).parent),
+            "bucket": BUCKET,
+            "url": f"files/{path}",
+            "nodeType": "ITEM",
+            "resourceType": "FILE",
+            "contentLength": len(content),
+            "contentType": file.content_type,
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--spikes", default="{}", help="JSON of deployment to [probability, seconds]")
+    parser.add_argument("--image-delay", type=float, help="Seconds to generate an image")
+    args = parser.parse_args()
+    app = create_app(args.token_delay, args.answer_tokens, json.loads(args.spikes), args.image_delay)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Local stand-ins for the DuckDuckGo and Python interpreter MCP servers (streamable HTTP, `/mcp` path).
+
+Usage:
+    python -m benchmarks.stubs.mcp_stub --kind ddg --port 8091 [--delay 0.2]
+    python -m benchmarks.stubs.mcp_stub --kind interpreter --port 8092 [--delay 0.2]
+
+`GET /stub/stats` reports tool calls in progress, finished and cancelled by the client.
+"""
+import argparse
+import asyncio
+import json
+import uuid
+
+from mcp.server.fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+
+def _with_stats(server: FastMCP) -> dict[str, int]:
+    stats = {"active_calls": 0, "completed_calls": 0, "cancelled_calls": 0}
+
+    @server.custom_route("/stub/stats", methods=["GET"])
+    async def stub_stats(request: Request) -> JSONResponse:
+        return JSONResponse(stats)
+
+    return stats
+
+
+async def _tool_delay(stats: dict[str, int], delay: float) -> None:
+    stats["active_calls"] += 1
+    try:
+        await asyncio.sleep(delay)
+    except asyncio.CancelledError:
+        stats["cancelled_calls"] += 1
+        raise
+    else:
+        stats["completed_calls"] += 1
+    finally:
+        stats["active_calls"] -= 1
+
+
+def create_ddg_server(port: int, delay: float) -> FastMCP:
+    server = FastMCP("ddg-stub", host="127.0.0.1", port=port, log_level="WARNING")
+    stats = _with_stats(server)
+
+    @server.tool()
+    async def search(query: str, max_results: int = 5) -> str:
+        """Searches the web with DuckDuckGo and returns titles, URLs and snippets."""
+        await _tool_delay(stats, delay)
+        return "\n\n".join(
+            f"{i + 1}. Result about {query}\nURL: https://example.com/{i}\nSnippet: Stub snippet {i} for {query}."
+            for i in range(max_results)
+        )
+
+    @server.tool()
+    async def fetch_content(url: str) -> str:
+        """Fetches and parses content of the web page."""
+        await _tool_delay(stats, delay)
+        return f"Content of {url}\n" + "Stub page paragraph. " * 200
+
+    return server
+
+
+def create_interpreter_server(port: int, delay: float) -> FastMCP:
+    server = FastMCP("interpreter-stub", host="127.0.0.1", port=port, log_level="WARNING")
+    stats = _with_stats(server)
+
+    @server.tool()
+    async def execute_code(code: str, session_id: str | None = None) -> str:
+        """Executes Python code in a stateful Jupyter kernel and returns output."""
+        await _tool_delay(stats, delay)
+        return json.dumps({
+            "success": True,
+            "output": [f"executed {len(code)} chars"],
+            "result": "42",
+            "session_info": {"session_id": session_id or uuid.uuid4().hex},
+        })
+
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--kind", choices=["ddg", "interpreter"], required=True)
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--delay", type=float, default=0.2)
+    args = parser.parse_args()
+    factory = create_ddg_server if args.kind == "ddg" else create_interpreter_server
+    factory(args.port, args.delay).run(transport="streamable-http")
+
+
+if __name__ == "__main__":
+    main()
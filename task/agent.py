@@ -1,6 +1,9 @@
 import asyncio
 import json
-from typing import Any
+import logging
+import time
+from contextlib import aclosing
+from typing import Any, Optional
 
 from aidial_client import AsyncDial
 from aidial_client.types.chat.legacy.chat_completion import CustomContent, ToolCall
@@ -8,9 +11,22 @@ from aidial_sdk.chat_completion import Message, Role, Choice, Request, Response
 
 from task.tools.base import BaseTool
 from task.tools.models import ToolCallParams
-from task.utils.constants import TOOL_CALL_HISTORY_KEY
+from task.tools.registry import ToolRegistry
+from task.tools.selection import ToolSelector, ToolLoaderTool
+from task.utils.accounting import RequestAccounting
+from task.utils.cancellation import count_cancellation
+from task.utils.constants import ACCOUNTING_KEY, TOOL_CALL_HISTORY_KEY
 from task.utils.history import unpack_messages
+from task.utils.identity import user_identity
+from task.utils.llm_router import LLMRouter
+from task.utils.log import log_payload
+from task.utils.prompt_cache import PromptCacheStats, with_cache_breakpoint, get_cached_tokens
 from task.utils.stage import StageProcessor
+from task.utils.state_compaction import StateCompactor
+from task.utils.stream_writer import BufferedWriter, StreamBufferConfig
+from task.utils.telemetry import span, LLM_TTFT, LLM_TOKENS
+
+logger = logging.getLogger(__name__)
 
 
 class GeneralPurposeAgent:
@@ -19,15 +35,59 @@ class GeneralPurposeAgent:
             self,
             endpoint: str,
             system_prompt: str,
-            tools: list[BaseTool],
+            tool_registry: ToolRegistry,
+            tool_names: Optional[list[str]] = None,
+            tool_selector: Optional[ToolSelector] = None,
+            prompt_cache_enabled: bool = True,
+            prompt_cache_stats: Optional[PromptCacheStats] = None,
+            stream_buffers: Optional[StreamBufferConfig] = None,
+            llm_router: Optional[LLMRouter] = None,
+            state_compactor: Optional[StateCompactor] = None,
+            accounting: Optional[RequestAccounting] = None,
+            accounting_stage: bool = False,
     ):
+        """
+        :param tool_names: subset of registry tools available for this request, all tools by default
+        :param tool_selector: if provided and `tool_names` not set, tools are pre-selected from the conversation,
+            the rest can be loaded by the model via `load_tools`
+        :param prompt_cache_enabled: mark stable prompt prefix (system prompt, tools, history) with cache breakpoints
+        :param prompt_cache_stats: aggregates cached prompt tokens and time to first token of LLM calls
+        :param stream_buffers: coalescing of streamed choice and stage content by deployment,
+            20 ms / 1 KB buffers if None
+        :param llm_router: races and falls back between deployments, only `deployment_name` is called if None
+        :param state_compactor: stores large tool results by reference and compresses tool call history in choice
+            state, the state is saved as is if None
+        :param accounting: receives token usage of LLM calls and tool calls of this request, its summary is saved
+            to the state of the final message
+        :param accounting_stage: also show the accounting summary in a stage of the final message
+        """
         self.endpoint = endpoint
         self.system_prompt = system_prompt
-        self.tools = tools
-        self._tools_dict = {tool.name: tool for tool in tools}
+        self.tool_registry = tool_registry
+        self.tool_names = tool_names
+        self.tool_selector = tool_selector
+        self._tool_loader: Optional[ToolLoaderTool] = None
+        self.prompt_cache_enabled = prompt_cache_enabled
+        self.prompt_cache_stats = prompt_cache_stats
+        self.stream_buffers = stream_buffers or StreamBufferConfig()
+        self.llm_router = llm_router
+        self.state_compactor = state_compactor
+        self.accounting = accounting
+        self.accounting_stage = accounting_stage
+        self._iteration = 0
         self.state = {TOOL_CALL_HISTORY_KEY: []}
 
     async def handle_request(self, deployment_name: str, choice: Choice, request: Request, response: Response) -> Message:
+        if not isinstance(choice, BufferedWriter):
+            # first iteration: the buffered writer is passed to next iterations and tools, flushed when all are done
+            if self.state_compactor:
+                await self.state_compactor.expand(request.messages, request.api_key)
+            writer = self.stream_buffers.wrap(choice, deployment_name)
+            try:
+                return await self.handle_request(deployment_name, writer, request, response)
+            finally:
+                writer.flush()
+
         client = AsyncDial(
             base_url=self.endpoint,
             api_key=request.api_key,
@@ -35,33 +95,66 @@ class GeneralPurposeAgent:
 
         messages = self._prepare_messages(request.messages)
 
-        chunks = await client.chat.completions.create(
-            messages=messages,
-            tools=[tool.schema for tool in self.tools],
-            deployment_name=deployment_name,
-            stream=True,
-            api_version="2025-01-01-preview"
-        )
+        if self.tool_names is None and self.tool_selector:
+            self.tool_names = await self.tool_selector.select(request.messages)
+            self._tool_loader = ToolLoaderTool(self.tool_registry, self.tool_names)
+
+        tools = self._get_tool_schemas()
+
+        def open_stream(deployment: str):
+            return client.chat.completions.create(
+                messages=messages,
+                tools=tools,
+                deployment_name=deployment,
+                stream=True,
+                api_version="2025-01-01-preview"
+            )
+
+        self._iteration += 1
+        if self.accounting:
+            self.accounting.llm_iterations += 1
+        with span("llm_iteration", iteration=self._iteration, deployment=deployment_name) as iteration_span, \
+                count_cancellation("llm_stream"):
+            started = time.perf_counter()
+            if self.llm_router:
+                chunks = await self.llm_router.stream(open_stream)
+                llm_deployment = chunks.deployment
+                iteration_span.set_attribute("deployment", llm_deployment)
+            else:
+                chunks = await open_stream(deployment_name)
+                llm_deployment = deployment_name
+
+            tool_call_index_map = {}
+            content = ""
+            ttft_ms = None
+            usage = None
 
-        tool_call_index_map = {}
-        content = ""
-
-        async for chunk in chunks:
-            if chunk.choices:
-                delta = chunk.choices[0].delta
-                if delta:
-                    if delta.content:
-                        choice.append_content(delta.content)
-                        content += delta.content
-                    if delta.tool_calls:
-                        for tool_call_delta in delta.tool_calls:
-                            if tool_call_delta.id:
-                                tool_call_index_map[tool_call_delta.index] = tool_call_delta
-                            else:
-                                existing_tool_call = tool_call_index_map[tool_call_delta.index]
-                                if tool_call_delta.function:
-                                    argument_chunk = tool_call_delta.function.arguments or ""
-                                    existing_tool_call.function.arguments += argument_chunk
+            # closing the stream on cancellation drops the upstream connection right away, not on garbage collection
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if chunk.choices:
+                        delta = chunk.choices[0].delta
+                        if delta:
+                            if ttft_ms is None and (delta.content or delta.tool_calls):
+                                ttft_ms = (time.perf_counter() - started) * 1000
+                            if delta.content:
+                                choice.append_content(delta.content)
+                                content += delta.content
+                            if delta.tool_calls:
+                                for tool_call_delta in delta.tool_calls:
+                                    if tool_call_delta.id:
+                                        tool_call_index_map[tool_call_delta.index] = tool_call_delta
+                                    else:
+                                        existing_tool_call = tool_call_index_map[tool_call_delta.index]
+                                        if tool_call_delta.function:
+                                            argument_chunk = tool_call_delta.function.arguments or ""
+                                            existing_tool_call.function.arguments += argument_chunk
+
+            self._record_usage(llm_deployment, usage, ttft_ms)
+            if self.llm_router:
+                chunks.record_abandoned(usage, self.accounting)
 
         tool_calls_list = list(tool_call_index_map.values())
         validated_tool_calls = [ToolCall.validate(tc) for tc in tool_calls_list] if tool_calls_list else None
@@ -74,8 +167,9 @@ class GeneralPurposeAgent:
 
         if assistant_message.tool_calls:
             conversation_id = request.headers.get("x-conversation-id", "")
+            user_id = user_identity(request)
             tasks = [
-                self._process_tool_call(tc, choice, request.api_key, conversation_id)
+                self._process_tool_call(tc, choice, request.api_key, conversation_id, user_id)
                 for tc in assistant_message.tool_calls
             ]
             tool_messages = await asyncio.gather(*tasks)
@@ -85,22 +179,89 @@ class GeneralPurposeAgent:
 
             return await self.handle_request(deployment_name, choice, request, response)
 
-        choice.set_state(self.state)
+        if self.accounting:
+            self._report_accounting(choice)
+        if self.state_compactor:
+            choice.set_state(await self.state_compactor.compact(self.state, request.api_key))
+        else:
+            choice.set_state(self.state)
         return assistant_message
 
+    def _get_tool_schemas(self) -> list[dict[str, Any]]:
+        # Order must stay stable between iterations: loader first, then selected tools, then tools loaded on demand
+        schemas = []
+        if self._tool_loader and self._tool_loader.loadable_tools:
+            schemas.append(self._tool_loader.schema)
+        schemas.extend(self.tool_registry.schemas(self.tool_names))
+        if self.prompt_cache_enabled and schemas:
+            schemas[-1] = with_cache_breakpoint(schemas[-1])
+        return schemas
+
+    def _report_accounting(self, choice: Choice) -> None:
+        summary = self.accounting.summary()
+        self.state[ACCOUNTING_KEY] = summary
+        if self.accounting_stage:
+            stage = StageProcessor.open_stage(choice, "Request accounting")
+            stage.append_content(self.accounting.to_markdown(summary))
+            StageProcessor.close_stage_safely(stage)
+
+    def _record_usage(self, deployment_name: str, usage: Any, ttft_ms: Optional[float]) -> None:
+        if ttft_ms is not None:
+            LLM_TTFT.observe(ttft_ms / 1000, deployment=deployment_name)
+        if not usage:
+            if self.accounting:
+                self.accounting.record_llm_call(deployment_name)
+            return
+        cached_tokens = get_cached_tokens(usage)
+        if self.accounting:
+            self.accounting.record_llm_call(
+                deployment_name, usage.prompt_tokens, usage.completion_tokens, cached_tokens
+            )
+        LLM_TOKENS.inc(usage.prompt_tokens, deployment=deployment_name, type="prompt")
+        LLM_TOKENS.inc(cached_tokens, deployment=deployment_name, type="cached_prompt")
+        LLM_TOKENS.inc(usage.completion_tokens, deployment=deployment_name, type="completion")
+        logger.info(
+            "LLM iteration usage",
+            extra={
+                "iteration": self._iteration,
+                "deployment": deployment_name,
+                "prompt_tokens": usage.prompt_tokens,
+                "cached_tokens": cached_tokens,
+                "ttft_ms": round(ttft_ms) if ttft_ms is not None else None,
+            }
+        )
+        if self.prompt_cache_stats:
+            self.prompt_cache_stats.record(usage.prompt_tokens, cached_tokens, ttft_ms)
+
+    def _get_tool(self, tool_name: str) -> Optional[BaseTool]:
+        if self._tool_loader and tool_name == self._tool_loader.name:
+            return self._tool_loader
+        tool = self.tool_registry.get(tool_name)
+        if tool and self.tool_names is not None and tool_name not in self.tool_names:
+            # model called known tool that wasn't pre-selected (e.g. from the history), keep it for next iterations
+            self.tool_names.append(tool_name)
+        return tool
+
     def _prepare_messages(self, messages: list[Message]) -> list[dict[str, Any]]:
         unpacked = unpack_messages(messages, self.state.get(TOOL_CALL_HISTORY_KEY, []))
         unpacked.insert(0, {"role": "system", "content": self.system_prompt})
-        print("=== Message History ===")
-        for msg in unpacked:
-            print(json.dumps(msg, default=str))
-        print("=== End History ===")
+        if self.prompt_cache_enabled:
+            # Stable prefix: system prompt (-> tools) -> history. Breakpoint on the last message lets the next
+            # iteration of this turn reuse everything sent so far
+            unpacked[0] = with_cache_breakpoint(unpacked[0])
+            if len(unpacked) > 1:
+                unpacked[-1] = with_cache_breakpoint(unpacked[-1])
+        log_payload(logger, "Message history", unpacked)
         return unpacked
 
-    async def _process_tool_call(self, tool_call: ToolCall, choice: Choice, api_key: str, conversation_id: str) -> dict[str, Any]:
+    async def _process_tool_call(
+            self, tool_call: ToolCall, choice: Choice, api_key: str, conversation_id: str, user_id: Optional[str]
+    ) -> dict[str, Any]:
         tool_name = tool_call.function.name
-        stage = StageProcessor.open_stage(choice, tool_name)
-        tool = self._tools_dict.get(tool_name)
+        tool = self._get_tool(tool_name)
+        stage = self.stream_buffers.wrap(
+            StageProcessor.open_stage(choice, tool_name), getattr(tool, "deployment_name", tool_name)
+        )
 
         if tool and tool.show_in_stage:
             stage.append_content("## Request arguments: \n")
@@ -113,6 +274,8 @@ class GeneralPurposeAgent:
             choice=choice,
             api_key=api_key,
             conversation_id=conversation_id,
+            user_id=user_id,
+            accounting=self.accounting,
         )
 
         result_message = await tool.execute(tool_call_params)
@@ -1,74 +1,353 @@
+import json
+import logging
 import os
+from typing import Any
 
 import uvicorn
 from aidial_sdk import DIALApp
-from aidial_sdk.chat_completion import ChatCompletion, Request, Response
+from aidial_sdk.chat_completion import ChatCompletion, Choice, Request, Response
+from aidial_sdk.chat_completion.chunks import PromptTokensDetails
+from aidial_sdk.exceptions import HTTPException
+from fastapi.responses import PlainTextResponse
 
 from task.agent import GeneralPurposeAgent
 from task.prompts import SYSTEM_PROMPT
-from task.tools.base import BaseTool
+from task.tools.deployment.image_cache import ImageResultCache, RedisImageResultCache
 from task.tools.deployment.image_generation_tool import ImageGenerationTool
 from task.tools.files.file_content_extraction_tool import FileContentExtractionTool
 from task.tools.py_interpreter.python_code_interpreter_tool import PythonCodeInterpreterTool
 from task.tools.mcp.mcp_client import MCPClient
-from task.tools.mcp.mcp_tool import MCPTool
+from task.tools.rag.chunker import TextChunker, load_tokenizer
 from task.tools.rag.document_cache import DocumentCache
-from task.tools.rag.rag_tool import RagTool
+from task.tools.rag.embedding_cache import CachedEmbeddingModel, EmbeddingCache
+from task.tools.rag.embedding_service import (
+    EMBEDDING_MODEL_NAME,
+    EmbeddingService,
+    RemoteEmbeddingModel,
+    load_sentence_transformer,
+)
+from task.tools.rag.rag_tool import ANSWER_MODE, RagTool
+from task.tools.rag.redis_document_cache import RedisDocumentCache
+from task.tools.rag.retrieval import HybridRetriever
+from task.tools.registry import ToolRegistry
+from task.tools.selection import ToolSelector
+from task.utils.accounting import RequestAccounting
+from task.utils.admission import UNIDENTIFIED_KEY, AdmissionController, AdmissionRejected
+from task.utils.cancellation import run_until_disconnected
+from task.utils.identity import USER_ID_HEADER, user_identity
+from task.utils.llm_router import LLMRouter
+from task.utils.log import setup_logging, request_logging_context
+from task.utils.loop_watchdog import LoopWatchdog
+from task.utils.prompt_cache import PromptCacheStats
+from task.utils.state_compaction import (
+    DialFileToolResultStore,
+    RedisToolResultStore,
+    StateCompactor,
+    ToolResultStore,
+)
+from task.utils.state_store import ConversationStateStore, RedisConversationStateStore
+from task.utils.stream_writer import StreamBufferConfig
+from task.utils.telemetry import METRICS, MetricsRegistry, span
+from task.utils.work_pools import WorkPool
+
+logger = logging.getLogger(__name__)
 
 DIAL_ENDPOINT = os.getenv('DIAL_ENDPOINT', "http://localhost:8080")
 DEPLOYMENT_NAME = os.getenv('DEPLOYMENT_NAME', 'gpt-4o')
 # DEPLOYMENT_NAME = os.getenv('DEPLOYMENT_NAME', 'claude-sonnet-3-7')
+# LLM deployments in order of preference (DEPLOYMENT_NAME only by default). With two or more, a deployment that fails
+# or sends no first token within LLM_FIRST_TOKEN_TIMEOUT_MS is cooled down and the next one is tried (the last one
+# has no deadline); once the first token takes longer than LLM_HEDGE_QUANTILE of recent ones, a second request is
+# raced on the next deployment (0 disables it). A single deployment is called directly, without hedging or deadline
+LLM_DEPLOYMENTS = [
+    name.strip() for name in os.getenv('LLM_DEPLOYMENTS', DEPLOYMENT_NAME).split(',') if name.strip()
+] or [DEPLOYMENT_NAME]
+LLM_FIRST_TOKEN_TIMEOUT_MS = float(os.getenv('LLM_FIRST_TOKEN_TIMEOUT_MS', 20_000))
+LLM_HEDGE_QUANTILE = float(os.getenv('LLM_HEDGE_QUANTILE', 0.95))
+LLM_MIN_HEDGE_DELAY_MS = float(os.getenv('LLM_MIN_HEDGE_DELAY_MS', 500))
+LLM_COOLDOWN_SECONDS = float(os.getenv('LLM_COOLDOWN_SECONDS', 30))
+PY_INTERPRETER_MCP_URL = os.getenv('PY_INTERPRETER_MCP_URL', "http://localhost:8050/mcp")
+DDG_MCP_URL = os.getenv('DDG_MCP_URL', "http://localhost:8051/mcp")
+# Periodic re-listing of MCP tools in addition to `tools/list_changed` notifications, 0 disables it
+MCP_TOOLS_REFRESH_SECONDS = float(os.getenv('MCP_TOOLS_REFRESH_SECONDS', 300))
+# Send only tools relevant for the conversation, others are loaded by the model on demand
+TOOL_SELECTION_ENABLED = os.getenv('TOOL_SELECTION_ENABLED', 'true').lower() == 'true'
+# Mark stable prompt prefix with cache breakpoints for upstream prompt caching
+PROMPT_CACHE_ENABLED = os.getenv('PROMPT_CACHE_ENABLED', 'true').lower() == 'true'
+# Streamed content is coalesced into one SSE event per STREAM_FLUSH_MS (0 - event per token) or STREAM_FLUSH_BYTES,
+# STREAM_FLUSH_OVERRIDES sets them per deployment or tool: {"gpt-4o": {"flush_ms": 50, "flush_bytes": 2048}}
+STREAM_BUFFERS = StreamBufferConfig.parse(
+    flush_ms=float(os.getenv('STREAM_FLUSH_MS', 20)),
+    flush_bytes=int(os.getenv('STREAM_FLUSH_BYTES', 1024)),
+    overrides=os.getenv('STREAM_FLUSH_OVERRIDES', ''),
+)
+# Number of server processes, with more than one the embedding model is held by a single shared process.
+# Without REDIS_URL every worker keeps its own document and image caches, interpreter sessions and tool results,
+# and admission limits and /metrics are per worker as well
+AGENT_WORKERS = int(os.getenv('AGENT_WORKERS', 1))
+# Worker import with ML dependencies takes a while, uvicorn's default 5s health check restarts them endlessly
+AGENT_WORKER_STARTUP_TIMEOUT = int(os.getenv('AGENT_WORKER_STARTUP_TIMEOUT', 120))
+# Embedding model runtime: torch, torch-int8, onnx or onnx-int8 (onnx requires sentence-transformers[onnx])
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+# Chunk embeddings cache: in-memory LRU entries (0 disables the cache) and optional SQLite file shared by workers
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', 50_000))
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', '')
+# RAG chunk size and overlap in embedding model tokens, all-MiniLM-L6-v2 truncates inputs over 254 tokens
+RAG_CHUNK_TOKENS = int(os.getenv('RAG_CHUNK_TOKENS', 128))
+RAG_CHUNK_OVERLAP_TOKENS = int(os.getenv('RAG_CHUNK_OVERLAP_TOKENS', 16))
+# RAG retrieval: passages per search, weight of BM25 against vector ranking (0 - vector only), MMR lambda (1 - off)
+RAG_TOP_K = int(os.getenv('RAG_TOP_K', 3))
+RAG_BM25_WEIGHT = float(os.getenv('RAG_BM25_WEIGHT', 1.0))
+RAG_MMR_LAMBDA = float(os.getenv('RAG_MMR_LAMBDA', 0.7))
+# Default rag_search result: 'answer' (nested LLM call) or 'passages' (ranked passages, no extra LLM call)
+RAG_MODE = os.getenv('RAG_MODE', ANSWER_MODE)
+# Shared conversation state (RAG indexes, interpreter sessions) for several replicas, in-process when not set
+REDIS_URL = os.getenv('REDIS_URL', '')
+# Poll the client connection and cancel the request (LLM streams, tool calls, indexing) once it's closed, 0 disables
+DISCONNECT_POLL_MS = float(os.getenv('DISCONNECT_POLL_MS', 250))
+# Admission control per worker process: requests processed at once (0 disables it) and by one key, queued requests
+# in total and per key (more are rejected with 429). Queued requests are admitted fairly by a stable user identity:
+# the ADMISSION_KEY_HEADER value if set (e.g. a project header set by the gateway), otherwise the user id
+# (USER_ID_HEADER or the subject of the user's JWT). Not the api-key: DIAL Core sends a new one with every request.
+# Requests without an identity (API key users when no header is configured) share one key without per-key limits.
+# ADMISSION_WEIGHTS gives keys a larger share: {"<key>": 2}
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', 64))
+ADMISSION_MAX_ACTIVE_PER_KEY = int(os.getenv('ADMISSION_MAX_ACTIVE_PER_KEY', 16))
+ADMISSION_MAX_QUEUED = int(os.getenv('ADMISSION_MAX_QUEUED', 256))
+ADMISSION_MAX_QUEUED_PER_KEY = int(os.getenv('ADMISSION_MAX_QUEUED_PER_KEY', 16))
+ADMISSION_KEY_HEADER = os.getenv('ADMISSION_KEY_HEADER', '').lower()
+ADMISSION_WEIGHTS = json.loads(os.getenv('ADMISSION_WEIGHTS', '') or '{}')
+# Tool results of at least STATE_COMPACTION_MIN_CHARS can be kept out of choice state, which the client sends back
+# with every request, in STATE_RESULT_STORE: off (the default, results stay in state), redis (REDIS_URL, expire after
+# 30 days), local (process memory of one worker, lost on restart) or dial (files in the user's appdata folder, visible
+# to the user and never deleted by the agent). STATE_COMPRESSION zlib compresses the rest of tool call history (off
+# by default: builds without it can't read compressed or stored history, enable once rolling back to them is ruled out)
+STATE_RESULT_STORE = os.getenv('STATE_RESULT_STORE', 'off').lower()
+STATE_COMPACTION_MIN_CHARS = int(os.getenv('STATE_COMPACTION_MIN_CHARS', 2000))
+STATE_COMPRESSION = os.getenv('STATE_COMPRESSION', 'false').lower() == 'true'
+# Identical image generation requests reuse the generated image for IMAGE_CACHE_TTL_SECONDS (0 - only concurrent
+# ones are shared), among requests of one user (USER_ID_HEADER or JWT subject; of one conversation when the user is
+# not known) or, with IMAGE_CACHE_SCOPE=conversation, of one conversation
+IMAGE_CACHE_TTL_SECONDS = int(os.getenv('IMAGE_CACHE_TTL_SECONDS', 3600))
+IMAGE_CACHE_SCOPE = os.getenv('IMAGE_CACHE_SCOPE', 'user').lower()
+# Show tokens, tool calls and time spent per stage of the request in a stage of the final message, the same summary
+# is always saved to its state and logged
+ACCOUNTING_STAGE = os.getenv('ACCOUNTING_STAGE', 'false').lower() == 'true'
+# Threads for RAG indexing and for file extraction, separate so one kind of work doesn't starve the other
+RAG_POOL_WORKERS = int(os.getenv('RAG_POOL_WORKERS', 2))
+EXTRACTION_POOL_WORKERS = int(os.getenv('EXTRACTION_POOL_WORKERS', 2))
+# Report event loop lag and callbacks blocking the loop longer than threshold (with their stacks)
+LOOP_WATCHDOG_ENABLED = os.getenv('LOOP_WATCHDOG_ENABLED', 'true').lower() == 'true'
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv('LOOP_BLOCK_THRESHOLD_MS', 100))
+LOOP_WATCHDOG_INTERVAL_MS = float(os.getenv('LOOP_WATCHDOG_INTERVAL_MS', 20))
 
 
 class GeneralPurposeAgentApplication(ChatCompletion):
 
     def __init__(self):
-        self.tools: list[BaseTool] = []
-
-    async def _get_mcp_tools(self, url: str) -> list[BaseTool]:
-        tools: list[BaseTool] = []
-        client = await MCPClient.create(url)
-        mcp_tools = await client.get_tools()
-        for mcp_tool_model in mcp_tools:
-            tools.append(MCPTool(client=client, mcp_tool_model=mcp_tool_model))
-        return tools
-
-    async def _create_tools(self) -> list[BaseTool]:
-        tools: list[BaseTool] = []
-        tools.append(ImageGenerationTool(DIAL_ENDPOINT))
-        tools.append(FileContentExtractionTool(DIAL_ENDPOINT))
-        tools.append(RagTool(DIAL_ENDPOINT, DEPLOYMENT_NAME, DocumentCache.create()))
-        tools.append(await PythonCodeInterpreterTool.create(
-            mcp_url="http://localhost:8050/mcp",
+        self.tool_registry: ToolRegistry | None = None
+        self.tool_selector: ToolSelector | None = None
+        self.prompt_cache_stats = PromptCacheStats()
+        self.loop_watchdog = LoopWatchdog(
+            threshold=LOOP_BLOCK_THRESHOLD_MS / 1000,
+            interval=LOOP_WATCHDOG_INTERVAL_MS / 1000,
+        ) if LOOP_WATCHDOG_ENABLED else None
+        self.admission = AdmissionController(
+            max_concurrent=ADMISSION_MAX_CONCURRENT,
+            max_queued=ADMISSION_MAX_QUEUED,
+            max_queued_per_key=ADMISSION_MAX_QUEUED_PER_KEY,
+            max_active_per_key=ADMISSION_MAX_ACTIVE_PER_KEY,
+            weights=ADMISSION_WEIGHTS,
+        ) if ADMISSION_MAX_CONCURRENT else None
+        # shared by requests, so latency observed by one routes the others
+        self.llm_router = LLMRouter(
+            LLM_DEPLOYMENTS,
+            first_token_timeout=LLM_FIRST_TOKEN_TIMEOUT_MS / 1000,
+            hedge_quantile=LLM_HEDGE_QUANTILE,
+            min_hedge_delay=LLM_MIN_HEDGE_DELAY_MS / 1000,
+            cooldown=LLM_COOLDOWN_SECONDS,
+        ) if len(LLM_DEPLOYMENTS) > 1 else None
+        self.state_compactor = StateCompactor(
+            _create_tool_result_store(),
+            min_chars=STATE_COMPACTION_MIN_CHARS,
+            compress=STATE_COMPRESSION,
+        )
+
+    async def _create_tool_registry(self) -> ToolRegistry:
+        registry = ToolRegistry()
+        if REDIS_URL:
+            document_cache = RedisDocumentCache.create(REDIS_URL)
+            state_store = RedisConversationStateStore.create(REDIS_URL)
+            image_cache = RedisImageResultCache.create(REDIS_URL, IMAGE_CACHE_TTL_SECONDS)
+        else:
+            document_cache = DocumentCache.create()
+            state_store = ConversationStateStore()
+            image_cache = ImageResultCache(IMAGE_CACHE_TTL_SECONDS)
+        embedding_model = RemoteEmbeddingModel.from_env() or load_sentence_transformer(backend=EMBEDDING_BACKEND)
+        # only document chunks are cached, user messages and search queries are never stored
+        chunk_model = CachedEmbeddingModel(
+            embedding_model,
+            model_id=f"{EMBEDDING_MODEL_NAME}:{EMBEDDING_BACKEND}",
+            cache=EmbeddingCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PATH or None),
+        ) if EMBEDDING_CACHE_SIZE else None
+        rag_tool = RagTool(
+            DIAL_ENDPOINT,
+            LLM_DEPLOYMENTS[0],
+            document_cache,
+            model=embedding_model,
+            chunk_model=chunk_model,
+            retriever=HybridRetriever(top_k=RAG_TOP_K, bm25_weight=RAG_BM25_WEIGHT, mmr_lambda=RAG_MMR_LAMBDA),
+            mode=RAG_MODE,
+            chunker=TextChunker(RAG_CHUNK_TOKENS, RAG_CHUNK_OVERLAP_TOKENS, load_tokenizer(EMBEDDING_MODEL_NAME)),
+            pool=WorkPool("rag", RAG_POOL_WORKERS),
+            llm_router=self.llm_router,
+        )
+        registry.register(ImageGenerationTool(
+            DIAL_ENDPOINT,
+            cache=image_cache if IMAGE_CACHE_TTL_SECONDS else None,
+            scope=IMAGE_CACHE_SCOPE,
+        ))
+        registry.register(FileContentExtractionTool(DIAL_ENDPOINT, WorkPool("extraction", EXTRACTION_POOL_WORKERS)))
+        registry.register(rag_tool)
+        registry.register(await PythonCodeInterpreterTool.create(
+            mcp_url=PY_INTERPRETER_MCP_URL,
             tool_name="execute_code",
-            dial_endpoint=DIAL_ENDPOINT
+            dial_endpoint=DIAL_ENDPOINT,
+            state_store=state_store,
         ))
-        tools.extend(await self._get_mcp_tools("http://localhost:8051/mcp"))
-        return tools
+        await registry.add_mcp_server(await MCPClient.create(DDG_MCP_URL))
+        registry.start_refresh_task(MCP_TOOLS_REFRESH_SECONDS)
+        if TOOL_SELECTION_ENABLED:
+            # reuse already loaded embedding model of RAG tool
+            self.tool_selector = ToolSelector(registry, encode=rag_tool.model.encode, pool=rag_tool.pool)
+            await self.tool_selector.encode_descriptions()
+        return registry
 
     async def chat_completion(self, request: Request, response: Response) -> None:
-        if not self.tools:
-            self.tools = await self._create_tools()
-        with response.create_single_choice() as choice:
-            agent = GeneralPurposeAgent(
-                endpoint=DIAL_ENDPOINT,
-                system_prompt=SYSTEM_PROMPT,
-                tools=self.tools,
+        if self.loop_watchdog and not self.loop_watchdog.running:
+            # started on first request since it has to run inside the server event loop
+            self.loop_watchdog.start()
+        if not self.tool_registry:
+            self.tool_registry = await self._create_tool_registry()
+        if not self.admission:
+            await self._process_request(request, response)
+            return
+        # rejected before the response is started, so the client gets 429 status rather than an error chunk
+        key = user_identity(request, ADMISSION_KEY_HEADER or USER_ID_HEADER) or UNIDENTIFIED_KEY
+        try:
+            async with self.admission.admit(key):
+                await self._process_request(request, response)
+        except AdmissionRejected as e:
+            raise HTTPException(
+                message=str(e), status_code=429, type="rate_limit_exceeded", headers={"Retry-After": "1"}
             )
-            await agent.handle_request(
-                choice=choice,
-                deployment_name=DEPLOYMENT_NAME,
-                request=request,
-                response=response,
+
+    async def _process_request(self, request: Request, response: Response) -> None:
+        accounting = RequestAccounting()
+        conversation_id = request.headers.get("x-conversation-id", "")
+        with request_logging_context(request.headers), \
+                span("agent_request", conversation_id=conversation_id) as request_span, accounting.activate():
+            try:
+                with response.create_single_choice() as choice:
+                    await self._run_agent(request, response, choice, accounting)
+                # usage can only be sent once the choice is complete
+                _report_usage(response, accounting.summary())
+            finally:
+                summary = accounting.summary()
+                accounting.export(summary)
+                for key in ("llm_calls", "prompt_tokens", "cached_tokens", "completion_tokens", "tool_calls"):
+                    request_span.set_attribute(key, summary[key])
+
+    async def _run_agent(
+            self, request: Request, response: Response, choice: Choice, accounting: RequestAccounting
+    ) -> None:
+        agent = GeneralPurposeAgent(
+            endpoint=DIAL_ENDPOINT,
+            system_prompt=SYSTEM_PROMPT,
+            tool_registry=self.tool_registry,
+            tool_selector=self.tool_selector,
+            prompt_cache_enabled=PROMPT_CACHE_ENABLED,
+            prompt_cache_stats=self.prompt_cache_stats,
+            stream_buffers=STREAM_BUFFERS,
+            llm_router=self.llm_router,
+            state_compactor=self.state_compactor,
+            accounting=accounting,
+            accounting_stage=ACCOUNTING_STAGE,
+        )
+        agent_request = agent.handle_request(
+            choice=choice,
+            deployment_name=LLM_DEPLOYMENTS[0],
+            request=request,
+            response=response,
+        )
+        if DISCONNECT_POLL_MS:
+            await run_until_disconnected(
+                agent_request, request.original_request.is_disconnected, DISCONNECT_POLL_MS / 1000
             )
+        else:
+            await agent_request
+
 
+def _report_usage(response: Response, summary: dict[str, Any]) -> None:
+    """Tokens of all LLM calls of the request, the agent's and tools', in total and per deployment."""
+    response.set_usage(
+        summary["prompt_tokens"],
+        summary["completion_tokens"],
+        prompt_tokens_details=PromptTokensDetails(cached_tokens=summary["cached_tokens"]),
+    )
+    for deployment, usage in summary["models"].items():
+        response.add_usage_per_model(deployment, usage["prompt_tokens"], usage["completion_tokens"])
 
+
+def _create_tool_result_store() -> ToolResultStore | None:
+    if STATE_RESULT_STORE == 'dial':
+        return DialFileToolResultStore(DIAL_ENDPOINT)
+    if STATE_RESULT_STORE == 'redis' and REDIS_URL:
+        return RedisToolResultStore.create(REDIS_URL)
+    if STATE_RESULT_STORE == 'local':
+        return ToolResultStore()
+    return None
+
+
+async def metrics() -> PlainTextResponse:
+    """Prometheus scrape endpoint, metrics of the worker process serving the scrape"""
+    return PlainTextResponse(METRICS.render(), media_type=MetricsRegistry.CONTENT_TYPE)
+
+
+setup_logging()
 app = DIALApp()
 agent_app = GeneralPurposeAgentApplication()
 app.add_chat_completion(
     deployment_name="general-purpose-agent",
     impl=agent_app,
 )
+app.add_api_route("/metrics", metrics, methods=["GET"])
+
+
+def run(host: str = "0.0.0.0", port: int = 5030, workers: int = AGENT_WORKERS, **kwargs) -> None:
+    if workers <= 1:
+        uvicorn.run(app, host=host, port=port, **kwargs)
+        return
+    if not REDIS_URL:
+        logger.warning(
+            f"Running {workers} workers without REDIS_URL: conversation state (RAG indexes, images, interpreter "
+            f"sessions, stored tool results) isn't shared, a conversation may lose it when served by another worker"
+        )
+    # workers are spawned processes that import this module and connect to the embedding service by env
+    embedding_service = EmbeddingService.start(backend=EMBEDDING_BACKEND)
+    embedding_service.export_env()
+    try:
+        uvicorn.run(
+            "task.app:app",
+            host=host,
+            port=port,
+            workers=workers,
+            timeout_worker_healthcheck=AGENT_WORKER_STARTUP_TIMEOUT,
+            **kwargs
+        )
+    finally:
+        embedding_service.stop()
+
 
 if __name__ == "__main__":
-    uvicorn.run(app, port=5030, host="0.0.0.0")
+    run()
@@ -1,3 +1,4 @@
+import time
 from abc import ABC, abstractmethod
 from typing import Any
 
@@ -7,6 +8,8 @@ from aidial_sdk.chat_completion import Message
 from pydantic import StrictStr
 
 from task.tools.models import ToolCallParams
+from task.utils.cancellation import count_cancellation
+from task.utils.telemetry import span, TOOL_CALL_DURATION
 
 
 class BaseTool(ABC):
@@ -17,14 +20,22 @@ class BaseTool(ABC):
             name=StrictStr(tool_call_params.tool_call.function.name),
             tool_call_id=StrictStr(tool_call_params.tool_call.id),
         )
-        try:
-            result = await self._execute(tool_call_params)
-            if isinstance(result, Message):
-                message = result
-            else:
-                message.content = StrictStr(result)
-        except Exception as e:
-            message.content = StrictStr(f"Error executing tool: {str(e)}")
+        with span("tool_call", tool=self.name) as tool_span, TOOL_CALL_DURATION.time(tool=self.name), \
+                count_cancellation("tool_call"):
+            started = time.perf_counter()
+            try:
+                result = await self._execute(tool_call_params)
+                if isinstance(result, Message):
+                    message = result
+                else:
+                    message.content = StrictStr(result)
+            except Exception as e:
+                tool_span.error = f"{type(e).__name__}: {e}"
+                message.content = StrictStr(f"Error executing tool: {str(e)}")
+            if tool_call_params.accounting:
+                tool_call_params.accounting.record_tool_call(
+                    self.name, time.perf_counter() - started, error=tool_span.error is not None
+                )
         return message
 
     @abstractmethod
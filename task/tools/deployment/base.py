@@ -1,13 +1,15 @@
 import json
 from abc import ABC, abstractmethod
+from contextlib import aclosing
 from typing import Any
 
 from aidial_client import AsyncDial
-from aidial_sdk.chat_completion import Message, Role, CustomContent
+from aidial_sdk.chat_completion import Attachment, CustomContent, Message, Role, Stage
 from pydantic import StrictStr
 
 from task.tools.base import BaseTool
 from task.tools.models import ToolCallParams
+from task.utils.accounting import RequestAccounting
 
 
 class DeploymentTool(BaseTool, ABC):
@@ -26,10 +28,25 @@ class DeploymentTool(BaseTool, ABC):
 
     async def _execute(self, tool_call_params: ToolCallParams) -> str | Message:
         arguments = json.loads(tool_call_params.tool_call.function.arguments)
-        prompt = arguments.get("prompt", "")
-        arguments.pop("prompt", None)
+        prompt = arguments.pop("prompt", "")
+        content, attachments = await self._call_deployment(
+            prompt, arguments, tool_call_params.api_key, tool_call_params.stage, tool_call_params.accounting
+        )
+        return self._to_message(content, attachments, tool_call_params)
 
-        client = AsyncDial(base_url=self.endpoint, api_key=tool_call_params.api_key)
+    async def _call_deployment(
+            self,
+            prompt: str,
+            custom_fields: dict[str, Any],
+            api_key: str,
+            stage: Stage | None = None,
+            accounting: RequestAccounting | None = None,
+    ) -> tuple[str, list[Attachment]]:
+        """
+        Streams the deployment's answer to the prompt into the stage if given, returns its content and attachments.
+        The call and its token usage are recorded to `accounting` if given.
+        """
+        client = AsyncDial(base_url=self.endpoint, api_key=api_key)
 
         messages = [{"role": "user", "content": prompt}]
 
@@ -37,48 +54,52 @@ class DeploymentTool(BaseTool, ABC):
             messages=messages,
             stream=True,
             deployment_name=self.deployment_name,
-            extra_body={"custom_fields": arguments} if arguments else None,
+            extra_body={"custom_fields": custom_fields} if custom_fields else None,
             api_version="2025-01-01-preview",
             **self.tool_parameters
         )
 
         content = ""
         attachments = []
-        stage = tool_call_params.stage
+        usage = None
 
-        async for chunk in chunks:
-            if chunk.choices:
-                delta = chunk.choices[0].delta
-                if delta:
-                    if delta.content:
-                        content += delta.content
-                        stage.append_content(delta.content)
-                    if hasattr(delta, 'custom_content') and delta.custom_content:
-                        if hasattr(delta.custom_content, 'attachments') and delta.custom_content.attachments:
-                            for attachment in delta.custom_content.attachments:
-                                attachments.append(attachment)
-                                stage.add_attachment(
-                                    type=attachment.type,
-                                    title=attachment.title,
-                                    url=attachment.url
-                                )
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices:
+                    delta = chunk.choices[0].delta
+                    if delta:
+                        if delta.content:
+                            content += delta.content
+                            if stage is not None:
+                                stage.append_content(delta.content)
+                        if hasattr(delta, 'custom_content') and delta.custom_content:
+                            if hasattr(delta.custom_content, 'attachments') and delta.custom_content.attachments:
+                                for attachment in delta.custom_content.attachments:
+                                    attachments.append(
+                                        Attachment(type=attachment.type, title=attachment.title, url=attachment.url)
+                                    )
+                                    if stage is not None:
+                                        stage.add_attachment(
+                                            type=attachment.type,
+                                            title=attachment.title,
+                                            url=attachment.url
+                                        )
 
-        custom_content = None
-        if attachments:
-            from aidial_sdk.chat_completion import Attachment as SdkAttachment
-            sdk_attachments = []
-            for att in attachments:
-                sdk_attachments.append(SdkAttachment(
-                    type=att.type,
-                    title=att.title,
-                    url=att.url
-                ))
-            custom_content = CustomContent(attachments=sdk_attachments)
+        if accounting:
+            accounting.record_llm_call(
+                self.deployment_name,
+                prompt_tokens=usage.prompt_tokens if usage else 0,
+                completion_tokens=usage.completion_tokens if usage else 0,
+            )
+        return content, attachments
 
-        message = Message(
+    @staticmethod
+    def _to_message(content: str, attachments: list[Attachment], tool_call_params: ToolCallParams) -> Message:
+        return Message(
             role=Role.TOOL,
             content=StrictStr(content) if content else None,
-            custom_content=custom_content,
+            custom_content=CustomContent(attachments=attachments) if attachments else None,
             tool_call_id=StrictStr(tool_call_params.tool_call.id),
         )
-        return message
@@ -0,0 +1,70 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from redis import Redis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 60 * 60
+
+
+class ImageResultCache:
+    """
+    Results of image generation requests (content and attachment URLs) by request key, kept in process memory.
+    Entries expire `ttl_seconds` after they were stored, the least recently used are evicted over `max_entries`.
+    """
+
+    def __init__(self, ttl_seconds: int = DEFAULT_TTL_SECONDS, max_entries: int = 10_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[dict[str, Any], float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            result, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    async def set(self, key: str, result: dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (result, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisImageResultCache(ImageResultCache):
+    """Image generation results shared by agent replicas through Redis, entries expire `ttl_seconds` after stored."""
+
+    def __init__(self, client: Redis, ttl_seconds: int = DEFAULT_TTL_SECONDS, prefix: str = "agent:image"):
+        super().__init__(ttl_seconds)
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def create(cls, url: str, ttl_seconds: int = DEFAULT_TTL_SECONDS) -> 'RedisImageResultCache':
+        logger.info("Using Redis image result cache", extra={"url": url})
+        return cls(Redis.from_url(url), ttl_seconds)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def get(self, key: str) -> Optional[dict[str, Any]]:
+        # the client is synchronous, network round trips stay off the event loop
+        value = await asyncio.to_thread(self.client.get, self._key(key))
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, result: dict[str, Any]) -> None:
+        await asyncio.to_thread(self.client.set, self._key(key), json.dumps(result), ex=self.ttl_seconds)
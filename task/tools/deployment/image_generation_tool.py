@@ -1,18 +1,57 @@
-from typing import Any
+import hashlib
+import json
+import unicodedata
+from typing import Any, Optional
 
-from aidial_sdk.chat_completion import Message
+from aidial_sdk.chat_completion import Attachment, Message
 from pydantic import StrictStr
 
 from task.tools.deployment.base import DeploymentTool
+from task.tools.deployment.image_cache import ImageResultCache
 from task.tools.models import ToolCallParams
+from task.utils.accounting import RequestAccounting
+from task.utils.single_flight import SingleFlight
+from task.utils.telemetry import current_span, record_cache
+
+# DALL-E 3 defaults, a request that omits them is the same request as one that sets them
+_DEFAULT_CUSTOM_FIELDS = {"size": "1024x1024", "quality": "standard", "style": "vivid"}
 
 
 class ImageGenerationTool(DeploymentTool):
+    """
+    Identical requests (normalized prompt and custom fields) of one user share the generated image: a request made
+    while the same one is generating waits for it, a repeated one (retry, regenerate) gets the attachment URL of
+    the cached result instead of a new image.
+    """
+
+    def __init__(self, endpoint: str, cache: Optional[ImageResultCache] = None, scope: str = "user"):
+        """
+        :param cache: results reused by identical requests, only in-flight requests are shared if None
+        :param scope: who shares results: `user` (same user id, or same conversation when the user is not known)
+            or `conversation` (same user and conversation). Attachments are in the user's bucket, so results are
+            never shared between users; with neither user nor conversation known only the request's own concurrent
+            calls are shared, since its api-key is the only scope left
+        """
+        super().__init__(endpoint)
+        self.cache = cache
+        self.scope = scope
+        self._single_flight: SingleFlight[tuple[str, list[Attachment]]] = SingleFlight()
 
     async def _execute(self, tool_call_params: ToolCallParams) -> str | Message:
-        result = await super()._execute(tool_call_params)
+        arguments = json.loads(tool_call_params.tool_call.function.arguments)
+        prompt = arguments.pop("prompt", "")
+        content, attachments = await self._generate(
+            self._request_key(prompt, arguments, tool_call_params), prompt, arguments, tool_call_params.api_key,
+            tool_call_params.accounting,
+        )
+        stage = tool_call_params.stage
+        if content:
+            stage.append_content(content)
+        for attachment in attachments:
+            stage.add_attachment(type=attachment.type, title=attachment.title, url=attachment.url)
+        result = self._to_message(content, attachments, tool_call_params)
 
-        if isinstance(result, Message) and result.custom_content and result.custom_content.attachments:
+        if result.custom_content and result.custom_content.attachments:
             choice = tool_call_params.choice
             image_attachments = [
                 att for att in result.custom_content.attachments
@@ -28,6 +67,60 @@ class ImageGenerationTool(DeploymentTool):
 
         return result
 
+    async def _generate(
+            self,
+            key: str,
+            prompt: str,
+            custom_fields: dict[str, Any],
+            api_key: str,
+            accounting: Optional[RequestAccounting] = None,
+    ) -> tuple[str, list[Attachment]]:
+        """Cached, shared or new result; only the request that starts the generation is accounted for its usage."""
+        tool_span = current_span()
+        if self.cache:
+            cached = await self.cache.get(key)
+            record_cache("image_result", cached is not None)
+            if cached is not None:
+                if tool_span:
+                    tool_span.set_attribute("image_cache", "hit")
+                return cached["content"], [Attachment(**attachment) for attachment in cached["attachments"]]
+
+        async def generate() -> tuple[str, list[Attachment]]:
+            content, attachments = await self._call_deployment(prompt, custom_fields, api_key, accounting=accounting)
+            if self.cache and attachments:
+                await self.cache.set(key, {
+                    "content": content,
+                    "attachments": [attachment.dict(exclude_none=True) for attachment in attachments],
+                })
+            return content, attachments
+
+        result, coalesced = await self._single_flight.run(key, generate)
+        record_cache("image_single_flight", coalesced)
+        if tool_span:
+            tool_span.set_attribute("image_cache", "coalesced" if coalesced else "miss")
+        return result
+
+    def _request_key(self, prompt: str, custom_fields: dict[str, Any], tool_call_params: ToolCallParams) -> str:
+        user_id, conversation_id = tool_call_params.user_id, tool_call_params.conversation_id
+        if self.scope == "conversation" or not user_id:
+            scope = [user_id or "", conversation_id]
+        else:
+            scope = [user_id]
+        if not user_id and not conversation_id:
+            # the api-key is new on every request, but it's the only thing that keeps users apart
+            scope.append(hashlib.sha256(tool_call_params.api_key.encode("utf-8")).hexdigest())
+        request = {
+            "deployment": self.deployment_name,
+            "scope": scope,
+            # case is kept, it may matter for text drawn in the image
+            "prompt": " ".join(unicodedata.normalize("NFKC", prompt).split()),
+            "custom_fields": {
+                **_DEFAULT_CUSTOM_FIELDS,
+                **{name: value for name, value in custom_fields.items() if value is not None},
+            },
+        }
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
     @property
     def deployment_name(self) -> str:
         return "dall-e-3"
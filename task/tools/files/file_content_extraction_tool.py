@@ -6,6 +6,7 @@ from aidial_sdk.chat_completion import Message
 from task.tools.base import BaseTool
 from task.tools.models import ToolCallParams
 from task.utils.dial_file_conent_extractor import DialFileContentExtractor
+from task.utils.work_pools import WorkPool
 
 
 class FileContentExtractionTool(BaseTool):
@@ -15,8 +16,12 @@ class FileContentExtractionTool(BaseTool):
     USAGE: Start with page=1 (by default)
     """
 
-    def __init__(self, endpoint: str):
+    def __init__(self, endpoint: str, pool: WorkPool | None = None):
+        """
+        :param pool: threads downloading and parsing files, 2 threads of its own if None
+        """
         self.endpoint = endpoint
+        self.pool = pool or WorkPool("extraction", 2)
 
     @property
     def show_in_stage(self) -> bool:
@@ -66,7 +71,7 @@ class FileContentExtractionTool(BaseTool):
         stage.append_content("## Response: \n")
 
         extractor = DialFileContentExtractor(self.endpoint, tool_call_params.api_key)
-        content = extractor.extract_text(file_url)
+        content = await self.pool.run(extractor.extract_text, file_url)
 
         if not content:
             content = "Error: File content not found."
@@ -1,11 +1,32 @@
-from typing import Optional, Any
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional, Any, Callable, Awaitable
 
 from mcp import ClientSession
 from mcp.client.streamable_http import streamablehttp_client
-from mcp.types import CallToolResult, TextContent, ReadResourceResult, TextResourceContents, BlobResourceContents
+from mcp.types import (
+    CallToolResult, TextContent, ReadResourceResult, TextResourceContents, BlobResourceContents,
+    ServerNotification, ToolListChangedNotification, ClientNotification, CancelledNotification,
+    CancelledNotificationParams,
+)
 from pydantic import AnyUrl
 
 from task.tools.mcp.mcp_tool_model import MCPToolModel
+from task.utils.cancellation import CANCELLATIONS
+from task.utils.single_flight import SingleFlight
+from task.utils.telemetry import span, record_cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MCPCallResult:
+    content: str
+    latency_ms: float
+    coalesced: bool
 
 
 class MCPClient:
@@ -16,6 +37,10 @@ class MCPClient:
         self.session: Optional[ClientSession] = None
         self._streams_context = None
         self._session_context = None
+        self._single_flight: SingleFlight[str] = SingleFlight()
+        self._tools_changed_listeners: list[Callable[[], Awaitable[None]]] = []
+        self._listener_tasks: set[asyncio.Task] = set()
+        self._notification_tasks: set[asyncio.Task] = set()
 
     @classmethod
     async def create(cls, mcp_server_url: str) -> 'MCPClient':
@@ -30,10 +55,25 @@ class MCPClient:
             return
         self._streams_context = streamablehttp_client(self.server_url)
         read_stream, write_stream, _ = await self._streams_context.__aenter__()
-        self._session_context = ClientSession(read_stream, write_stream)
+        self._session_context = ClientSession(read_stream, write_stream, message_handler=self._handle_message)
         self.session = await self._session_context.__aenter__()
         result = await self.session.initialize()
-        print(f"MCP Session initialized: {result}")
+        logger.info(
+            "MCP session initialized",
+            extra={"server": self.server_url, "server_info": result.serverInfo.model_dump(mode="json")}
+        )
+
+    def on_tools_changed(self, listener: Callable[[], Awaitable[None]]) -> None:
+        """Register listener for `notifications/tools/list_changed` from the server"""
+        self._tools_changed_listeners.append(listener)
+
+    async def _handle_message(self, message: Any) -> None:
+        if isinstance(message, ServerNotification) and isinstance(message.root, ToolListChangedNotification):
+            # Listeners call back into the session, awaiting them here would block the session receive loop
+            for listener in self._tools_changed_listeners:
+                task = asyncio.create_task(listener())
+                self._listener_tasks.add(task)
+                task.add_done_callback(self._listener_tasks.discard)
 
     async def get_tools(self) -> list[MCPToolModel]:
         """Get available tools from MCP server"""
@@ -47,9 +87,43 @@ class MCPClient:
             for tool in result.tools
         ]
 
-    async def call_tool(self, tool_name: str, tool_args: dict[str, Any]) -> Any:
+    async def call_tool(self, tool_name: str, tool_args: dict[str, Any], coalesce: bool = True) -> Any:
         """Call a tool on the MCP server"""
-        result: CallToolResult = await self.session.call_tool(tool_name, tool_args)
+        result = await self.call_tool_timed(tool_name, tool_args, coalesce)
+        return result.content
+
+    async def call_tool_timed(self, tool_name: str, tool_args: dict[str, Any], coalesce: bool = True) -> MCPCallResult:
+        """
+        Call a tool on the MCP server and measure latency.
+
+        Identical in-flight calls (same tool and arguments) are coalesced into a single request to the server
+        (single-flight), distinct calls are sent concurrently over the shared session.
+        Use `coalesce=False` for tools with side effects.
+
+        Cancelled calls are cancelled on the server too, a coalesced call once all of its callers are cancelled.
+        """
+        started = time.perf_counter()
+        with span("mcp_call", server=self.server_url, tool=tool_name) as call_span:
+            if not coalesce:
+                content = await self._call_tool(tool_name, tool_args)
+                return MCPCallResult(content=content, latency_ms=(time.perf_counter() - started) * 1000, coalesced=False)
+
+            key = f"{tool_name}:{json.dumps(tool_args, sort_keys=True, default=str)}"
+            content, coalesced = await self._single_flight.run(key, lambda: self._call_tool(tool_name, tool_args))
+            call_span.set_attribute("coalesced", coalesced)
+            record_cache("mcp_single_flight", coalesced)
+            return MCPCallResult(content=content, latency_ms=(time.perf_counter() - started) * 1000, coalesced=coalesced)
+
+    async def _call_tool(self, tool_name: str, tool_args: dict[str, Any]) -> str:
+        # id the session assigns to the next request, needed to cancel it on the server
+        request_id = getattr(self.session, "_request_id", None)
+        try:
+            result: CallToolResult = await self.session.call_tool(tool_name, tool_args)
+        except asyncio.CancelledError:
+            CANCELLATIONS.inc(operation="mcp_call")
+            if request_id is not None:
+                self._notify_cancelled(request_id)
+            raise
         response_parts = []
         for content in result.content:
             if isinstance(content, TextContent):
@@ -58,6 +132,15 @@ class MCPClient:
                 response_parts.append(str(content))
         return "\n".join(response_parts)
 
+    def _notify_cancelled(self, request_id: int) -> None:
+        """Sends `notifications/cancelled` so the server stops working on the request, without awaiting it."""
+        notification = ClientNotification(CancelledNotification(
+            params=CancelledNotificationParams(requestId=request_id, reason="Client request cancelled")
+        ))
+        task = asyncio.create_task(self.session.send_notification(notification))
+        self._notification_tasks.add(task)
+        task.add_done_callback(self._notification_tasks.discard)
+
     async def get_resource(self, uri: AnyUrl) -> str | bytes:
         """Get specific resource content"""
         result: ReadResourceResult = await self.session.read_resource(uri)
@@ -17,10 +17,13 @@ class MCPTool(BaseTool):
 
     async def _execute(self, tool_call_params: ToolCallParams) -> str | Message:
         arguments = json.loads(tool_call_params.tool_call.function.arguments)
-        content = await self._client.call_tool(self._mcp_tool_model.name, arguments)
+        result = await self._client.call_tool_timed(self._mcp_tool_model.name, arguments)
         stage = tool_call_params.stage
-        stage.append_content(str(content))
-        return str(content)
+        stage.append_content(result.content)
+        stage.append_content(
+            f"\n\r**Latency**: {result.latency_ms:.0f} ms{' (coalesced with identical call)' if result.coalesced else ''}\n\r"
+        )
+        return result.content
 
     @property
     def name(self) -> str:
@@ -1,7 +1,11 @@
 from dataclasses import dataclass
+from typing import Optional
+
 from aidial_sdk.chat_completion import Stage, Choice
 from aidial_client.types.chat.legacy.chat_completion import ToolCall
 
+from task.utils.accounting import RequestAccounting
+
 
 @dataclass
 class ToolCallParams:
@@ -10,3 +14,7 @@ class ToolCallParams:
     choice: Choice
     api_key: str
     conversation_id: str
+    # stable id of the user, None if unknown; the api-key is new on every request
+    user_id: Optional[str] = None
+    # LLM usage and tool calls of the request the tool is called for
+    accounting: Optional[RequestAccounting] = None
@@ -2,7 +2,7 @@ import base64
 import json
 from typing import Any, Optional
 
-from aidial_client import Dial
+from aidial_client import AsyncDial
 from aidial_sdk.chat_completion import Message, Attachment
 from pydantic import StrictStr, AnyUrl
 
@@ -11,6 +11,9 @@ from task.tools.py_interpreter._response import _ExecutionResult
 from task.tools.mcp.mcp_client import MCPClient
 from task.tools.mcp.mcp_tool_model import MCPToolModel
 from task.tools.models import ToolCallParams
+from task.utils.state_store import ConversationStateStore
+
+_SESSION_STATE_KEY = "interpreter_session_id"
 
 
 class PythonCodeInterpreterTool(BaseTool):
@@ -26,13 +29,17 @@ class PythonCodeInterpreterTool(BaseTool):
             mcp_tool_models: list[MCPToolModel],
             tool_name: str,
             dial_endpoint: str,
+            state_store: Optional[ConversationStateStore] = None,
     ):
         """
         :param tool_name: it must be actual name of tool that executes code. It is 'execute_code'.
             https://github.com/khshanovskyi/mcp-python-code-interpreter/blob/main/interpreter/server.py#L303
+        :param state_store: keeps the last kernel session of each conversation, when the model doesn't pass
+            session_id the conversation's kernel is reused instead of starting a new one.
         """
         self.dial_endpoint = dial_endpoint
         self.mcp_client = mcp_client
+        self.state_store = state_store or ConversationStateStore()
         self._code_execute_tool: Optional[MCPToolModel] = None
         for tool_model in mcp_tool_models:
             if tool_model.name == tool_name:
@@ -47,11 +54,18 @@ class PythonCodeInterpreterTool(BaseTool):
             mcp_url: str,
             tool_name: str,
             dial_endpoint: str,
+            state_store: Optional[ConversationStateStore] = None,
     ) -> 'PythonCodeInterpreterTool':
         """Async factory method to create PythonCodeInterpreterTool"""
         mcp_client = await MCPClient.create(mcp_url)
         tools = await mcp_client.get_tools()
-        return cls(mcp_client=mcp_client, mcp_tool_models=tools, tool_name=tool_name, dial_endpoint=dial_endpoint)
+        return cls(
+            mcp_client=mcp_client,
+            mcp_tool_models=tools,
+            tool_name=tool_name,
+            dial_endpoint=dial_endpoint,
+            state_store=state_store,
+        )
 
     @property
     def show_in_stage(self) -> bool:
@@ -74,6 +88,10 @@ class PythonCodeInterpreterTool(BaseTool):
         code = arguments.get("code", "")
         session_id = arguments.get("session_id")
         stage = tool_call_params.stage
+        conversation_id = tool_call_params.conversation_id
+
+        if not session_id and conversation_id:
+            session_id = await self.state_store.get(conversation_id, _SESSION_STATE_KEY)
 
         stage.append_content("## Request arguments: \n")
         stage.append_content(f"```python\n\r{code}\n\r```\n\r")
@@ -87,13 +105,17 @@ class PythonCodeInterpreterTool(BaseTool):
         if session_id:
             tool_args["session_id"] = session_id
 
-        result = await self.mcp_client.call_tool(self._code_execute_tool.name, tool_args)
+        # code execution is stateful, identical snippets must run as many times as requested
+        result = await self.mcp_client.call_tool(self._code_execute_tool.name, tool_args, coalesce=False)
         result_json = json.loads(result)
         execution_result = _ExecutionResult.model_validate(result_json)
+        if execution_result.session_info and conversation_id:
+            await self.state_store.set(conversation_id, _SESSION_STATE_KEY, execution_result.session_info.session_id)
 
         if execution_result.files:
-            dial_client = Dial(base_url=self.dial_endpoint, api_key=tool_call_params.api_key)
-            files_home = dial_client.my_appdata_home
+            # async client: uploads don't block the event loop and stop once the request is cancelled
+            dial_client = AsyncDial(base_url=self.dial_endpoint, api_key=tool_call_params.api_key)
+            files_home = await dial_client.my_appdata_home()
             for file_ref in execution_result.files:
                 file_name = file_ref.name
                 mime_type = file_ref.mime_type
@@ -105,7 +127,7 @@ class PythonCodeInterpreterTool(BaseTool):
                     file_bytes = base64.b64decode(resource) if isinstance(resource, str) else resource
 
                 upload_url = f"files/{(files_home / file_name).as_posix()}"
-                dial_client.files.upload(upload_url, file_bytes, mime_type)
+                await dial_client.files.upload(upload_url, (file_name, file_bytes, mime_type))
 
                 attachment = Attachment(
                     url=upload_url,
@@ -0,0 +1,172 @@
+import logging
+import re
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from task.tools.rag.embedding_service import EMBEDDING_MODEL_NAME
+
+logger = logging.getLogger(__name__)
+
+# token counts of a batch of texts, without special tokens
+TokenCounter = Callable[[list[str]], list[int]]
+
+# sentence ends followed by whitespace, or line breaks
+_SENTENCE_BOUNDARY = re.compile(r"(?:(?<=[.!?])[ \t]|\n)\s*")
+_WORD = re.compile(r"\S+")
+# BERT pre-tokenization: runs of letters and digits, every punctuation character on its own
+_PRE_TOKEN = re.compile(r"[^\W_]+|[^\w\s]|_")
+# rough WordPiece approximation when the tokenizer is unavailable: short words, pieces of long ones, punctuation
+_ESTIMATED_TOKEN = re.compile(r"[^\W_]{1,6}|[^\w\s]|_")
+# sentences are counted in batches, new words of a batch are tokenized together
+_COUNT_BATCH_SIZE = 256
+_MAX_CACHED_WORDS = 200_000
+
+
+def estimate_tokens(texts: list[str]) -> list[int]:
+    return [len(_ESTIMATED_TOKEN.findall(text)) for text in texts]
+
+
+def load_tokenizer(model_name: str = EMBEDDING_MODEL_NAME) -> Optional[TokenCounter]:
+    """
+    Token counter of the embedding model's fast tokenizer. Only `tokenizers` is imported, not transformers
+    or torch, so workers using the shared embedding process can count tokens too.
+    Returns None when the tokenizer can't be loaded (e.g. offline without cached model).
+    """
+    try:
+        from tokenizers import Tokenizer
+
+        path = Path(model_name)
+        if (path / "tokenizer.json").is_file():
+            tokenizer = Tokenizer.from_file(str(path / "tokenizer.json"))
+        elif (path / "vocab.txt").is_file():
+            from tokenizers.implementations import BertWordPieceTokenizer
+            from tokenizers.models import WordPiece
+            tokenizer = BertWordPieceTokenizer(WordPiece.read_file(str(path / "vocab.txt")), lowercase=True)
+        else:
+            from huggingface_hub import hf_hub_download
+            repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+            tokenizer = Tokenizer.from_file(hf_hub_download(repo_id, "tokenizer.json"))
+    except Exception as e:
+        logger.warning(f"Tokenizer of {model_name} is not available, token counts are estimated: {e}")
+        return None
+
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return _WordTokenCounter(tokenizer)
+
+
+class _WordTokenCounter:
+    """
+    Counts tokens as the sum of token counts of pre-tokenized words. It matches WordPiece tokenizers except
+    for rare symbols split off as separate words, so counts may only be slightly higher. Word counts are cached: natural text reuses a small vocabulary, so only new words reach the tokenizer,
+    several times faster than tokenizing the whole text.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.word_tokens: dict[str, int] = {}
+
+    def __call__(self, texts: list[str]) -> list[int]:
+        words = [_PRE_TOKEN.findall(text) for text in texts]
+        new_words = list({word for text_words in words for word in text_words if word not in self.word_tokens})
+        if new_words:
+            if len(self.word_tokens) + len(new_words) > _MAX_CACHED_WORDS:
+                self.word_tokens.clear()
+            encodings = self.tokenizer.encode_batch(new_words, add_special_tokens=False)
+            self.word_tokens.update(zip(new_words, (len(encoding.ids) for encoding in encodings)))
+        word_tokens = self.word_tokens.__getitem__
+        return [sum(map(word_tokens, text_words)) for text_words in words]
+
+
+class TextChunker:
+    """
+    Splits text into chunks of whole sentences that fit the embedding model's input window, so no chunk is
+    silently truncated by the model. Consecutive chunks share trailing sentences up to `overlap_tokens`.
+    Sentences longer than the window are split by words. Chunks are produced lazily while scanning the text.
+    """
+
+    def __init__(
+            self,
+            max_tokens: int = 128,
+            overlap_tokens: int = 16,
+            count_tokens: Optional[TokenCounter] = None,
+    ):
+        """
+        :param max_tokens: chunk size limit in model tokens without special tokens,
+            all-MiniLM-L6-v2 reads at most 254 of them
+        :param count_tokens: token counter of the embedding model, e.g. from `load_tokenizer`,
+            `estimate_tokens` if None
+        """
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be less than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count_tokens = count_tokens or estimate_tokens
+
+    def split_text(self, text: str) -> list[str]:
+        return [text[start:end] for start, end in self.spans(text)]
+
+    def chunks(self, text: str) -> Iterator[str]:
+        for start, end in self.spans(text):
+            yield text[start:end]
+
+    def spans(self, text: str) -> Iterator[tuple[int, int]]:
+        """Yields (start, end) character offsets of the chunks in `text`."""
+        window: list[tuple[int, int, int]] = []
+        window_tokens = 0
+        for start, end, tokens in self._units(text):
+            if window and window_tokens + tokens > self.max_tokens:
+                yield window[0][0], window[-1][1]
+                # keep the longest sentence-aligned tail within the overlap for the next chunk
+                while window and (window_tokens > self.overlap_tokens or window_tokens + tokens > self.max_tokens):
+                    window_tokens -= window.pop(0)[2]
+            window.append((start, end, tokens))
+            window_tokens += tokens
+        if window:
+            yield window[0][0], window[-1][1]
+
+    def _units(self, text: str) -> Iterator[tuple[int, int, int]]:
+        """Sentences with their token counts, sentences longer than `max_tokens` are broken into word runs."""
+        batch: list[tuple[int, int]] = []
+        for span in self._sentences(text):
+            batch.append(span)
+            if len(batch) == _COUNT_BATCH_SIZE:
+                yield from self._counted(text, batch)
+                batch = []
+        yield from self._counted(text, batch)
+
+    def _counted(self, text: str, spans: list[tuple[int, int]]) -> Iterator[tuple[int, int, int]]:
+        if not spans:
+            return
+        for (start, end), tokens in zip(spans, self.count_tokens([text[start:end] for start, end in spans])):
+            if tokens <= self.max_tokens:
+                yield start, end, tokens
+            else:
+                yield from self._split_sentence(text, start, end)
+
+    def _split_sentence(self, text: str, start: int, end: int) -> Iterator[tuple[int, int, int]]:
+        words = [(match.start(), match.end()) for match in _WORD.finditer(text, start, end)]
+        run_start, run_end, run_tokens = -1, -1, 0
+        for (word_start, word_end), tokens in zip(
+                words, self.count_tokens([text[word_start:word_end] for word_start, word_end in words])
+        ):
+            if run_tokens and run_tokens + tokens > self.max_tokens:
+                yield run_start, run_end, run_tokens
+                run_tokens = 0
+            if not run_tokens:
+                run_start = word_start
+            run_end = word_end
+            # a single word over the limit (e.g. base64) is kept whole, the model truncates only that chunk
+            run_tokens += tokens
+        if run_tokens:
+            yield run_start, run_end, run_tokens
+
+    @staticmethod
+    def _sentences(text: str) -> Iterator[tuple[int, int]]:
+        position = len(text) - len(text.lstrip())
+        for boundary in _SENTENCE_BOUNDARY.finditer(text):
+            if boundary.start() > position:
+                yield position, boundary.start()
+            position = boundary.end()
+        if position < len(text) and text[position:].strip():
+            yield position, len(text.rstrip())
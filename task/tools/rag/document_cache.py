@@ -1,7 +1,10 @@
+import logging
 from datetime import datetime, time, timedelta
 from typing import Any, Tuple
 import threading
 
+logger = logging.getLogger(__name__)
+
 
 class DocumentCache:
     """
@@ -41,13 +44,17 @@ class DocumentCache:
                     del self._cache[key]
             return None
 
+    async def aget(self, key: str) -> Tuple[Any, Any] | None:
+        """Same as `get`, for callers on the event loop: subclasses loading entries from elsewhere don't block it."""
+        return self.get(key)
+
     def set(self, key: str, index: Any, chunks: Any) -> None:
         """
         Store an entry in the cache.
 
         Args:
             key: Cache key
-            index: FAISS index
+            index: Search index (`HybridIndex`)
             chunks: Document chunks
         """
         with self._lock:
@@ -79,7 +86,7 @@ class DocumentCache:
 
             removed_count = len(keys_to_remove)
             if removed_count > 0:
-                print(f"[DocumentCache] Cleaned up {removed_count} expired entries at {now}")
+                logger.info("Cleaned up expired document cache entries", extra={"removed": removed_count})
 
             return removed_count
 
@@ -108,7 +115,7 @@ class DocumentCache:
                 name="DocumentCache-Cleanup"
             )
             self._cleanup_thread.start()
-            print("[DocumentCache] Started automatic cleanup thread (runs at midnight)")
+            logger.info("Started document cache cleanup thread (runs at midnight)")
 
     def stop_cleanup_task(self) -> None:
         """Stop the background cleanup thread."""
@@ -117,7 +124,7 @@ class DocumentCache:
             self._stop_event.set()
             if self._cleanup_thread and self._cleanup_thread.is_alive():
                 self._cleanup_thread.join(timeout=5)
-            print("[DocumentCache] Stopped automatic cleanup thread")
+            logger.info("Stopped document cache cleanup thread")
 
     def size(self) -> int:
         """Return the number of cached entries."""
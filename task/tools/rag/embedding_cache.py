@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+from task.utils.telemetry import record_cache
+
+logger = logging.getLogger(__name__)
+
+# encode() arguments that don't change produced vectors, other arguments bypass the cache
+_NEUTRAL_ENCODE_ARGS = {"batch_size", "show_progress_bar"}
+
+
+class EmbeddingCache:
+    """
+    Chunk embeddings keyed by hash of model id and chunk text: bounded in-memory LRU
+    in front of an optional SQLite store on disk that survives restarts and is shared by worker processes.
+    """
+
+    def __init__(self, max_entries: int = 50_000, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            logger.info("Using disk embedding cache", extra={"path": disk_path})
+
+    @staticmethod
+    def key(model_id: str, text: str) -> str:
+        return hashlib.sha256(f"{model_id}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        found: dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = vector
+            missing = [key for key in keys if key not in found]
+            if self._db and missing:
+                for start in range(0, len(missing), 500):
+                    batch = missing[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                    ).fetchall()
+                    for key, blob in rows:
+                        found[key] = np.frombuffer(blob, dtype='float32')
+                        self._remember(key, found[key])
+        return found
+
+    def put_many(self, items: dict[str, np.ndarray]) -> None:
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+            if self._db and items:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, np.asarray(vector, dtype='float32').tobytes()) for key, vector in items.items()],
+                )
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class CachedEmbeddingModel:
+    """
+    Wraps an embedding model with `SentenceTransformer.encode` interface: only texts missing in the cache are
+    embedded, so re-indexing an edited document embeds only its new chunks.
+    """
+
+    def __init__(self, model: Any, model_id: str, cache: EmbeddingCache):
+        """
+        :param model_id: identifies the model and its backend, vectors of different models never mix
+        """
+        self.model = model
+        self.model_id = model_id
+        self.cache = cache
+
+    def encode(self, sentences: list[str] | str, **kwargs) -> np.ndarray:
+        if isinstance(sentences, str) or set(kwargs) - _NEUTRAL_ENCODE_ARGS:
+            return self.model.encode(sentences, **kwargs)
+
+        if not sentences:
+            return np.asarray(self.model.encode(sentences, **kwargs), dtype='float32')
+
+        keys = [EmbeddingCache.key(self.model_id, sentence) for sentence in sentences]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+        misses = sum(key not in found for key in keys)
+        record_cache("embedding", True, count=len(keys) - misses)
+        record_cache("embedding", False, count=misses)
+
+        missing = {key: sentence for key, sentence in zip(keys, sentences) if key not in found}
+        if missing:
+            vectors = np.asarray(self.model.encode(list(missing.values()), **kwargs), dtype='float32')
+            computed = dict(zip(missing, vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return np.stack([found[key] for key in keys])
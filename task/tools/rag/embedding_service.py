@@ -0,0 +1,161 @@
+import logging
+import multiprocessing
+import os
+import platform
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+# Set for worker processes, they connect to the shared embedding process instead of loading the model
+EMBEDDING_SERVICE_ADDRESS_ENV = 'EMBEDDING_SERVICE_ADDRESS'
+EMBEDDING_SERVICE_AUTHKEY_ENV = 'EMBEDDING_SERVICE_AUTHKEY'
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+# pause before reconnecting to the embedding service, so a restarting service can come up
+_RECONNECT_DELAY_SECONDS = 0.5
+# int8 ONNX exports published with all-MiniLM-L6-v2, chosen by CPU architecture
+_ONNX_INT8_FILES = {"x86_64": "onnx/model_qint8_avx2.onnx", "AMD64": "onnx/model_qint8_avx2.onnx"}
+_ONNX_INT8_DEFAULT_FILE = "onnx/model_qint8_arm64.onnx"
+
+
+def load_sentence_transformer(model_name: str = EMBEDDING_MODEL_NAME, backend: str = "torch") -> Any:
+    """
+    Loads embedding model on CPU with one of the backends, all of them produce vectors of the same space:
+    - torch: full precision PyTorch (default);
+    - torch-int8: PyTorch with dynamic int8 quantization of linear layers, no extra dependencies;
+    - onnx: ONNX Runtime, requires `sentence-transformers[onnx]`;
+    - onnx-int8: ONNX Runtime with the int8 quantized export of the model, requires `sentence-transformers[onnx]`.
+    Recall and throughput of the backends are compared by `benchmarks/embedding_backends.py`.
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+    # imported lazily: torch alone takes hundreds of MB per process, workers using the service don't need it
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        return SentenceTransformer(model_name_or_path=model_name, device='cpu', backend="onnx")
+    if backend == "onnx-int8":
+        file_name = _ONNX_INT8_FILES.get(platform.machine(), _ONNX_INT8_DEFAULT_FILE)
+        return SentenceTransformer(
+            model_name_or_path=model_name, device='cpu', backend="onnx", model_kwargs={"file_name": file_name}
+        )
+
+    model = SentenceTransformer(model_name_or_path=model_name, device='cpu')
+    if backend == "torch-int8":
+        import torch
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def _handle_connection(connection: Connection, model: Any) -> None:
+    with connection:
+        while True:
+            try:
+                sentences, kwargs = connection.recv()
+            except EOFError:
+                return
+            try:
+                connection.send((True, np.asarray(model.encode(sentences, **kwargs))))
+            except Exception as e:
+                connection.send((False, f"{type(e).__name__}: {e}"))
+
+
+def _serve(address: str, authkey: bytes, model_name: str, backend: str) -> None:
+    model = load_sentence_transformer(model_name, backend)
+    # the socket appears only when the model is loaded, it is used as readiness signal
+    with Listener(address, family='AF_UNIX', authkey=authkey) as listener:
+        while True:
+            connection = listener.accept()
+            threading.Thread(target=_handle_connection, args=(connection, model), daemon=True).start()
+
+
+class EmbeddingService:
+    """
+    One process that holds the embedding model for all agent workers, so N workers don't hold N copies of
+    the model and torch. Workers reach it through a local Unix socket with `RemoteEmbeddingModel`.
+    """
+
+    def __init__(self, address: str, authkey: bytes, process: multiprocessing.Process):
+        self.address = address
+        self.authkey = authkey
+        self._process = process
+
+    @classmethod
+    def start(
+            cls,
+            model_name: str = EMBEDDING_MODEL_NAME,
+            backend: str = "torch",
+            timeout: float = 300,
+    ) -> 'EmbeddingService':
+        address = os.path.join(tempfile.mkdtemp(prefix="agent-embeddings-"), "embeddings.sock")
+        authkey = os.urandom(16)
+        process = multiprocessing.get_context("spawn").Process(
+            target=_serve, args=(address, authkey, model_name, backend), daemon=True, name="EmbeddingService"
+        )
+        process.start()
+
+        deadline = time.monotonic() + timeout
+        while not os.path.exists(address):
+            if not process.is_alive():
+                raise RuntimeError(f"Embedding service exited with code {process.exitcode}")
+            if time.monotonic() > deadline:
+                process.terminate()
+                raise TimeoutError(f"Embedding service is not ready after {timeout}s")
+            time.sleep(0.1)
+        logger.info("Embedding service started", extra={"address": address, "pid": process.pid})
+        return cls(address, authkey, process)
+
+    def export_env(self) -> None:
+        """Makes the service discoverable for worker processes started after this call."""
+        os.environ[EMBEDDING_SERVICE_ADDRESS_ENV] = self.address
+        os.environ[EMBEDDING_SERVICE_AUTHKEY_ENV] = self.authkey.hex()
+
+    def stop(self) -> None:
+        self._process.terminate()
+        self._process.join(timeout=5)
+
+
+class RemoteEmbeddingModel:
+    """Drop-in for `SentenceTransformer.encode` that delegates to `EmbeddingService`, one connection per thread."""
+
+    def __init__(self, address: str, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls) -> Optional['RemoteEmbeddingModel']:
+        address = os.getenv(EMBEDDING_SERVICE_ADDRESS_ENV)
+        if not address:
+            return None
+        return cls(address, bytes.fromhex(os.environ[EMBEDDING_SERVICE_AUTHKEY_ENV]))
+
+    def _connection(self) -> Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            self._local.connection = connection
+        return connection
+
+    def encode(self, sentences: list[str], **kwargs) -> np.ndarray:
+        for attempt in range(2):
+            try:
+                connection = self._connection()
+                connection.send((sentences, kwargs))
+                ok, result = connection.recv()
+                break
+            except (EOFError, OSError):
+                # service is restarting or connection was dropped, reconnect once
+                self._local.connection = None
+                if attempt:
+                    raise
+                time.sleep(_RECONNECT_DELAY_SECONDS)
+        if not ok:
+            raise RuntimeError(f"Embedding service error: {result}")
+        return result
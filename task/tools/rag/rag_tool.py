@@ -1,17 +1,24 @@
+import asyncio
 import json
+import threading
+from contextlib import aclosing
 from typing import Any
 
-import faiss
-import numpy as np
 from aidial_client import AsyncDial
 from aidial_sdk.chat_completion import Message, Role
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
 
 from task.tools.base import BaseTool
 from task.tools.models import ToolCallParams
+from task.tools.rag.chunker import TextChunker, load_tokenizer
 from task.tools.rag.document_cache import DocumentCache
+from task.tools.rag.embedding_service import load_sentence_transformer
+from task.tools.rag.retrieval import HybridIndex, HybridRetriever
+from task.utils.cancellation import CANCELLATIONS
 from task.utils.dial_file_conent_extractor import DialFileContentExtractor
+from task.utils.llm_router import LLMRouter
+from task.utils.prompt_cache import get_cached_tokens
+from task.utils.telemetry import LLM_TOKENS, span, record_cache
+from task.utils.work_pools import WorkPool
 
 _SYSTEM_PROMPT = """
 You are a helpful assistant that answers questions based on the provided context. 
@@ -19,6 +26,15 @@ Use ONLY the information from the provided context to answer the question.
 If the context doesn't contain enough information to fully answer the question, say so clearly.
 Be concise and accurate in your responses.
 """
+_MAX_TOP_K = 10
+# chunks embedded between checks whether indexing was cancelled
+_EMBED_BATCH_SIZE = 64
+
+# generate an answer from retrieved passages with a nested LLM call
+ANSWER_MODE = "answer"
+# return ranked passages with their sources as is, the agent model answers from them without extra LLM round trip
+PASSAGES_MODE = "passages"
+RAG_MODES = (ANSWER_MODE, PASSAGES_MODE)
 
 
 class RagTool(BaseTool):
@@ -27,20 +43,45 @@ class RagTool(BaseTool):
     Supports: PDF, TXT, CSV, HTML.
     """
 
-    def __init__(self, endpoint: str, deployment_name: str, document_cache: DocumentCache):
+    def __init__(
+            self,
+            endpoint: str,
+            deployment_name: str,
+            document_cache: DocumentCache,
+            model: Any = None,
+            chunk_model: Any = None,
+            retriever: HybridRetriever | None = None,
+            mode: str = ANSWER_MODE,
+            chunker: TextChunker | None = None,
+            pool: WorkPool | None = None,
+            llm_router: LLMRouter | None = None,
+    ):
+        """
+        :param model: embedding model with `SentenceTransformer.encode` interface, e.g. `RemoteEmbeddingModel`
+            shared by workers or a quantized backend from `load_sentence_transformer`.
+            Local full precision all-MiniLM-L6-v2 is loaded if None. Embeds search queries.
+        :param chunk_model: embeds document chunks while indexing, e.g. `CachedEmbeddingModel` over `model`,
+            `model` if None
+        :param retriever: hybrid BM25 + vector retriever, top 3 chunks with default settings if None
+        :param mode: default result mode when the model doesn't choose one, `ANSWER_MODE` or `PASSAGES_MODE`
+        :param chunker: splits documents into chunks fitting the embedding model's window,
+            128-token chunks counted with all-MiniLM-L6-v2 tokenizer if None
+        :param pool: threads extracting and indexing documents, 2 threads of its own if None
+        :param llm_router: races and falls back between deployments for answer generation,
+            only `deployment_name` is called if None
+        """
+        if mode not in RAG_MODES:
+            raise ValueError(f"Unknown RAG mode '{mode}', expected one of {RAG_MODES}")
         self.endpoint = endpoint
         self.deployment_name = deployment_name
         self.document_cache = document_cache
-        self.model = SentenceTransformer(
-            model_name_or_path='all-MiniLM-L6-v2',
-            device='cpu'
-        )
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=50,
-            length_function=len,
-            separators=["\n\n", "\n", ". ", " ", ""]
-        )
+        self.model = model or load_sentence_transformer()
+        self.chunk_model = chunk_model or self.model
+        self.retriever = retriever or HybridRetriever()
+        self.mode = mode
+        self.chunker = chunker or TextChunker(count_tokens=load_tokenizer())
+        self.pool = pool or WorkPool("rag", 2)
+        self.llm_router = llm_router
 
     @property
     def show_in_stage(self) -> bool:
@@ -54,8 +95,10 @@ class RagTool(BaseTool):
     def description(self) -> str:
         return (
             "Performs semantic search on uploaded documents to find relevant content and answer questions. "
-            "Supports PDF, TXT, CSV, HTML files. This tool indexes the document, searches for the most relevant "
-            "passages matching the query, and generates an answer based on those passages. "
+            "Supports PDF, TXT, CSV, HTML files. This tool indexes the documents, searches for the most relevant "
+            "passages matching the query, and generates an answer based on those passages "
+            "or returns the passages with their sources in 'passages' mode. "
+            "Pass all files relevant to the question in one call, they are searched together. "
             "Best for answering specific questions about large documents efficiently without reading the entire file. "
             "Prefer this tool over file_content_extraction when asking questions about document content."
         )
@@ -69,44 +112,74 @@ class RagTool(BaseTool):
                     "type": "string",
                     "description": "The search query or question to search for in the document"
                 },
-                "file_url": {
+                "file_urls": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "minItems": 1,
+                    "description": "URLs of the files to search in."
+                },
+                "top_k": {
+                    "type": "integer",
+                    "minimum": 1,
+                    "maximum": _MAX_TOP_K,
+                    "description": "Number of passages to retrieve. Increase it for broad questions instead of "
+                                   "repeating the search."
+                },
+                "mode": {
                     "type": "string",
-                    "description": "The URL of the file to search in."
+                    "enum": list(RAG_MODES),
+                    "description": f"'{ANSWER_MODE}' returns an answer generated from the passages, "
+                                   f"'{PASSAGES_MODE}' returns the passages with source offsets to answer or quote "
+                                   f"from directly. Default is '{self.mode}'."
                 }
             },
-            "required": ["request", "file_url"]
+            "required": ["request", "file_urls"]
         }
 
     async def _execute(self, tool_call_params: ToolCallParams) -> str | Message:
         arguments = json.loads(tool_call_params.tool_call.function.arguments)
         request = arguments["request"]
-        file_url = arguments["file_url"]
+        # `file_url` is the argument of earlier tool versions
+        file_urls = list(dict.fromkeys(arguments.get("file_urls") or [arguments["file_url"]]))
+        top_k = min(int(arguments.get("top_k") or self.retriever.top_k), _MAX_TOP_K)
+        mode = arguments.get("mode") if arguments.get("mode") in RAG_MODES else self.mode
         stage = tool_call_params.stage
 
         stage.append_content("## Request arguments: \n")
         stage.append_content(f"**Request**: {request}\n\r")
-        stage.append_content(f"**File URL**: {file_url}\n\r")
+        for file_url in file_urls:
+            stage.append_content(f"**File URL**: {file_url}\n\r")
 
-        cache_document_key = f"{tool_call_params.conversation_id}:{file_url}"
-        cached_data = self.document_cache.get(cache_document_key)
+        # documents are fetched and indexed concurrently, misses of one file don't wait for the others
+        loaded = await asyncio.gather(*(self._get_document(file_url, tool_call_params) for file_url in file_urls))
+        documents = []
+        for file_url, document in zip(file_urls, loaded):
+            if document:
+                documents.append((file_url, *document))
+            else:
+                stage.append_content(f"Error: File content not found: {file_url}\n")
+        if not documents:
+            return "Error: File content not found."
 
-        if cached_data:
-            index, chunks = cached_data
-        else:
-            extractor = DialFileContentExtractor(self.endpoint, tool_call_params.api_key)
-            text_content = extractor.extract_text(file_url)
-            if not text_content:
-                stage.append_content("Error: File content not found.\n")
-                return "Error: File content not found."
-            chunks = self.text_splitter.split_text(text_content)
-            embeddings = self.model.encode(chunks)
-            index = faiss.IndexFlatL2(384)
-            index.add(np.array(embeddings).astype('float32'))
-            self.document_cache.set(cache_document_key, index, chunks)
+        with span("rag_search", top_k=top_k, documents=len(documents)):
+            with span("rag_embed", texts=1):
+                query_embedding = await self.pool.run(self.model.encode, [request])
+            # BM25 over postings and MMR are CPU work like the embedding, they stay off the event loop too
+            hits = await self.pool.run(
+                self.retriever.search_many, [index for _, index, _ in documents], query_embedding, request, top_k
+            )
+        retrieved_chunks = [
+            (documents[position][0], documents[position][2][chunk_id]) for position, chunk_id in hits
+        ]
 
-        query_embedding = self.model.encode([request]).astype('float32')
-        distances, indices = index.search(query_embedding, k=3)
-        retrieved_chunks = [chunks[idx] for idx in indices[0]]
+        if mode == PASSAGES_MODE:
+            passages = self.__passages([
+                (file_url, chunk, documents[position][1].offset(chunk_id))
+                for (file_url, chunk), (position, chunk_id) in zip(retrieved_chunks, hits)
+            ])
+            stage.append_content("## Passages: \n")
+            stage.append_content(f"```text\n\r{passages}\n\r```\n\r")
+            return passages
 
         augmented_prompt = self.__augmentation(request, retrieved_chunks)
 
@@ -115,28 +188,110 @@ class RagTool(BaseTool):
         stage.append_content("## Response: \n")
 
         client = AsyncDial(base_url=self.endpoint, api_key=tool_call_params.api_key)
-        chunks_response = await client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": _SYSTEM_PROMPT},
-                {"role": "user", "content": augmented_prompt}
-            ],
-            stream=True,
-            deployment_name=self.deployment_name,
-            api_version="2025-01-01-preview"
-        )
+
+        def open_stream(deployment: str):
+            return client.chat.completions.create(
+                messages=[
+                    {"role": "system", "content": _SYSTEM_PROMPT},
+                    {"role": "user", "content": augmented_prompt}
+                ],
+                stream=True,
+                deployment_name=deployment,
+                api_version="2025-01-01-preview"
+            )
+
+        if self.llm_router:
+            chunks_response = await self.llm_router.stream(open_stream)
+            deployment_name = chunks_response.deployment
+        else:
+            chunks_response = await open_stream(self.deployment_name)
+            deployment_name = self.deployment_name
 
         collected_content = ""
-        async for chunk in chunks_response:
-            if chunk.choices:
-                delta = chunk.choices[0].delta
-                if delta and delta.content:
-                    stage.append_content(delta.content)
-                    collected_content += delta.content
+        usage = None
+        async with aclosing(chunks_response):
+            async for chunk in chunks_response:
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices:
+                    delta = chunk.choices[0].delta
+                    if delta and delta.content:
+                        stage.append_content(delta.content)
+                        collected_content += delta.content
+
+        if self.llm_router:
+            chunks_response.record_abandoned(usage, tool_call_params.accounting)
+        if usage:
+            LLM_TOKENS.inc(usage.prompt_tokens, deployment=deployment_name, type="prompt")
+            LLM_TOKENS.inc(usage.completion_tokens, deployment=deployment_name, type="completion")
+        if tool_call_params.accounting:
+            tool_call_params.accounting.record_llm_call(
+                deployment_name,
+                prompt_tokens=usage.prompt_tokens if usage else 0,
+                completion_tokens=usage.completion_tokens if usage else 0,
+                cached_tokens=get_cached_tokens(usage) if usage else 0,
+            )
 
         return collected_content
 
-    def __augmentation(self, request: str, chunks: list[str]) -> str:
-        context = "\n\n---\n\n".join(chunks)
+    async def _get_document(
+            self, file_url: str, tool_call_params: ToolCallParams
+    ) -> tuple[HybridIndex, list[str]] | None:
+        """
+        Returns cached index and chunks of the document, extracts and indexes it on cache miss.
+        Indexing runs in the RAG work pool to keep the event loop responsive; when the tool call is cancelled
+        the thread stops at the next embedding batch instead of indexing a document nobody waits for.
+        """
+        cache_document_key = f"{tool_call_params.conversation_id}:{file_url}"
+        cached_data = await self.document_cache.aget(cache_document_key)
+        record_cache("rag_document", cached_data is not None)
+        if cached_data:
+            return cached_data
+
+        cancelled = threading.Event()
+        try:
+            return await self.pool.run(
+                self._index_document, cache_document_key, file_url, tool_call_params.api_key, cancelled
+            )
+        except asyncio.CancelledError:
+            cancelled.set()
+            CANCELLATIONS.inc(operation="rag_index")
+            raise
+
+    def _index_document(
+            self, cache_document_key: str, file_url: str, api_key: str, cancelled: threading.Event
+    ) -> tuple[HybridIndex, list[str]] | None:
+        with span("rag_index") as index_span:
+            extractor = DialFileContentExtractor(self.endpoint, api_key)
+            text_content = extractor.extract_text(file_url)
+            if not text_content or cancelled.is_set():
+                return None
+            spans = list(self.chunker.spans(text_content))
+            chunks = [text_content[start:end] for start, end in spans]
+            index_span.set_attribute("chunks", len(chunks))
+            embeddings = []
+            with span("rag_embed", texts=len(chunks)):
+                for start in range(0, len(chunks), _EMBED_BATCH_SIZE):
+                    if cancelled.is_set():
+                        return None
+                    embeddings.extend(self.chunk_model.encode(chunks[start:start + _EMBED_BATCH_SIZE]))
+            index = HybridIndex.build(embeddings, chunks, [start for start, _ in spans])
+            self.document_cache.set(cache_document_key, index, chunks)
+        return index, chunks
+
+    def __passages(self, passages: list[tuple[str, str, int]]) -> str:
+        blocks = []
+        for number, (file_url, chunk, offset) in enumerate(passages, start=1):
+            location = f", characters {offset}-{offset + len(chunk)}" if offset >= 0 else ""
+            blocks.append(f"[{number}] Source: {file_url}{location}\n{chunk}")
+        return "\n\n---\n\n".join(blocks)
+
+    def __augmentation(self, request: str, chunks: list[tuple[str, str]]) -> str:
+        sources = {file_url for file_url, _ in chunks}
+        if len(sources) > 1:
+            context = "\n\n---\n\n".join(f"Source: {file_url}\n{chunk}" for file_url, chunk in chunks)
+        else:
+            context = "\n\n---\n\n".join(chunk for _, chunk in chunks)
         return f"""Based on the following context, answer the question.
 
 Context:
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import logging
+from typing import Any, Tuple
+
+import faiss
+import numpy as np
+from redis import Redis
+
+from task.tools.rag.document_cache import DocumentCache
+from task.tools.rag.retrieval import HybridIndex
+
+logger = logging.getLogger(__name__)
+
+_INDEX_FIELD = "index"
+_CHUNKS_FIELD = "chunks"
+_OFFSETS_FIELD = "offsets"
+
+
+class RedisDocumentCache(DocumentCache):
+    """
+    Document cache shared by agent replicas: serialized FAISS indexes and chunks are stored in Redis
+    with 24 hours TTL, so a conversation that hops to another replica doesn't re-embed its documents.
+    BM25 part of `HybridIndex` is rebuilt from chunks on load.
+    Deserialized entries are kept in the in-process cache in front of Redis. The client is synchronous: `aget` loads
+    and deserializes in a thread, `set` is called from the indexing thread.
+    """
+
+    def __init__(self, client: Redis, prefix: str = "agent:document", ttl_seconds: int = 24 * 60 * 60):
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    @classmethod
+    def create(cls, url: str) -> 'RedisDocumentCache':
+        instance = cls(Redis.from_url(url))
+        instance.start_cleanup_task()
+        logger.info("Using Redis document cache", extra={"url": url})
+        return instance
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def get(self, key: str) -> Tuple[Any, Any] | None:
+        cached = super().get(key)
+        if cached is not None:
+            return cached
+        return self._load(key)
+
+    async def aget(self, key: str) -> Tuple[Any, Any] | None:
+        cached = super().get(key)
+        if cached is not None:
+            return cached
+        return await asyncio.to_thread(self._load, key)
+
+    def _load(self, key: str) -> Tuple[Any, Any] | None:
+        stored = self.client.hgetall(self._key(key))
+        if not stored:
+            return None
+        vectors = faiss.deserialize_index(np.frombuffer(stored[_INDEX_FIELD.encode()], dtype=np.uint8))
+        chunks = json.loads(stored[_CHUNKS_FIELD.encode()])
+        offsets = json.loads(stored.get(_OFFSETS_FIELD.encode(), b"[]"))
+        index = HybridIndex.from_vectors(vectors, chunks, offsets)
+        super().set(key, index, chunks)
+        return index, chunks
+
+    def set(self, key: str, index: HybridIndex, chunks: Any) -> None:
+        super().set(key, index, chunks)
+        redis_key = self._key(key)
+        with self.client.pipeline() as pipe:
+            pipe.hset(redis_key, mapping={
+                _INDEX_FIELD: faiss.serialize_index(index.vectors).tobytes(),
+                _CHUNKS_FIELD: json.dumps(chunks),
+                _OFFSETS_FIELD: json.dumps(index.offsets),
+            })
+            pipe.expire(redis_key, self.ttl_seconds)
+            pipe.execute()
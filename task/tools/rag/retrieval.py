@@ -0,0 +1,179 @@
+import math
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Optional
+
+import faiss
+import numpy as np
+
+# keeps model numbers, codes and units together: "dw", "395", "co-1", "2450mhz", "e-01"
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Inverted index with Okapi BM25 scoring over document chunks."""
+
+    def __init__(self, chunks: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        lengths = []
+        for chunk_id, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            lengths.append(len(tokens))
+            for term, frequency in Counter(tokens).items():
+                self.postings[term].append((chunk_id, frequency))
+        self.doc_lengths = np.array(lengths, dtype='float32')
+        self.avg_doc_length = float(self.doc_lengths.mean()) if lengths else 0.0
+        self.idf = {
+            term: math.log(1 + (len(chunks) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.doc_lengths), dtype='float32')
+        if not self.avg_doc_length:
+            return scores
+        norms = self.k1 * (1 - self.b + self.b * self.doc_lengths / self.avg_doc_length)
+        for term in set(tokenize(query)):
+            for chunk_id, frequency in self.postings.get(term, ()):
+                scores[chunk_id] += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norms[chunk_id])
+        return scores
+
+
+@dataclass
+class HybridIndex:
+    """FAISS vector index and BM25 inverted index over the same chunks, with chunk offsets in the source text."""
+    vectors: faiss.Index
+    bm25: BM25Index
+    offsets: list[int] = field(default_factory=list)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, chunks: list[str], offsets: Optional[list[int]] = None) -> 'HybridIndex':
+        embeddings = np.asarray(embeddings, dtype='float32')
+        vectors = faiss.IndexFlatL2(embeddings.shape[1])
+        vectors.add(embeddings)
+        return cls(vectors, BM25Index(chunks), offsets or [])
+
+    @classmethod
+    def from_vectors(
+            cls,
+            vectors: faiss.Index,
+            chunks: list[str],
+            offsets: Optional[list[int]] = None,
+    ) -> 'HybridIndex':
+        """Restores the index from a deserialized vector index, BM25 is cheap to rebuild from chunks."""
+        return cls(vectors, BM25Index(chunks), offsets or [])
+
+    def offset(self, chunk_id: int) -> int:
+        return self.offsets[chunk_id] if chunk_id < len(self.offsets) else -1
+
+
+class HybridRetriever:
+    """
+    Retrieves chunks by vector similarity and BM25 at once, fuses both rankings with weighted reciprocal rank
+    fusion and picks final `top_k` with maximal marginal relevance to drop near-duplicate (overlapping) chunks.
+    Exact-term queries such as model numbers or error codes are found by BM25 even when embeddings miss them.
+    """
+
+    def __init__(
+            self,
+            top_k: int = 3,
+            bm25_weight: float = 1.0,
+            mmr_lambda: float = 0.7,
+            candidates_factor: int = 4,
+            rrf_k: int = 60,
+    ):
+        """
+        :param bm25_weight: weight of BM25 ranking against vector ranking, 0 means vector search only
+        :param mmr_lambda: relevance vs diversity trade-off of MMR, 1 disables deduplication
+        :param candidates_factor: each ranking contributes `top_k * candidates_factor` candidates
+        """
+        self.top_k = top_k
+        self.bm25_weight = bm25_weight
+        self.mmr_lambda = mmr_lambda
+        self.candidates_factor = candidates_factor
+        self.rrf_k = rrf_k
+
+    def search(
+            self,
+            index: HybridIndex,
+            query_embedding: np.ndarray,
+            query: str,
+            top_k: Optional[int] = None,
+    ) -> list[int]:
+        """Returns ids of the retrieved chunks ordered by relevance."""
+        return [chunk_id for _, chunk_id in self.search_many([index], query_embedding, query, top_k)]
+
+    def search_many(
+            self,
+            indexes: list[HybridIndex],
+            query_embedding: np.ndarray,
+            query: str,
+            top_k: Optional[int] = None,
+    ) -> list[tuple[int, int]]:
+        """
+        Searches several documents as one merged collection: candidates of all documents are ranked together,
+        so the result is the global top-k rather than top-k of every document.
+
+        :return: (position of the index in `indexes`, chunk id) pairs ordered by relevance
+        """
+        top_k = top_k or self.top_k
+        candidates_limit = top_k * self.candidates_factor
+        query_vector = np.asarray(query_embedding, dtype='float32').reshape(1, -1)
+
+        vector_hits: list[tuple[float, tuple[int, int]]] = []
+        bm25_hits: list[tuple[float, tuple[int, int]]] = []
+        for position, index in enumerate(indexes):
+            candidates_count = min(index.vectors.ntotal, candidates_limit)
+            if not candidates_count:
+                continue
+            distances, vector_ids = index.vectors.search(query_vector, candidates_count)
+            vector_hits.extend(
+                (float(distance), (position, int(chunk_id)))
+                for distance, chunk_id in zip(distances[0], vector_ids[0]) if chunk_id >= 0
+            )
+            if self.bm25_weight:
+                bm25_scores = index.bm25.scores(query)
+                for chunk_id in np.argsort(-bm25_scores)[:candidates_count]:
+                    if bm25_scores[chunk_id] <= 0:
+                        break
+                    bm25_hits.append((float(bm25_scores[chunk_id]), (position, int(chunk_id))))
+
+        fused: dict[tuple[int, int], float] = defaultdict(float)
+        for rank, (_, key) in enumerate(sorted(vector_hits, key=lambda hit: hit[0])[:candidates_limit]):
+            fused[key] += 1 / (self.rrf_k + rank + 1)
+        for rank, (_, key) in enumerate(sorted(bm25_hits, key=lambda hit: -hit[0])[:candidates_limit]):
+            fused[key] += self.bm25_weight / (self.rrf_k + rank + 1)
+
+        ranked = sorted(fused, key=fused.get, reverse=True)
+        if self.mmr_lambda >= 1 or len(ranked) <= 1:
+            return ranked[:top_k]
+        return self._mmr(indexes, ranked, fused, top_k)
+
+    def _mmr(
+            self,
+            indexes: list[HybridIndex],
+            ranked: list[tuple[int, int]],
+            fused: dict[tuple[int, int], float],
+            top_k: int,
+    ) -> list[tuple[int, int]]:
+        embeddings = np.stack([indexes[position].vectors.reconstruct(chunk_id) for position, chunk_id in ranked])
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        similarity = embeddings @ embeddings.T
+        # fused scores are close to each other, min-max scaling makes them comparable with similarities
+        scores = np.array([fused[key] for key in ranked])
+        relevance = (scores - scores.min()) / max(scores.max() - scores.min(), 1e-12)
+
+        selected: list[int] = [0]
+        while len(selected) < min(top_k, len(ranked)):
+            redundancy = similarity[:, selected].max(axis=1)
+            mmr_scores = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * redundancy
+            mmr_scores[selected] = -np.inf
+            selected.append(int(np.argmax(mmr_scores)))
+        return [ranked[position] for position in selected]
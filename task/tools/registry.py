@@ -0,0 +1,116 @@
+import asyncio
+import json
+import logging
+from typing import Iterable, Optional
+
+from aidial_client.types.chat import ToolParam
+
+from task.tools.base import BaseTool
+from task.tools.mcp.mcp_client import MCPClient
+from task.tools.mcp.mcp_tool import MCPTool
+
+logger = logging.getLogger(__name__)
+
+
+class ToolRegistry:
+    """
+    Holds available tools together with their precomputed schemas.
+
+    Schemas are built once per tool instead of on every LLM iteration.
+    Tools of registered MCP servers are re-listed on `tools/list_changed` notifications and, optionally,
+    on a schedule.
+    """
+
+    def __init__(self):
+        self._tools: dict[str, BaseTool] = {}
+        self._schemas: dict[str, ToolParam] = {}
+        # serialized schema sizes in bytes, for estimating prompt tokens of the tools sent
+        self._schema_sizes: dict[str, int] = {}
+        self._mcp_tool_names: dict[MCPClient, list[str]] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def register(self, tool: BaseTool) -> None:
+        schema = tool.schema
+        self._tools[tool.name] = tool
+        self._schemas[tool.name] = schema
+        self._schema_sizes[tool.name] = len(json.dumps(schema, separators=(",", ":")).encode("utf-8"))
+
+    def unregister(self, name: str) -> None:
+        self._tools.pop(name, None)
+        self._schemas.pop(name, None)
+        self._schema_sizes.pop(name, None)
+
+    def get(self, name: str) -> Optional[BaseTool]:
+        return self._tools.get(name)
+
+    @property
+    def tools(self) -> list[BaseTool]:
+        return list(self._tools.values())
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._tools.keys())
+
+    def schemas(self, names: Optional[Iterable[str]] = None) -> list[ToolParam]:
+        """
+        Returns cached schemas.
+
+        Args:
+            names: Optional subset of tool names for current request, schemas follow its order.
+                Unknown names are ignored. All tools in registration order by default
+
+        Returns:
+            List of tool schemas according to DIAL specification
+        """
+        if names is None:
+            return list(self._schemas.values())
+        return [self._schemas[name] for name in names if name in self._schemas]
+
+    def schema_size(self, name: str) -> int:
+        """Size of serialized tool schema in bytes, 0 for unknown tools."""
+        return self._schema_sizes.get(name, 0)
+
+    async def add_mcp_server(self, client: MCPClient) -> None:
+        """Registers all tools of MCP server and keeps them in sync with the server tool list."""
+        self._mcp_tool_names[client] = []
+        await self.refresh_mcp_tools(client)
+        client.on_tools_changed(lambda: self.refresh_mcp_tools(client))
+
+    async def refresh_mcp_tools(self, client: MCPClient) -> None:
+        try:
+            mcp_tools = await client.get_tools()
+        except Exception as e:
+            logger.warning("Unable to refresh MCP tools", extra={"server": client.server_url, "error": str(e)})
+            return
+
+        tools = [MCPTool(client=client, mcp_tool_model=mcp_tool_model) for mcp_tool_model in mcp_tools]
+        current_names = self._mcp_tool_names.get(client, [])
+        if [tool.schema for tool in tools] == [self._schemas.get(name) for name in current_names]:
+            # unchanged, keep schemas (and upstream prompt cache) intact
+            return
+
+        for name in current_names:
+            self.unregister(name)
+        for tool in tools:
+            self.register(tool)
+        self._mcp_tool_names[client] = [tool.name for tool in tools]
+
+    def start_refresh_task(self, interval_seconds: float) -> None:
+        """Starts periodic refresh of MCP tool lists, must be called from running event loop."""
+        if interval_seconds > 0 and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_periodically(interval_seconds))
+
+    async def stop_refresh_task(self) -> None:
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _refresh_periodically(self, interval_seconds: float) -> None:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            for client in list(self._mcp_tool_names):
+                await self.refresh_mcp_tools(client)
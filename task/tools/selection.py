@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import re
+from typing import Any, Callable, Optional
+
+import numpy as np
+from aidial_sdk.chat_completion import Message, Role
+
+from task.tools.base import BaseTool
+from task.tools.models import ToolCallParams
+from task.tools.registry import ToolRegistry
+from task.utils.constants import TOOL_CALL_HISTORY_KEY
+from task.utils.telemetry import METRICS
+from task.utils.work_pools import WorkPool
+
+logger = logging.getLogger(__name__)
+
+# Rough estimation that is good enough for JSON schemas
+_BYTES_PER_TOKEN = 4
+
+DEFAULT_TOOL_KEYWORDS: dict[str, tuple[str, ...]] = {
+    "image_generation": ("image", "picture", "draw", "paint", "illustration", "logo", "photo", "generate an"),
+    "execute_code": (
+        "calculate", "compute", "python", "code", "chart", "plot", "graph", "csv", "statistic", "average",
+        "math", "equation", "analy",
+    ),
+    "file_content_extraction": ("file", "document", "attached", "attachment", "pdf"),
+    "rag_search": ("file", "document", "attached", "attachment", "pdf", "manual"),
+    "search": ("search", "web", "internet", "news", "latest", "today", "current", "weather", "price", "who is"),
+    "fetch_content": ("http://", "https://", "www.", "website", "page", "url", "link"),
+}
+DEFAULT_ATTACHMENT_TOOLS: tuple[str, ...] = ("file_content_extraction", "rag_search")
+
+_SCHEMA_TOKENS = METRICS.counter(
+    "agent_tool_schema_tokens_total", "Estimated tokens of tool schemas per request by outcome.", ("outcome",)
+)
+
+
+class ToolSelector:
+    """
+    Pre-selects tools relevant for the conversation so that only their schemas are sent to the LLM.
+
+    Tool is selected when conversation has attachments it can process, when the last user message contains
+    one of its keywords, when its description is semantically similar to the last user message or when
+    it was already used earlier in the conversation.
+    """
+
+    def __init__(
+            self,
+            tool_registry: ToolRegistry,
+            encode: Optional[Callable[[list[str]], Any]] = None,
+            keywords: Optional[dict[str, tuple[str, ...]]] = None,
+            attachment_tools: tuple[str, ...] = DEFAULT_ATTACHMENT_TOOLS,
+            similarity_threshold: float = 0.35,
+            pool: Optional[WorkPool] = None,
+    ):
+        """
+        :param encode: sentence embedding function, e.g. `SentenceTransformer.encode`. Similarity is skipped if None
+        :param pool: threads running `encode` off the event loop, the default executor if None
+        """
+        self.tool_registry = tool_registry
+        self.encode = encode
+        self.pool = pool
+        self.keywords = keywords if keywords is not None else DEFAULT_TOOL_KEYWORDS
+        self.attachment_tools = attachment_tools
+        self.similarity_threshold = similarity_threshold
+        self._description_embeddings: dict[str, tuple[str, np.ndarray]] = {}
+        self.requests = 0
+        self.schema_tokens_total = 0
+        self.schema_tokens_sent = 0
+
+    async def select(self, messages: list[Message]) -> list[str]:
+        """Returns names of registry tools relevant for the conversation."""
+        available = self.tool_registry.names
+        selected: set[str] = set()
+
+        if any(message.custom_content and message.custom_content.attachments for message in messages):
+            selected.update(self.attachment_tools)
+
+        selected.update(self._used_tools(messages))
+
+        query = self._last_user_message(messages)
+        if query:
+            lowered = query.lower()
+            for name, words in self.keywords.items():
+                if any(word in lowered for word in words):
+                    selected.add(name)
+            selected.update(await self._similar_tools(query, [name for name in available if name not in selected]))
+
+        result = [name for name in available if name in selected]
+        self._record(available, result)
+        return result
+
+    @property
+    def schema_tokens_saved(self) -> int:
+        return self.schema_tokens_total - self.schema_tokens_sent
+
+    def _record(self, available: list[str], selected: list[str]) -> None:
+        total = sum(self.tool_registry.schema_size(name) for name in available) // _BYTES_PER_TOKEN
+        sent = sum(self.tool_registry.schema_size(name) for name in selected) // _BYTES_PER_TOKEN
+        self.requests += 1
+        self.schema_tokens_total += total
+        self.schema_tokens_sent += sent
+        _SCHEMA_TOKENS.inc(sent, outcome="sent")
+        _SCHEMA_TOKENS.inc(total - sent, outcome="saved")
+        logger.info(
+            "Tools pre-selected",
+            extra={
+                "selected": selected,
+                "available": len(available),
+                "schema_tokens_saved": total - sent,
+                "schema_tokens_saved_total": self.schema_tokens_saved,
+            }
+        )
+
+    async def encode_descriptions(self) -> None:
+        """
+        Embeds descriptions of registry tools that were added or changed since the last call, in one batch.
+        Called once tools are registered, later changes (e.g. re-listed MCP tools) are picked up by `select`.
+        """
+        if not self.encode:
+            return
+        descriptions = {tool.name: f"{tool.name}: {tool.description}" for tool in self.tool_registry.tools}
+        stale = {
+            name: description for name, description in descriptions.items()
+            if self._description_embeddings.get(name, ("",))[0] != description
+        }
+        if stale:
+            embeddings = self._normalize(np.asarray(await self._encode(list(stale.values())), dtype='float32'))
+            self._description_embeddings.update(zip(stale, zip(stale.values(), embeddings)))
+
+    async def _similar_tools(self, query: str, candidates: list[str]) -> list[str]:
+        if not self.encode or not candidates:
+            return []
+        await self.encode_descriptions()
+        tool_embeddings = np.stack([self._description_embeddings[name][1] for name in candidates])
+        query_embedding = self._normalize(np.asarray(await self._encode([query]), dtype='float32'))[0]
+        similarities = tool_embeddings @ query_embedding
+        return [name for name, similarity in zip(candidates, similarities) if similarity >= self.similarity_threshold]
+
+    async def _encode(self, texts: list[str]) -> Any:
+        if self.pool:
+            return await self.pool.run(self.encode, texts)
+        return await asyncio.to_thread(self.encode, texts)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    @staticmethod
+    def _last_user_message(messages: list[Message]) -> str:
+        for message in reversed(messages):
+            if message.role == Role.USER and isinstance(message.content, str):
+                return message.content
+        return ""
+
+    @staticmethod
+    def _used_tools(messages: list[Message]) -> set[str]:
+        used = set()
+        for message in messages:
+            if message.role != Role.ASSISTANT or not message.custom_content:
+                continue
+            state = message.custom_content.state
+            if not isinstance(state, dict):
+                continue
+            for history_msg in state.get(TOOL_CALL_HISTORY_KEY) or []:
+                for tool_call in history_msg.get("tool_calls") or []:
+                    used.add(tool_call["function"]["name"])
+        return used
+
+
+class ToolLoaderTool(BaseTool):
+    """
+    Meta tool that lets the model load tools which were not pre-selected for the request.
+    Loaded tools become available on the next LLM iteration.
+    """
+
+    def __init__(self, tool_registry: ToolRegistry, selected_tools: list[str]):
+        """
+        :param selected_tools: tool names of the current request, loaded tools are appended to it
+        """
+        self.tool_registry = tool_registry
+        self.selected_tools = selected_tools
+        # Snapshot keeps schema of this tool identical across iterations, so it doesn't break prompt caching
+        self.loadable_tools = [name for name in tool_registry.names if name not in selected_tools]
+
+    @property
+    def unloaded_tools(self) -> list[str]:
+        return [name for name in self.loadable_tools if name not in self.selected_tools]
+
+    @property
+    def name(self) -> str:
+        return "load_tools"
+
+    @property
+    def description(self) -> str:
+        available = "\n".join(
+            f"- {name}: {self._summary(self.tool_registry.get(name).description)}" for name in self.loadable_tools
+        )
+        return (
+            "Loads additional tools that are not available yet. Call it when none of available tools fits the task, "
+            f"loaded tools can be used right after this call. Tools that can be loaded:\n{available}"
+        )
+
+    @property
+    def parameters(self) -> dict[str, Any]:
+        return {
+            "type": "object",
+            "properties": {
+                "tool_names": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": self.loadable_tools},
+                    "description": "Names of tools to load."
+                }
+            },
+            "required": ["tool_names"]
+        }
+
+    async def _execute(self, tool_call_params: ToolCallParams) -> str | Message:
+        arguments = json.loads(tool_call_params.tool_call.function.arguments)
+        loaded = [name for name in arguments.get("tool_names", []) if name in self.unloaded_tools]
+        self.selected_tools.extend(loaded)
+        tool_call_params.stage.append_content(f"**Loaded tools**: {', '.join(loaded) or 'none'}\n\r")
+        if not loaded:
+            return "No tools were loaded. Pick tool names from the list of tools that can be loaded."
+        return f"Tools {', '.join(loaded)} are loaded and available now."
+
+    @staticmethod
+    def _summary(description: str) -> str:
+        first_sentence = re.split(r"(?<=\.)\s", description.strip(), maxsplit=1)[0]
+        return first_sentence[:200]
@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from typing import Any, Iterator, Optional
+
+from task.utils.telemetry import METRICS, Span, add_cache_listener, add_span_exporter
+
+logger = logging.getLogger(__name__)
+
+REQUEST_LLM_CALLS = METRICS.histogram(
+    "agent_request_llm_calls", "LLM calls made for one request, agent iterations and tools' calls.", (),
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, 24, 32),
+)
+REQUEST_TOOL_CALLS = METRICS.histogram(
+    "agent_request_tool_calls", "Tool calls made for one request.", (),
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32),
+)
+REQUEST_TOKENS = METRICS.histogram(
+    "agent_request_tokens", "LLM tokens consumed by one request across all its LLM calls, by type.", ("type",),
+    buckets=(100, 500, 1000, 2500, 5000, 10_000, 25_000, 50_000, 100_000, 250_000, 1_000_000),
+)
+
+_current_accounting: ContextVar[Optional["RequestAccounting"]] = ContextVar("request_accounting", default=None)
+
+
+@dataclass
+class ModelUsage:
+    calls: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+
+
+@dataclass
+class ToolUsage:
+    calls: int = 0
+    errors: int = 0
+    duration_ms: float = 0.0
+
+
+class RequestAccounting:
+    """
+    Thread-safe account of what one request cost and where its time went: tokens of every LLM call by deployment
+    (agent iterations and tools' own calls), tool calls, cache lookups and time spent in traced stages.
+    LLM usage and tool calls are recorded by the agent and tools it is passed to; while activated, finished spans and
+    recorded cache lookups of the request (including its work pool threads) are added automatically.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.llm_iterations = 0
+        self.models: dict[str, ModelUsage] = {}
+        self.tools: dict[str, ToolUsage] = {}
+        # cache -> [hits, misses]
+        self.caches: dict[str, list[int]] = {}
+        # span name -> [count, total seconds]
+        self.spans: dict[str, list[float]] = {}
+
+    @contextmanager
+    def activate(self) -> Iterator['RequestAccounting']:
+        token = _current_accounting.set(self)
+        try:
+            yield self
+        finally:
+            _current_accounting.reset(token)
+
+    def record_llm_call(
+            self, deployment: str, prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0
+    ) -> None:
+        with self._lock:
+            usage = self.models.setdefault(deployment, ModelUsage())
+            usage.calls += 1
+            usage.prompt_tokens += prompt_tokens
+            usage.cached_tokens += cached_tokens
+            usage.completion_tokens += completion_tokens
+
+    def record_tool_call(self, tool: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            usage = self.tools.setdefault(tool, ToolUsage())
+            usage.calls += 1
+            usage.errors += int(error)
+            usage.duration_ms += seconds * 1000
+
+    def record_cache(self, cache: str, hit: bool, count: int = 1) -> None:
+        with self._lock:
+            self.caches.setdefault(cache, [0, 0])[0 if hit else 1] += count
+
+    def record_span(self, name: str, seconds: float) -> None:
+        with self._lock:
+            stats = self.spans.setdefault(name, [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+
+    def summary(self) -> dict[str, Any]:
+        with self._lock:
+            models = {deployment: asdict(usage) for deployment, usage in self.models.items()}
+            tools = {name: {**asdict(usage), "duration_ms": round(usage.duration_ms, 1)}
+                     for name, usage in self.tools.items()}
+            return {
+                "duration_ms": round((time.perf_counter() - self._started) * 1000, 1),
+                "llm_iterations": self.llm_iterations,
+                "llm_calls": sum(usage["calls"] for usage in models.values()),
+                "prompt_tokens": sum(usage["prompt_tokens"] for usage in models.values()),
+                "cached_tokens": sum(usage["cached_tokens"] for usage in models.values()),
+                "completion_tokens": sum(usage["completion_tokens"] for usage in models.values()),
+                "tool_calls": sum(usage["calls"] for usage in tools.values()),
+                "models": models,
+                "tools": tools,
+                "caches": {cache: {"hits": hits, "misses": misses} for cache, (hits, misses) in self.caches.items()},
+                "spans": {
+                    name: {"count": int(count), "duration_ms": round(seconds * 1000, 1)}
+                    for name, (count, seconds) in self.spans.items()
+                },
+            }
+
+    def to_markdown(self, summary: Optional[dict[str, Any]] = None) -> str:
+        summary = summary or self.summary()
+        lines = [
+            f"**{summary['duration_ms']:.0f} ms**, {summary['llm_iterations']} LLM iterations, "
+            f"{summary['llm_calls']} LLM calls, {summary['tool_calls']} tool calls\n",
+        ]
+        if summary["models"]:
+            lines += ["| Deployment | Calls | Prompt tokens | Cached tokens | Completion tokens |",
+                      "|---|---:|---:|---:|---:|"]
+            lines += [
+                f"| {deployment} | {usage['calls']} | {usage['prompt_tokens']} | {usage['cached_tokens']} "
+                f"| {usage['completion_tokens']} |"
+                for deployment, usage in summary["models"].items()
+            ]
+            lines.append("")
+        if summary["tools"]:
+            lines += ["| Tool | Calls | Errors | Time, ms |", "|---|---:|---:|---:|"]
+            lines += [
+                f"| {name} | {usage['calls']} | {usage['errors']} | {usage['duration_ms']:.0f} |"
+                for name, usage in summary["tools"].items()
+            ]
+            lines.append("")
+        if summary["caches"]:
+            lines += ["| Cache | Hits | Misses |", "|---|---:|---:|"]
+            lines += [
+                f"| {cache} | {stats['hits']} | {stats['misses']} |" for cache, stats in summary["caches"].items()
+            ]
+            lines.append("")
+        if summary["spans"]:
+            lines += ["| Stage | Count | Time, ms |", "|---|---:|---:|"]
+            lines += [
+                f"| {name} | {stats['count']} | {stats['duration_ms']:.0f} |"
+                for name, stats in sorted(summary["spans"].items(), key=lambda item: -item[1]["duration_ms"])
+            ]
+        return "\n".join(lines) + "\n"
+
+    def export(self, summary: Optional[dict[str, Any]] = None) -> None:
+        """Records per-request metrics and logs the summary, so slow or expensive requests can be found in logs."""
+        summary = summary or self.summary()
+        REQUEST_LLM_CALLS.observe(summary["llm_calls"])
+        REQUEST_TOOL_CALLS.observe(summary["tool_calls"])
+        for token_type in ("prompt", "cached", "completion"):
+            REQUEST_TOKENS.observe(summary[f"{token_type}_tokens"], type=token_type)
+        logger.info("Request accounting", extra={"accounting": summary})
+
+
+def _record_span(finished: Span) -> None:
+    accounting = _current_accounting.get()
+    if accounting:
+        accounting.record_span(finished.name, finished.duration)
+
+
+def _record_cache(cache: str, hit: bool, count: int) -> None:
+    accounting = _current_accounting.get()
+    if accounting:
+        accounting.record_cache(cache, hit, count)
+
+
+add_span_exporter(_record_span)
+add_cache_listener(_record_cache)
@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from task.utils.telemetry import METRICS
+
+logger = logging.getLogger(__name__)
+
+QUEUE_WAIT = METRICS.histogram(
+    "agent_queue_wait_seconds", "Time work waited for a free slot: admission of requests or a worker pool.",
+    ("queue",)
+)
+ADMISSION_REJECTED = METRICS.counter(
+    "agent_admission_rejected_total", "Requests rejected with 429 because the queue is full.", ("reason",)
+)
+
+# a key's finish tags are forgotten once they fall behind virtual time, this bounds their number between prunes
+_MAX_TRACKED_KEYS = 1024
+# key of requests whose user is not known
+UNIDENTIFIED_KEY = ""
+
+
+class AdmissionRejected(Exception):
+    """Raised instead of queueing a request when the total or the key's queue is full."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Too many requests: {reason.replace('_', ' ')}")
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    Caps requests processed at once and queues the rest with weighted fair queuing by key (API key or any
+    other header identifying the user): when a slot frees up, the head of the queue whose key has received
+    the least service relative to its weight is admitted (start-time fair queuing). So a user sending dozens
+    of heavy requests waits for their own earlier requests, while other users' requests go ahead of them.
+    A key also holds at most `max_active_per_key` slots, so requests of other keys don't wait behind
+    long-running requests of one key holding all of them.
+
+    Queues are bounded in total and per key, requests over the limits are rejected at once rather than
+    waiting for a timeout. Requests of users who can't be identified share `UNIDENTIFIED_KEY`: it's queued fairly
+    against other keys, but per-key limits don't apply to it since it stands for many users.
+    One controller per process, limits don't account for other workers.
+    """
+
+    def __init__(
+            self,
+            max_concurrent: int,
+            max_queued: int,
+            max_queued_per_key: int,
+            max_active_per_key: Optional[int] = None,
+            weights: Optional[dict[str, float]] = None,
+    ):
+        """
+        :param max_active_per_key: slots one key may hold, all of them if None
+        :param weights: share of slots by key relative to others under contention, 1 by default
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_queued_per_key = max_queued_per_key
+        self.max_active_per_key = max_active_per_key or max_concurrent
+        self.weights = weights or {}
+        self._active = 0
+        self._active_by_key: dict[str, int] = {}
+        self._queued = 0
+        self._queues: dict[str, deque[asyncio.Future]] = {}
+        # virtual time of the last admission and finish tag of the last admitted request per key
+        self._virtual_time = 0.0
+        self._finish_tags: dict[str, float] = {}
+        METRICS.gauge(
+            "agent_admission_requests", "Requests being processed and waiting for admission.", ("state",),
+            lambda: {("active",): self._active, ("queued",): self._queued},
+        )
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @asynccontextmanager
+    async def admit(self, key: str) -> AsyncIterator[None]:
+        """Holds a slot for the block, waits in the key's queue until one is free or raises `AdmissionRejected`."""
+        started = time.perf_counter()
+        await self._acquire(key)
+        QUEUE_WAIT.observe(time.perf_counter() - started, queue="admission")
+        try:
+            yield
+        finally:
+            self._release(key)
+
+    async def _acquire(self, key: str) -> None:
+        # requests queued while slots are free wait for their keys' slots, they aren't ahead of this one
+        if key not in self._queues and self._can_start(key):
+            self._start(key)
+            return
+        queue = self._queues.get(key)
+        if self._queued >= self.max_queued:
+            self._reject(key, "queue_full")
+        if queue is not None and key != UNIDENTIFIED_KEY and len(queue) >= self.max_queued_per_key:
+            self._reject(key, "key_queue_full")
+
+        admitted = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append(admitted)
+        self._queued += 1
+        try:
+            await admitted
+        except asyncio.CancelledError:
+            if admitted.done() and not admitted.cancelled():
+                # admitted right before cancellation, the slot goes to the next request
+                self._release(key)
+            else:
+                self._remove(key, admitted)
+            raise
+
+    def _can_start(self, key: str) -> bool:
+        return self._active < self.max_concurrent and (
+            key == UNIDENTIFIED_KEY or self._active_by_key.get(key, 0) < self.max_active_per_key
+        )
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_concurrent and self._queued:
+            eligible = [key for key in self._queues if self._can_start(key)]
+            if not eligible:
+                return
+            key = min(eligible, key=self._start_tag)
+            queue = self._queues[key]
+            admitted = queue.popleft()
+            if not queue:
+                del self._queues[key]
+            self._queued -= 1
+            self._start(key)
+            admitted.set_result(None)
+
+    def _start(self, key: str) -> None:
+        start = self._start_tag(key)
+        self._virtual_time = start
+        self._finish_tags[key] = start + 1 / self.weights.get(key, 1.0)
+        self._active += 1
+        self._active_by_key[key] = self._active_by_key.get(key, 0) + 1
+        if len(self._finish_tags) > _MAX_TRACKED_KEYS:
+            # keys behind virtual time start from it anyway
+            self._finish_tags = {
+                k: tag for k, tag in self._finish_tags.items() if tag > self._virtual_time or k in self._queues
+            }
+
+    def _release(self, key: str) -> None:
+        self._active -= 1
+        self._active_by_key[key] -= 1
+        if not self._active_by_key[key]:
+            del self._active_by_key[key]
+        self._dispatch()
+
+    def _start_tag(self, key: str) -> float:
+        return max(self._virtual_time, self._finish_tags.get(key, 0.0))
+
+    def _remove(self, key: str, admitted: asyncio.Future) -> None:
+        queue = self._queues.get(key)
+        if queue is None or admitted not in queue:
+            return
+        queue.remove(admitted)
+        if not queue:
+            del self._queues[key]
+        self._queued -= 1
+
+    def _reject(self, key: str, reason: str) -> None:
+        ADMISSION_REJECTED.inc(reason=reason)
+        logger.warning("Request rejected by admission control", extra={
+            "reason": reason,
+            # the key may be a secret
+            "key_hash": hashlib.sha256(key.encode("utf-8")).hexdigest()[:12],
+            "active": self._active,
+            "queued": self._queued,
+        })
+        raise AdmissionRejected(reason)
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Iterator, Optional, TypeVar
+
+from task.utils.telemetry import METRICS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CANCELLATIONS = METRICS.counter(
+    "agent_cancellations_total", "Operations cancelled before completion, e.g. after client disconnect.",
+    ("operation",)
+)
+
+
+@contextmanager
+def count_cancellation(operation: str) -> Iterator[None]:
+    """Counts cancellation of the wrapped block in `agent_cancellations_total{operation}`, re-raising it."""
+    try:
+        yield
+    except asyncio.CancelledError:
+        CANCELLATIONS.inc(operation=operation)
+        raise
+
+
+async def run_until_disconnected(
+        work: Awaitable[T],
+        is_disconnected: Callable[[], Awaitable[bool]],
+        poll_interval: float = 0.25,
+) -> Optional[T]:
+    """
+    Runs `work` as a task while polling the client connection. When the client disconnects (closed tab, stop
+    button, proxy timeout) the task is cancelled and awaited, so LLM streams, tool calls and MCP requests
+    it started are cancelled and cleaned up before this returns None.
+
+    Streaming responses are also cancelled by the SDK on disconnect, but only once it tries to send the next
+    chunk; non-streaming requests would otherwise run to completion.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.create_task(_wait_for_disconnect(is_disconnected, poll_interval))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        CANCELLATIONS.inc(operation="request")
+        task.cancel()
+        await asyncio.wait({task})
+        raise
+    finally:
+        watcher.cancel()
+
+    if task.done():
+        return task.result()
+
+    logger.info("Client disconnected, cancelling request")
+    CANCELLATIONS.inc(operation="request")
+    task.cancel()
+    await asyncio.wait({task})
+    if not task.cancelled() and task.exception():
+        logger.warning("Request failed while cancelling", extra={"error": str(task.exception())})
+    return None
+
+
+async def _wait_for_disconnect(is_disconnected: Callable[[], Awaitable[bool]], poll_interval: float) -> None:
+    while not await is_disconnected():
+        await asyncio.sleep(poll_interval)
@@ -1,2 +1,7 @@
 TOOL_CALL_HISTORY_KEY = "tool_call_history"
-CUSTOM_CONTENT = "custom_content"
\ No newline at end of file
+CUSTOM_CONTENT = "custom_content"
+CUSTOM_FIELDS = "custom_fields"
+CACHE_BREAKPOINT = "cache_breakpoint"
+TOOL_CALL_HISTORY_COMPRESSED_KEY = "tool_call_history_zlib"
+CONTENT_REF_KEY = "content_ref"
+ACCOUNTING_KEY = "accounting"
@@ -1,23 +1,39 @@
 import io
+import logging
 from pathlib import Path
 
-import pdfplumber
 import pandas as pd
 from aidial_client import Dial
-from bs4 import BeautifulSoup
+
+from task.utils.html_extractor import HtmlTextExtractor
+from task.utils.pdf_extractor import PdfTextExtractor
+from task.utils.telemetry import span
+
+logger = logging.getLogger(__name__)
 
 
 class DialFileContentExtractor:
 
-    def __init__(self, endpoint: str, api_key: str):
+    def __init__(
+            self,
+            endpoint: str,
+            api_key: str,
+            pdf_extractor: PdfTextExtractor | None = None,
+            html_extractor: HtmlTextExtractor | None = None,
+    ):
         self.client = Dial(base_url=endpoint, api_key=api_key)
+        self.pdf_extractor = pdf_extractor or PdfTextExtractor()
+        self.html_extractor = html_extractor or HtmlTextExtractor()
 
     def extract_text(self, file_url: str) -> str:
-        downloaded = self.client.files.download(file_url)
-        filename = downloaded.name
-        content = downloaded.content
+        with span("file_download") as download_span:
+            downloaded = self.client.files.download(file_url)
+            content = downloaded.get_content()
+            download_span.set_attribute("bytes", len(content))
+        filename = downloaded.filename
         file_extension = Path(filename).suffix.lower()
-        return self.__extract_text(content, file_extension, filename)
+        with span("file_parse", extension=file_extension):
+            return self.__extract_text(content, file_extension, filename)
 
     def __extract_text(self, file_content: bytes, file_extension: str, filename: str) -> str:
         """Extract text content based on file type."""
@@ -25,23 +41,16 @@ class DialFileContentExtractor:
             if file_extension == '.txt':
                 return file_content.decode('utf-8', errors='ignore')
             elif file_extension == '.pdf':
-                pdf_bytes = io.BytesIO(file_content)
-                with pdfplumber.open(pdf_bytes) as pdf:
-                    pages = [page.extract_text() for page in pdf.pages if page.extract_text()]
-                return '\n'.join(pages)
+                return self.pdf_extractor.extract_text(file_content)
             elif file_extension == '.csv':
                 decoded_text_content = file_content.decode('utf-8', errors='ignore')
                 csv_buffer = io.StringIO(decoded_text_content)
                 df = pd.read_csv(csv_buffer)
                 return df.to_markdown(index=False)
             elif file_extension in ['.html', '.htm']:
-                decoded_html_content = file_content.decode('utf-8', errors='ignore')
-                soup = BeautifulSoup(decoded_html_content, features='html.parser')
-                for script in soup(["script", "style"]):
-                    script.decompose()
-                return soup.get_text(separator='\n', strip=True)
+                return self.html_extractor.extract_text(file_content)
             else:
                 return file_content.decode('utf-8', errors='ignore')
         except Exception as e:
-            print(f"Error extracting text from file: {e}")
+            logger.warning("Error extracting text from file", extra={"file_name": filename, "error": str(e)})
             return ""
@@ -0,0 +1,94 @@
+import codecs
+import os
+from typing import Iterator
+
+from lxml import etree
+
+# Also drop page layout (navigation, header, footer, sidebars, forms) and keep the main content only
+HTML_DROP_LAYOUT = os.getenv('HTML_DROP_LAYOUT', 'false').lower() == 'true'
+
+# subtrees never shown as text: BeautifulSoup-based extraction removed script and style, and its text has no
+# template content
+_SKIPPED_TAGS = frozenset({"script", "style", "template"})
+# nor strings right inside ruby annotations
+_SKIPPED_TEXT_TAGS = frozenset({"rt", "rp"})
+_LAYOUT_TAGS = frozenset({"nav", "header", "footer", "aside", "form", "noscript", "svg", "iframe", "button"})
+_FEED_BYTES = 64 * 1024
+
+
+class HtmlTextExtractor:
+    """
+    Extracts text of HTML pages with lxml's incremental parser: the document is decoded and fed in chunks,
+    text runs are collected as soon as they are complete and parsed elements are dropped, so memory stays
+    proportional to the depth of the page rather than its size. Output is the same as BeautifulSoup's
+    `get_text(separator='\\n', strip=True)` after removing script and style tags: stripped non-empty text runs
+    joined by new lines. Broken markup is recovered like browsers do, so text of misnested tags, CDATA sections,
+    unknown entities and textarea contents may differ from `html.parser`'s (see tests/malformed_page.html).
+    """
+
+    def __init__(self, drop_layout: bool = HTML_DROP_LAYOUT):
+        """
+        :param drop_layout: skip navigation, header, footer, sidebars and forms as boilerplate
+        """
+        self.skipped_tags = _SKIPPED_TAGS | _LAYOUT_TAGS if drop_layout else _SKIPPED_TAGS
+
+    def extract_text(self, content: bytes) -> str:
+        return "\n".join(self.iter_text(content))
+
+    def iter_text(self, content: bytes) -> Iterator[str]:
+        """Stripped non-empty text runs in document order, invalid UTF-8 is ignored."""
+        parser = etree.HTMLPullParser(events=("start", "end", "comment", "pi"), remove_blank_text=False)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        # depth inside skipped subtrees, their events are still reported by the parser
+        skipped_depth = 0
+        for offset in range(0, len(content), _FEED_BYTES):
+            parser.feed(decoder.decode(content[offset:offset + _FEED_BYTES]))
+            skipped_depth = yield from self._read_events(parser, skipped_depth)
+        parser.feed(decoder.decode(b"", final=True))
+        parser.close()
+        yield from self._read_events(parser, skipped_depth)
+
+    def _read_events(self, parser: etree.HTMLPullParser, skipped_depth: int) -> Iterator[str]:
+        for event, element in parser.read_events():
+            if event != "end":
+                # text before the node is complete: the previous sibling's tail or the parent's text
+                if not skipped_depth:
+                    yield from _stripped(_preceding_text(element))
+                if event == "start" and _tag(element) in self.skipped_tags:
+                    skipped_depth += 1
+            else:
+                tag = _tag(element)
+                if skipped_depth:
+                    if tag in self.skipped_tags:
+                        skipped_depth -= 1
+                elif len(element):
+                    yield from _stripped(element[-1].tail)
+                elif tag not in _SKIPPED_TEXT_TAGS:
+                    yield from _stripped(element.text)
+                # text of this subtree is out, only its tail is left to read
+                element.clear(keep_tail=True)
+        return skipped_depth
+
+
+def _tag(element: etree._Element) -> str:
+    return element.tag.lower() if isinstance(element.tag, str) else ""
+
+
+def _preceding_text(element: etree._Element) -> str | None:
+    previous = element.getprevious()
+    if previous is not None:
+        text = previous.tail
+        parent = previous.getparent()
+        # earlier siblings were read, keep the tree shallow
+        while parent is not None and parent[0] is not previous:
+            del parent[0]
+        return text
+    parent = element.getparent()
+    if parent is None or _tag(parent) in _SKIPPED_TEXT_TAGS:
+        return None
+    return parent.text
+
+
+def _stripped(text: str | None) -> Iterator[str]:
+    if text and (text := text.strip()):
+        yield text
@@ -0,0 +1,33 @@
+import base64
+import binascii
+import json
+import os
+from typing import Optional
+
+from aidial_sdk.chat_completion import Request
+
+# Header with a stable user id set by the gateway, the subject of the user's JWT is the user id if not set
+USER_ID_HEADER = os.getenv('USER_ID_HEADER', '').lower()
+
+
+def user_identity(request: Request, header: str = USER_ID_HEADER) -> Optional[str]:
+    """
+    Stable identity of the user behind the request, None if unknown.
+    DIAL Core gives the application a new `api-key` on every request, so the key identifies the request rather than
+    the user. The identity is the value of `header` if configured (e.g. a user or project header set by the gateway),
+    otherwise the subject of the user's JWT that DIAL Core forwards in `authorization`. The token was verified by
+    DIAL Core, only its claims are read here.
+    """
+    if header:
+        # the SDK takes api-key out of request headers
+        return (request.api_key if header == "api-key" else request.headers.get(header)) or None
+    scheme, _, token = (request.jwt or "").partition(" ")
+    parts = token.split(".")
+    if scheme.lower() != "bearer" or len(parts) != 3:
+        return None
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(parts[1] + "=" * (-len(parts[1]) % 4)))
+    except (ValueError, binascii.Error):
+        return None
+    subject = claims.get("sub") if isinstance(claims, dict) else None
+    return str(subject) if subject else None
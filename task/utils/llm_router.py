@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from aidial_client._exception import DialException
+
+from task.utils.accounting import RequestAccounting
+from task.utils.telemetry import LLM_TOKENS, METRICS
+
+logger = logging.getLogger(__name__)
+
+LLM_ATTEMPTS = METRICS.counter(
+    "agent_llm_attempts_total",
+    "LLM stream attempts by outcome: won, lost (hedge cancelled), error, timeout (no first token in time).",
+    ("deployment", "outcome")
+)
+
+# opens a streaming completion on the deployment
+StreamFactory = Callable[[str], Awaitable[AsyncIterator[Any]]]
+
+# client errors are the request's fault, another deployment would reject it too
+_RETRYABLE_CLIENT_STATUSES = (408, 429)
+# hedge delay is the configured quantile of this many recent first token times
+_TTFT_WINDOW = 200
+_MIN_TTFT_SAMPLES = 10
+
+
+class _DeploymentStats:
+
+    def __init__(self, sample_ttl: float):
+        self.sample_ttl = sample_ttl
+        self.ttfts: deque[tuple[float, float]] = deque(maxlen=_TTFT_WINDOW)
+        self.cooldown_until = 0.0
+
+    def observe(self, ttft: float) -> None:
+        self.ttfts.append((time.monotonic(), ttft))
+
+    def recent(self) -> list[float]:
+        """First token times observed within `sample_ttl`, older ones don't tell the current latency."""
+        oldest = time.monotonic() - self.sample_ttl
+        return sorted(ttft for observed, ttft in self.ttfts if observed >= oldest)
+
+    def quantile(self, q: float) -> Optional[float]:
+        samples = self.recent()
+        if len(samples) < _MIN_TTFT_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class RoutedStream:
+    """
+    Stream of the deployment that won the race, chunks received before the first token are replayed.
+    `abandoned` are deployments of attempts cut off after the request was sent (lost the race or sent no first token
+    in time): upstream processed their prompt, but their usage never arrives.
+    """
+
+    def __init__(self, deployment: str, buffered: list[Any], stream: AsyncIterator[Any], abandoned: list[str]):
+        self.deployment = deployment
+        self.abandoned = abandoned
+        self._buffered = buffered
+        self._stream = stream
+
+    def record_abandoned(self, usage: Any, accounting: Optional[RequestAccounting] = None) -> None:
+        """
+        Counts prompt tokens of abandoned attempts, estimated by the winner's usage: all attempts sent the same prompt.
+        Completion tokens of the few chunks they streamed are not known and not counted.
+        """
+        prompt_tokens = usage.prompt_tokens if usage else 0
+        for deployment in self.abandoned:
+            LLM_TOKENS.inc(prompt_tokens, deployment=deployment, type="abandoned_prompt")
+            if accounting:
+                accounting.record_llm_call(deployment, prompt_tokens=prompt_tokens)
+
+    def __aiter__(self) -> AsyncIterator[Any]:
+        return self._chunks()
+
+    async def _chunks(self) -> AsyncIterator[Any]:
+        for chunk in self._buffered:
+            yield chunk
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+class LLMRouter:
+    """
+    Opens LLM streams on an ordered list of deployments:
+    - the first deployment that is not cooling down after a failure and not slow (recent median time to first token
+      over `slow_ttft`) is tried first, the rest in order;
+    - when the first token takes longer than the `hedge_quantile` of recent ones, a hedged request goes to the next
+      deployment, the stream that yields a token first is used and the other one is cancelled;
+    - an attempt that fails or yields no token within `first_token_timeout` puts the deployment on cooldown and
+      the next one is tried, as does losing the race after waiting longer than `slow_ttft`. The last attempt has
+      no first token deadline: nothing is left to fall back to, so a slow answer is better than none.
+
+    With a single deployment there is nothing to race or fall back to: the stream is opened once, without deadline.
+
+    Only the start of the stream is raced: once the first token is streamed to the user the stream is not replaced.
+    Hedging at p95 costs about 5% extra upstream requests.
+    """
+
+    def __init__(
+            self,
+            deployments: list[str],
+            first_token_timeout: float = 20.0,
+            hedge_quantile: float = 0.95,
+            min_hedge_delay: float = 0.5,
+            slow_ttft: Optional[float] = None,
+            cooldown: float = 30.0,
+            max_attempts: Optional[int] = None,
+            sample_ttl: float = 300.0,
+    ):
+        """
+        :param hedge_quantile: quantile of recent first token times after which a hedged request is sent,
+            0 disables hedging. Until there are enough samples the hedge goes after half of `first_token_timeout`
+        :param min_hedge_delay: lower bound of hedge delay, so fast deployments are not hedged on jitter
+        :param slow_ttft: recent median time to first token after which the deployment is tried after others,
+            half of `first_token_timeout` if None
+        :param cooldown: seconds a failed deployment is tried after others
+        :param max_attempts: streams opened for one call including hedges, number of deployments if None
+        :param sample_ttl: first token times older than this are forgotten, so a deployment that has been slow
+            gets traffic again
+        """
+        if not deployments:
+            raise ValueError("At least one deployment is required")
+        self.deployments = deployments
+        self.first_token_timeout = first_token_timeout
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.slow_ttft = slow_ttft if slow_ttft is not None else first_token_timeout / 2
+        self.cooldown = cooldown
+        self.max_attempts = max_attempts or len(deployments)
+        self._stats = {deployment: _DeploymentStats(sample_ttl) for deployment in deployments}
+
+    def ranked(self) -> list[str]:
+        """Deployments in the order they are tried: healthy ones in configured order, then slow, then cooling down."""
+        now = time.monotonic()
+
+        def rank(position: int) -> tuple[bool, bool, int]:
+            stats = self._stats[self.deployments[position]]
+            median = stats.quantile(0.5)
+            return stats.cooldown_until > now, median is not None and median > self.slow_ttft, position
+
+        return [self.deployments[position] for position in sorted(range(len(self.deployments)), key=rank)]
+
+    def hedge_delay(self, deployment: str) -> Optional[float]:
+        if self.hedge_quantile <= 0:
+            return None
+        delay = self._stats[deployment].quantile(self.hedge_quantile)
+        if delay is None:
+            delay = self.first_token_timeout / 2
+        return min(max(delay, self.min_hedge_delay), self.first_token_timeout)
+
+    async def stream(self, open_stream: StreamFactory) -> RoutedStream:
+        """
+        Opens the stream via `open_stream(deployment)` racing deployments as described above.
+        The caller iterates the returned stream and must close it (`aclosing`).
+        """
+        ranked = self.ranked()
+        candidates = [ranked[attempt % len(ranked)] for attempt in range(self.max_attempts)]
+        attempts: dict[asyncio.Task, tuple[str, float]] = {}
+        abandoned: list[str] = []
+        last_error: Optional[BaseException] = None
+        won = False
+
+        def launch() -> Optional[float]:
+            """Starts the next candidate, returns when to hedge it."""
+            deployment = candidates.pop(0)
+            started = time.perf_counter()
+            timeout = self.first_token_timeout if candidates else None
+            attempts[asyncio.create_task(self._open_until_first_token(open_stream, deployment, timeout))] = \
+                deployment, started
+            delay = self.hedge_delay(deployment)
+            return started + delay if delay is not None else None
+
+        hedge_at = launch()
+        try:
+            while attempts:
+                timeout = None
+                if hedge_at is not None and candidates and len(attempts) == 1:
+                    timeout = max(0.0, hedge_at - time.perf_counter())
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # no token within hedge delay: race one more request, the first one keeps going
+                    launch()
+                    hedge_at = None
+                    continue
+                for task in sorted(done, key=lambda t: t.exception() is not None):
+                    deployment, started = attempts.pop(task)
+                    error = task.exception()
+                    if error is None and not won:
+                        won = True
+                        buffered, stream = task.result()
+                        self._stats[deployment].observe(time.perf_counter() - started)
+                        LLM_ATTEMPTS.inc(deployment=deployment, outcome="won")
+                        routed = RoutedStream(deployment, buffered, stream, abandoned)
+                    elif error is None:
+                        # two streams got the first token at once, the other one is not needed
+                        await task.result()[1].aclose()
+                        abandoned.append(deployment)
+                        LLM_ATTEMPTS.inc(deployment=deployment, outcome="lost")
+                    elif _is_request_error(error) and not won:
+                        # the request itself is invalid, other deployments would reject it too
+                        raise error
+                    else:
+                        last_error = error
+                        if isinstance(error, TimeoutError):
+                            abandoned.append(deployment)
+                        self._record_failure(deployment, error)
+                if won:
+                    return routed
+                if not attempts and candidates:
+                    next_hedge_at = launch()
+                    if hedge_at is not None:
+                        hedge_at = next_hedge_at
+        finally:
+            await self._cancel(attempts, abandoned if won else None)
+        raise last_error
+
+    async def _open_until_first_token(
+            self, open_stream: StreamFactory, deployment: str, timeout: Optional[float]
+    ) -> tuple[list[Any], AsyncIterator[Any]]:
+        """Opens the stream and reads it up to the first content or tool call chunk or to the end, within `timeout`."""
+        async with asyncio.timeout(timeout):
+            stream = await open_stream(deployment)
+            buffered = []
+            try:
+                async for chunk in stream:
+                    buffered.append(chunk)
+                    if _is_first_token(chunk):
+                        break
+            except BaseException:
+                await stream.aclose()
+                raise
+        return buffered, stream
+
+    async def _cancel(self, attempts: dict[asyncio.Task, tuple[str, float]], abandoned: Optional[list[str]]) -> None:
+        """
+        Cancels attempts still racing. `abandoned` is given when another one won rather than the call was cancelled,
+        the losers are added to it.
+        """
+        if not attempts:
+            return
+        for task in attempts:
+            task.cancel()
+        await asyncio.wait(attempts)
+        for task, (deployment, started) in attempts.items():
+            if not task.cancelled() and task.exception() is None:
+                # got the first token while being cancelled
+                await task.result()[1].aclose()
+            if abandoned is not None:
+                abandoned.append(deployment)
+                # the loser's first token time is at least this long, keeps slow deployments looking slow
+                waited = time.perf_counter() - started
+                self._stats[deployment].observe(waited)
+                LLM_ATTEMPTS.inc(deployment=deployment, outcome="lost")
+                if waited >= self.slow_ttft:
+                    self._stats[deployment].cooldown_until = time.monotonic() + self.cooldown
+
+    def _record_failure(self, deployment: str, error: BaseException) -> None:
+        timeout = isinstance(error, TimeoutError)
+        LLM_ATTEMPTS.inc(deployment=deployment, outcome="timeout" if timeout else "error")
+        self._stats[deployment].cooldown_until = time.monotonic() + self.cooldown
+        logger.warning("LLM deployment failed, trying the next one", extra={
+            "deployment": deployment,
+            "error": "no first token in time" if timeout else f"{type(error).__name__}: {error}",
+        })
+
+
+def _is_request_error(error: BaseException) -> bool:
+    return isinstance(error, DialException) and 400 <= error.status_code < 500 \
+        and error.status_code not in _RETRYABLE_CLIENT_STATUSES
+
+
+def _is_first_token(chunk: Any) -> bool:
+    if not chunk.choices:
+        return False
+    delta = chunk.choices[0].delta
+    return bool(delta and (delta.content or delta.tool_calls))
@@ -0,0 +1,119 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Iterator, Mapping, Optional
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# Share of requests that log conversation payloads without the debug header, 0..1
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', 0))
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv('LOG_PAYLOAD_MAX_CHARS', 4000))
+LOG_DEBUG_HEADER = os.getenv('LOG_DEBUG_HEADER', 'x-agent-debug').lower()
+
+_ROOT_LOGGER = "task"
+_REDACTED = "***"
+_SECRET_KEYS = {"api_key", "api-key", "authorization", "token", "access_token", "password", "secret"}
+# Inline binary payloads (base64 attachments, images) are never useful in logs
+_BINARY_KEYS = {"data", "blob", "image_url"}
+# Attributes every LogRecord has, everything else was passed via `extra` and is logged as structured field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_payload_logging: ContextVar[bool] = ContextVar("payload_logging", default=False)
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and fields passed via `extra`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def setup_logging() -> None:
+    """
+    Routes `task.*` loggers through a queue: request handlers only enqueue records,
+    formatting and writing to stdout happen on the listener thread. Safe to call several times.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    logger = logging.getLogger(_ROOT_LOGGER)
+    logger.setLevel(LOG_LEVEL)
+    logger.handlers = [QueueHandler(log_queue)]
+    logger.propagate = False
+
+
+@contextmanager
+def request_logging_context(headers: Mapping[str, str]) -> Iterator[bool]:
+    """
+    Enables verbose payload logging (conversation dumps) for the current request
+    if it has debug header or it was sampled by `LOG_PAYLOAD_SAMPLE_RATE`.
+    """
+    enabled = (
+            headers.get(LOG_DEBUG_HEADER, "").lower() in ("1", "true", "yes")
+            or (LOG_PAYLOAD_SAMPLE_RATE > 0 and random.random() < LOG_PAYLOAD_SAMPLE_RATE)
+    )
+    token = _payload_logging.set(enabled)
+    try:
+        yield enabled
+    finally:
+        _payload_logging.reset(token)
+
+
+def payload_logging_enabled() -> bool:
+    return _payload_logging.get()
+
+
+def redact(payload: Any, max_string_chars: int = 1000) -> Any:
+    """Returns copy of payload without secrets and binary data, long strings are truncated."""
+    if isinstance(payload, Mapping):
+        result = {}
+        for key, value in payload.items():
+            lowered = str(key).lower()
+            if lowered in _SECRET_KEYS:
+                result[key] = _REDACTED
+            elif lowered in _BINARY_KEYS and value:
+                result[key] = f"<{len(str(value))} chars omitted>"
+            else:
+                result[key] = redact(value, max_string_chars)
+        return result
+    if isinstance(payload, (list, tuple)):
+        return [redact(item, max_string_chars) for item in payload]
+    if isinstance(payload, str) and len(payload) > max_string_chars:
+        return f"{payload[:max_string_chars]}... ({len(payload) - max_string_chars} chars truncated)"
+    return payload
+
+
+def log_payload(logger: logging.Logger, message: str, payload: Any) -> None:
+    """Logs redacted and size-capped payload, only for requests with payload logging enabled."""
+    if not payload_logging_enabled():
+        return
+    dumped = json.dumps(redact(payload), default=str, ensure_ascii=False)
+    if len(dumped) > LOG_PAYLOAD_MAX_CHARS:
+        dumped = f"{dumped[:LOG_PAYLOAD_MAX_CHARS]}... ({len(dumped) - LOG_PAYLOAD_MAX_CHARS} chars truncated)"
+    logger.info(message, extra={"payload": dumped})
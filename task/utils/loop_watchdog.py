@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from types import FrameType
+from typing import Optional
+
+from task.utils.telemetry import METRICS
+
+logger = logging.getLogger(__name__)
+
+_PACKAGE_DIR = str(Path(__file__).parent.parent)
+_STACK_LIMIT = 15
+
+LOOP_LAG = METRICS.histogram(
+    "agent_event_loop_lag_seconds",
+    "Delay of event loop heartbeat wake-ups.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_BLOCKED = METRICS.counter(
+    "agent_event_loop_blocked_total", "Event loop blocks longer than threshold by call site.", ("site",)
+)
+LOOP_BLOCKED_DURATION = METRICS.histogram(
+    "agent_event_loop_blocked_seconds", "Duration of event loop blocks by call site.", ("site",)
+)
+
+
+class LoopWatchdog:
+    """
+    Detects blocking calls on the asyncio event loop.
+
+    A heartbeat coroutine wakes up every `interval` seconds and records how late it was (loop lag).
+    A watcher thread checks the heartbeat: if the loop hasn't reached it for longer than `threshold` seconds,
+    the stack of the loop thread is captured and the block is counted per call site, i.e. the innermost
+    frame of this package (or the innermost frame at all if the block is outside of it).
+    """
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.02):
+        self.threshold = threshold
+        self.interval = interval
+        self._last_beat = time.perf_counter()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._heartbeat_task is not None
+
+    def start(self) -> None:
+        """Starts watching the running event loop, must be called from it."""
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stop_event.clear()
+        self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watcher = threading.Thread(target=self._watch, daemon=True, name="LoopWatchdog")
+        self._watcher.start()
+        logger.info("Event loop watchdog started", extra={"threshold_ms": self.threshold * 1000})
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self._watcher and self._watcher.is_alive():
+            self._watcher.join(timeout=1)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self._last_beat = now
+            LOOP_LAG.observe(max(0.0, now - started - self.interval))
+
+    def _watch(self) -> None:
+        blocked_site: Optional[str] = None
+        blocked_beat = 0.0
+        while not self._stop_event.wait(self.interval / 2):
+            last_beat = self._last_beat
+            stalled = time.perf_counter() - last_beat
+            if blocked_site is not None and last_beat != blocked_beat:
+                # loop is alive again, the block is over
+                LOOP_BLOCKED_DURATION.observe(last_beat - blocked_beat, site=blocked_site)
+                blocked_site = None
+            if blocked_site is None and stalled > self.threshold:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is None:
+                    continue
+                blocked_site = self._call_site(frame)
+                blocked_beat = last_beat
+                self._record_block(blocked_site, frame, stalled)
+
+    def _record_block(self, site: str, frame: FrameType, stalled: float) -> None:
+        LOOP_BLOCKED.inc(site=site)
+        logger.warning(
+            "Event loop is blocked",
+            extra={
+                "site": site,
+                "blocked_ms": round(stalled * 1000),
+                "stack": "".join(traceback.format_stack(frame, limit=_STACK_LIMIT)),
+            }
+        )
+
+    @staticmethod
+    def _call_site(frame: FrameType) -> str:
+        innermost = frame
+        current: Optional[FrameType] = frame
+        while current is not None:
+            filename = current.f_code.co_filename
+            if filename.startswith(_PACKAGE_DIR) and filename != __file__:
+                innermost = current
+                break
+            current = current.f_back
+        relative = os.path.relpath(innermost.f_code.co_filename, os.path.dirname(_PACKAGE_DIR)) \
+            if innermost.f_code.co_filename.startswith(_PACKAGE_DIR) else innermost.f_code.co_filename
+        return f"{relative}:{innermost.f_lineno} in {innermost.f_code.co_name}"
@@ -0,0 +1,180 @@
+import io
+import logging
+import multiprocessing.context
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, Optional
+
+import pdfplumber
+
+logger = logging.getLogger(__name__)
+
+# worker processes of the shared pool, each idles at a few dozen MB once started
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', 2))
+PDF_PAGES_PER_SHARD = int(os.getenv('PDF_PAGES_PER_SHARD', 8))
+# 0 disables the limit / budget
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', 0))
+PDF_TIME_BUDGET_SECONDS = float(os.getenv('PDF_TIME_BUDGET_SECONDS', 0))
+
+_executors: dict[int, ProcessPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+class _PdfWorkerProcess(multiprocessing.context.SpawnProcess):
+    """
+    Spawned process that doesn't run the parent's main module. Spawned children import `__main__` before
+    unpickling their work, which for `python task/app.py` is the whole agent; PDF workers need only this module.
+    """
+
+    @staticmethod
+    def _Popen(process_obj):
+        # the main module is read only while the child's preparation data is built in Popen()
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            return multiprocessing.context.SpawnProcess._Popen(process_obj)
+        finally:
+            sys.modules["__main__"] = main
+
+
+class _PdfWorkerContext(multiprocessing.context.SpawnContext):
+    # `spawn` avoids forking a process that already runs event loop, torch and cache threads
+    Process = _PdfWorkerProcess
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    """Process pools are expensive to start, so one pool per size is shared for the process lifetime."""
+    with _executors_lock:
+        executor = _executors.get(workers)
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=_PdfWorkerContext())
+            _executors[workers] = executor
+        return executor
+
+
+def _discard_executor(workers: int, executor: ProcessPoolExecutor) -> None:
+    """Forgets a pool broken by a crashed worker, the next call starts a new one."""
+    with _executors_lock:
+        if _executors.get(workers) is executor:
+            del _executors[workers]
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_pages(pdf: bytes | str, start: int, end: int) -> list[str]:
+    """Extracts text of pages in range [start, end) of PDF content or file path. Runs inside worker process."""
+    with pdfplumber.open(io.BytesIO(pdf) if isinstance(pdf, bytes) else pdf) as document:
+        pages = []
+        for page in document.pages[start:end]:
+            text = page.extract_text()
+            if text:
+                pages.append(text)
+        return pages
+
+
+class PdfTextExtractor:
+    """
+    Extracts PDF text in parallel: pages are sharded by range and every shard is parsed in a separate process.
+    Shards are yielded strictly in page order, so callers may consume the text as a stream.
+    """
+
+    def __init__(
+            self,
+            workers: int = PDF_WORKERS,
+            pages_per_shard: int = PDF_PAGES_PER_SHARD,
+            max_pages: int = PDF_MAX_PAGES,
+            time_budget_seconds: float = PDF_TIME_BUDGET_SECONDS,
+    ):
+        """
+        :param workers: size of the process pool, 1 disables parallelism
+        :param pages_per_shard: number of sequential pages parsed by one worker task
+        :param max_pages: only first `max_pages` pages are extracted, 0 means all pages
+        :param time_budget_seconds: per-document budget, shards not ready in time are dropped. 0 means no budget
+        """
+        self.workers = max(1, workers)
+        self.pages_per_shard = max(1, pages_per_shard)
+        self.max_pages = max_pages
+        self.time_budget_seconds = time_budget_seconds
+
+    def count_pages(self, pdf_content: bytes) -> int:
+        with pdfplumber.open(io.BytesIO(pdf_content)) as pdf:
+            total = len(pdf.pages)
+        return min(total, self.max_pages) if self.max_pages > 0 else total
+
+    def iter_pages(self, pdf_content: bytes) -> Iterator[str]:
+        """Yields text of every non-empty page in order."""
+        total_pages = self.count_pages(pdf_content)
+        shards = [
+            (start, min(start + self.pages_per_shard, total_pages))
+            for start in range(0, total_pages, self.pages_per_shard)
+        ]
+
+        if self.workers == 1 or len(shards) <= 1:
+            yield from self._iter_sequential(pdf_content, shards)
+            return
+
+        # shards read the document from a file instead of every task pickling the whole content to its worker
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as pdf_file:
+            pdf_file.write(pdf_content)
+        try:
+            yield from self._iter_parallel(pdf_file.name, shards, total_pages)
+        finally:
+            # shards still parsing keep their open file after unlink
+            os.unlink(pdf_file.name)
+
+    def extract_text(self, pdf_content: bytes) -> str:
+        return '\n'.join(self.iter_pages(pdf_content))
+
+    def _iter_parallel(self, pdf_path: str, shards: list[tuple[int, int]], total_pages: int) -> Iterator[str]:
+        deadline = self._deadline()
+        done = 0
+        for attempt in range(2):
+            executor = _get_executor(self.workers)
+            futures = []
+            try:
+                futures = [executor.submit(_extract_pages, pdf_path, start, end) for start, end in shards[done:]]
+                for (start, _), future in zip(shards[done:], futures):
+                    timeout = max(0.0, deadline - time.monotonic()) if deadline else None
+                    try:
+                        pages = future.result(timeout=timeout)
+                    except FutureTimeoutError:
+                        logger.warning(
+                            "PDF extraction time budget exceeded",
+                            extra={
+                                "budget_seconds": self.time_budget_seconds, "pages": start, "total_pages": total_pages
+                            }
+                        )
+                        return
+                    done += 1
+                    yield from pages
+                return
+            except BrokenProcessPool:
+                # a crashed worker breaks the whole pool, remaining shards are retried once in a new one
+                _discard_executor(self.workers, executor)
+                if attempt:
+                    raise
+                logger.warning("PDF worker process crashed, restarting the pool", extra={"pages": shards[done][0]})
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def _iter_sequential(self, pdf_content: bytes, shards: list[tuple[int, int]]) -> Iterator[str]:
+        deadline = self._deadline()
+        for start, end in shards:
+            if deadline and time.monotonic() > deadline:
+                logger.warning(
+                    "PDF extraction time budget exceeded",
+                    extra={"budget_seconds": self.time_budget_seconds, "pages": start}
+                )
+                return
+            yield from _extract_pages(pdf_content, start, end)
+
+    def _deadline(self) -> Optional[float]:
+        if self.time_budget_seconds > 0:
+            return time.monotonic() + self.time_budget_seconds
+        return None
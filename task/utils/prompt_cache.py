@@ -0,0 +1,62 @@
+import threading
+from typing import Any, Optional
+
+from task.utils.constants import CACHE_BREAKPOINT, CUSTOM_FIELDS
+from task.utils.telemetry import METRICS
+
+PROMPT_CACHE_TTFT = METRICS.histogram(
+    "agent_llm_ttft_by_prompt_cache_seconds",
+    "Time to first token of agent LLM calls by whether upstream served part of the prompt from its cache.",
+    ("prompt_cache",),
+)
+
+
+def with_cache_breakpoint(item: dict[str, Any]) -> dict[str, Any]:
+    """
+    Returns copy of message or tool schema marked as the end of cacheable prompt prefix.
+    DIAL passes `custom_fields.cache_breakpoint` to models that support prompt caching and ignores it for others.
+    """
+    custom_fields = dict(item.get(CUSTOM_FIELDS) or {})
+    custom_fields[CACHE_BREAKPOINT] = {}
+    return {**item, CUSTOM_FIELDS: custom_fields}
+
+
+def get_cached_tokens(usage: Any) -> int:
+    """Extracts `prompt_tokens_details.cached_tokens` from completion usage, 0 if upstream doesn't report it."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is None and isinstance(usage, dict):
+        details = usage.get("prompt_tokens_details")
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+class PromptCacheStats:
+    """
+    Thread-safe aggregation of upstream prompt cache hits across agent LLM calls, exported to `/metrics`:
+    time to first token of calls with and without cached prompt tokens and share of prompt tokens served from cache.
+    The hit ratio gauge reads the first instance, the app keeps one per process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        METRICS.gauge(
+            "agent_prompt_cache_hit_ratio", "Share of agent prompt tokens served from upstream prompt cache.", (),
+            lambda: {(): self.hit_ratio},
+        )
+
+    def record(self, prompt_tokens: int, cached_tokens: int, ttft_ms: Optional[float]) -> None:
+        """:param ttft_ms: None if the call produced no content, only its tokens are counted"""
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+        if ttft_ms is not None:
+            PROMPT_CACHE_TTFT.observe(ttft_ms / 1000, prompt_cache="hit" if cached_tokens else "miss")
+
+    @property
+    def hit_ratio(self) -> float:
+        """Share of prompt tokens served from upstream cache."""
+        with self._lock:
+            return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """
+    Coalesces identical in-flight calls: the first caller of a key starts the call, callers of the same key
+    arriving before it finishes await its result instead of starting their own.
+    A cancelled caller doesn't cancel the call shared with others, the call is cancelled once all its callers are gone.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self._callers: dict[asyncio.Task, int] = {}
+
+    async def run(self, key: str, call: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """Result of `call()` started by this or an earlier caller of `key`, and whether it was the earlier one's."""
+        task = self._in_flight.get(key)
+        if task is not None and (task.cancelling() or task.cancelled()):
+            # its last caller left: the call is being cancelled or is cancelled but not removed yet
+            task = None
+        coalesced = task is not None
+        if task is None:
+            task = asyncio.create_task(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        # shield: cancellation of one caller must not cancel the call shared with others
+        self._callers[task] = self._callers.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task), coalesced
+        finally:
+            self._callers[task] -= 1
+            if not self._callers[task]:
+                del self._callers[task]
+                if not task.done():
+                    # all callers are gone, nobody needs the result
+                    task.cancel()
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        # a new call of the key may have replaced the cancelled one
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
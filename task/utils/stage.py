@@ -1,7 +1,10 @@
+import logging
 from typing import Optional
 
 from aidial_sdk.chat_completion import Choice, Stage
 
+logger = logging.getLogger(__name__)
+
 
 class StageProcessor:
 
@@ -16,4 +19,4 @@ class StageProcessor:
         try:
             stage.close()
         except Exception as e:
-            print("⚠️ Unable to close stage. ", e)
+            logger.warning("Unable to close stage", extra={"error": str(e)})
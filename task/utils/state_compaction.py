@@ -0,0 +1,276 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import PurePosixPath
+from typing import Any, Iterable, Optional
+
+from aidial_client import AsyncDial
+from aidial_client._exception import EtagMismatchError
+from aidial_sdk.chat_completion import Message, Role
+from redis import Redis
+
+from task.utils.constants import CONTENT_REF_KEY, TOOL_CALL_HISTORY_COMPRESSED_KEY, TOOL_CALL_HISTORY_KEY
+from task.utils.telemetry import METRICS, record_cache
+
+logger = logging.getLogger(__name__)
+
+STATE_BYTES = METRICS.histogram(
+    "agent_choice_state_bytes", "Size of tool call history saved in choice state, before and after compaction.",
+    ("stage",), buckets=(1_000, 4_000, 16_000, 64_000, 256_000, 1_000_000, 4_000_000, 16_000_000),
+)
+
+# tool result in the prompt when its stored content expired or can't be read with the user's key
+MISSING_CONTENT = "[Tool result is no longer available]"
+# compressed history is base64 in JSON, not worth it for small histories
+_MIN_COMPRESS_BYTES = 1024
+
+
+def _digest(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ToolResultStore:
+    """
+    Content-addressed tool results kept in process memory, the least recently used are evicted over `max_chars`.
+    Ref is the hash of the content, so a result repeated across turns is stored once and only someone who already
+    knows the content (its conversation's state) can reference it.
+    """
+
+    def __init__(self, max_chars: int = 200_000_000):
+        self.max_chars = max_chars
+        self._contents: OrderedDict[str, str] = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    async def put(self, contents: list[str], api_key: str) -> list[Optional[str]]:
+        """Stores contents, returns their refs or None for the ones that failed to store."""
+        refs = [f"sha256:{_digest(content)}" for content in contents]
+        self._remember(zip(refs, contents))
+        return refs
+
+    async def get(self, refs: list[str], api_key: str) -> list[Optional[str]]:
+        """Contents by refs, None for unknown or expired ones."""
+        return self._recall(refs)
+
+    def _remember(self, items: Iterable[tuple[str, str]]) -> None:
+        with self._lock:
+            for ref, content in items:
+                if ref not in self._contents:
+                    self._contents[ref] = content
+                    self._chars += len(content)
+                self._contents.move_to_end(ref)
+            while self._chars > self.max_chars and len(self._contents) > 1:
+                _, evicted = self._contents.popitem(last=False)
+                self._chars -= len(evicted)
+
+    def _recall(self, refs: list[str]) -> list[Optional[str]]:
+        with self._lock:
+            contents = [self._contents.get(ref) for ref in refs]
+            for ref, content in zip(refs, contents):
+                if content is not None:
+                    self._contents.move_to_end(ref)
+        return contents
+
+
+class RedisToolResultStore(ToolResultStore):
+    """
+    Content-addressed tool results shared by agent replicas through Redis, each expires `ttl_seconds` after
+    it was last stored or read.
+    """
+
+    def __init__(self, client: Redis, prefix: str = "agent:tool_result", ttl_seconds: int = 30 * 24 * 60 * 60):
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+
+    @classmethod
+    def create(cls, url: str) -> 'RedisToolResultStore':
+        logger.info("Using Redis tool result store", extra={"url": url})
+        return cls(Redis.from_url(url))
+
+    def _key(self, ref: str) -> str:
+        return f"{self.prefix}:{ref}"
+
+    async def put(self, contents: list[str], api_key: str) -> list[Optional[str]]:
+        refs = [f"sha256:{_digest(content)}" for content in contents]
+
+        def store():
+            with self.client.pipeline() as pipe:
+                for ref, content in zip(refs, contents):
+                    pipe.set(self._key(ref), content.encode("utf-8"), ex=self.ttl_seconds)
+                pipe.execute()
+
+        await asyncio.to_thread(store)
+        return refs
+
+    async def get(self, refs: list[str], api_key: str) -> list[Optional[str]]:
+        def load():
+            with self.client.pipeline() as pipe:
+                for ref in refs:
+                    pipe.getex(self._key(ref), ex=self.ttl_seconds)
+                return pipe.execute()
+
+        return [value.decode("utf-8") if value is not None else None for value in await asyncio.to_thread(load)]
+
+
+class DialFileToolResultStore(ToolResultStore):
+    """
+    Tool results stored as files in the user's appdata folder of DIAL storage, ref is the file URL. Files are
+    named by content hash and uploaded only if absent; they stay in the user's storage until the user deletes them.
+    Stored and downloaded results are also kept in process (up to `cache_chars`), so later turns of a conversation
+    don't download its whole history again. A result is served from memory only for refs in the appdata folder of
+    the calling user, refs from another user's state are downloaded with the caller's key and DIAL rejects them.
+    """
+
+    def __init__(self, endpoint: str, folder: str = "tool_results", cache_chars: int = 50_000_000):
+        super().__init__(max_chars=cache_chars)
+        self.endpoint = endpoint
+        self.folder = folder
+
+    def _folder_url(self, home: Optional[str]) -> Optional[str]:
+        return f"files/{(PurePosixPath(home) / self.folder).as_posix()}/" if home else None
+
+    async def put(self, contents: list[str], api_key: str) -> list[Optional[str]]:
+        client = AsyncDial(base_url=self.endpoint, api_key=api_key)
+        folder = self._folder_url(await client.my_appdata_home())
+        if folder is None:
+            logger.warning("No appdata folder in DIAL storage, tool results are kept in state")
+            return [None] * len(contents)
+
+        async def upload(content: str) -> str:
+            file_name = f"{_digest(content)}.txt"
+            url = f"{folder}{file_name}"
+            try:
+                await client.files.upload(
+                    url, (file_name, content.encode("utf-8"), "text/plain"), etag_if_none_match="*"
+                )
+            except EtagMismatchError:
+                # same content is already stored
+                pass
+            return url
+
+        results = await asyncio.gather(*(upload(content) for content in contents), return_exceptions=True)
+        refs = [_result_or_none(result, "Failed to store tool result") for result in results]
+        self._remember((ref, content) for ref, content in zip(refs, contents) if ref is not None)
+        return refs
+
+    async def get(self, refs: list[str], api_key: str) -> list[Optional[str]]:
+        client = AsyncDial(base_url=self.endpoint, api_key=api_key)
+        folder = self._folder_url(await client.my_appdata_home())
+        own = [ref for ref in refs if folder and ref.startswith(folder)]
+        contents = dict(zip(own, self._recall(own)))
+        record_cache("tool_result_download", True, count=sum(content is not None for content in contents.values()))
+
+        async def download(ref: str) -> Optional[str]:
+            if not ref.startswith("files/") or f"/{self.folder}/" not in ref:
+                return None
+            file = await client.files.download(ref)
+            return (await file.aget_content()).decode("utf-8")
+
+        missing = [ref for ref in dict.fromkeys(refs) if contents.get(ref) is None]
+        record_cache("tool_result_download", False, count=len(missing))
+        results = await asyncio.gather(*(download(ref) for ref in missing), return_exceptions=True)
+        for ref, result in zip(missing, results):
+            contents[ref] = _result_or_none(result, "Failed to load tool result")
+        if folder:
+            self._remember(
+                (ref, contents[ref]) for ref in missing if ref.startswith(folder) and contents[ref] is not None
+            )
+        return [contents[ref] for ref in refs]
+
+
+def _result_or_none(result: Any, message: str) -> Any:
+    if isinstance(result, BaseException):
+        logger.warning(message, extra={"error": f"{type(result).__name__}: {result}"})
+        return None
+    return result
+
+
+class StateCompactor:
+    """
+    Keeps choice state small, since the client sends the state of every assistant message back with each later
+    request and all of it is parsed before the request is handled:
+    - tool results of at least `min_chars` are saved in `store` and replaced with `content_ref`;
+    - the history is zlib compressed into `tool_call_history_zlib` when `compress` is set and it's smaller.
+
+    `expand` restores the original history of request messages in place before it is unpacked, refs are loaded
+    concurrently on the first iteration only. Restored content is the same string, so the prompt prefix stays
+    cacheable. States saved before compaction or with it disabled are read as they are, while builds without
+    compaction see neither compressed nor stored history, so it has to stay off as long as they may be rolled back to.
+    """
+
+    def __init__(self, store: Optional[ToolResultStore], min_chars: int = 2000, compress: bool = False):
+        """
+        :param store: where large tool results go, they stay in the state if None
+        """
+        self.store = store
+        self.min_chars = min_chars
+        self.compress = compress
+
+    async def compact(self, state: dict[str, Any], api_key: str) -> dict[str, Any]:
+        """Compacted copy of the state, results that failed to store stay inline."""
+        history = state.get(TOOL_CALL_HISTORY_KEY)
+        if not history:
+            return state
+        STATE_BYTES.observe(len(json.dumps(history)), stage="raw")
+
+        large = [
+            i for i, message in enumerate(history)
+            if message.get("role") == Role.TOOL.value and isinstance(message.get("content"), str)
+            and len(message["content"]) >= self.min_chars
+        ] if self.store else []
+        if large:
+            refs = await self.store.put([history[i]["content"] for i in large], api_key)
+            history = list(history)
+            for i, ref in zip(large, refs):
+                if ref is not None:
+                    history[i] = {key: value for key, value in history[i].items() if key != "content"}
+                    history[i][CONTENT_REF_KEY] = ref
+
+        compacted = {key: value for key, value in state.items() if key != TOOL_CALL_HISTORY_KEY}
+        serialized = json.dumps(history, separators=(",", ":"))
+        if self.compress and len(serialized) >= _MIN_COMPRESS_BYTES:
+            packed = base64.b64encode(zlib.compress(serialized.encode("utf-8"))).decode("ascii")
+            if len(packed) < len(serialized):
+                compacted[TOOL_CALL_HISTORY_COMPRESSED_KEY] = packed
+                STATE_BYTES.observe(len(packed), stage="compacted")
+                return compacted
+        compacted[TOOL_CALL_HISTORY_KEY] = history
+        STATE_BYTES.observe(len(serialized), stage="compacted")
+        return compacted
+
+    async def expand(self, messages: list[Message], api_key: str) -> None:
+        """Restores tool call history in the state of assistant messages in place."""
+        missing: list[dict[str, Any]] = []
+        for message in messages:
+            if message.role != Role.ASSISTANT or not message.custom_content:
+                continue
+            state = message.custom_content.state
+            if not isinstance(state, dict):
+                continue
+            if packed := state.pop(TOOL_CALL_HISTORY_COMPRESSED_KEY, None):
+                try:
+                    state[TOOL_CALL_HISTORY_KEY] = json.loads(zlib.decompress(base64.b64decode(packed)))
+                except (ValueError, zlib.error) as e:
+                    logger.warning("Failed to decompress tool call history", extra={"error": str(e)})
+                    continue
+            history = state.get(TOOL_CALL_HISTORY_KEY)
+            if isinstance(history, list):
+                missing.extend(m for m in history if isinstance(m, dict) and CONTENT_REF_KEY in m)
+        if not missing:
+            return
+
+        refs = list({m[CONTENT_REF_KEY] for m in missing})
+        contents = await self.store.get(refs, api_key) if self.store else [None] * len(refs)
+        by_ref = dict(zip(refs, contents))
+        record_cache("tool_result_ref", True, count=sum(content is not None for content in contents))
+        record_cache("tool_result_ref", False, count=sum(content is None for content in contents))
+        for m in missing:
+            content = by_ref[m.pop(CONTENT_REF_KEY)]
+            m["content"] = content if content is not None else MISSING_CONTENT
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional
+
+from redis import Redis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+class ConversationStateStore:
+    """
+    Conversation-scoped metadata (e.g. interpreter session ids) kept in process memory.
+    Entries expire `ttl_seconds` after the last write.
+    """
+
+    def __init__(self, ttl_seconds: int = DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._values: dict[tuple[str, str], tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    async def get(self, conversation_id: str, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._values.get((conversation_id, key))
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._values[(conversation_id, key)]
+                return None
+            return value
+
+    async def set(self, conversation_id: str, key: str, value: str) -> None:
+        with self._lock:
+            self._values[(conversation_id, key)] = (value, time.monotonic() + self.ttl_seconds)
+
+
+class RedisConversationStateStore(ConversationStateStore):
+    """
+    Conversation-scoped metadata shared by all agent replicas through Redis,
+    one hash per conversation that expires `ttl_seconds` after the last write.
+    The client is synchronous, its round trips run in threads to keep the event loop free.
+    """
+
+    def __init__(self, client: Redis, ttl_seconds: int = DEFAULT_TTL_SECONDS, prefix: str = "agent:conversation"):
+        super().__init__(ttl_seconds)
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def create(cls, url: str, ttl_seconds: int = DEFAULT_TTL_SECONDS) -> 'RedisConversationStateStore':
+        client = Redis.from_url(url)
+        logger.info("Using Redis conversation state store", extra={"url": url})
+        return cls(client, ttl_seconds)
+
+    def _key(self, conversation_id: str) -> str:
+        return f"{self.prefix}:{conversation_id}"
+
+    async def get(self, conversation_id: str, key: str) -> Optional[str]:
+        value = await asyncio.to_thread(self.client.hget, self._key(conversation_id), key)
+        return value.decode("utf-8") if value is not None else None
+
+    async def set(self, conversation_id: str, key: str, value: str) -> None:
+        redis_key = self._key(conversation_id)
+
+        def store():
+            with self.client.pipeline() as pipe:
+                pipe.hset(redis_key, key, value)
+                pipe.expire(redis_key, self.ttl_seconds)
+                pipe.execute()
+
+        await asyncio.to_thread(store)
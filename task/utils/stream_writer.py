@@ -0,0 +1,112 @@
+import asyncio
+import json
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from aidial_sdk.chat_completion import Choice, Stage
+
+from task.utils.telemetry import METRICS
+
+STREAM_APPENDS = METRICS.counter(
+    "agent_stream_appends_total", "Content pieces appended to choices and stages.", ("target",)
+)
+STREAM_EVENTS = METRICS.counter(
+    "agent_stream_events_total", "Content chunks sent to the client after coalescing.", ("target",)
+)
+
+
+@dataclass(frozen=True)
+class StreamBufferSettings:
+    """
+    :param flush_interval: max seconds content waits in the buffer, 0 sends every piece immediately
+    :param flush_bytes: buffered content of this size (in UTF-8 bytes) is sent without waiting
+    """
+    flush_interval: float = 0.02
+    flush_bytes: int = 1024
+
+
+class StreamBufferConfig:
+    """Buffer settings by deployment (or tool) name, the default ones for the rest."""
+
+    def __init__(
+            self,
+            default: StreamBufferSettings = StreamBufferSettings(),
+            overrides: Optional[dict[str, StreamBufferSettings]] = None,
+    ):
+        self.default = default
+        self.overrides = overrides or {}
+
+    @classmethod
+    def parse(cls, flush_ms: float, flush_bytes: int, overrides: str = "") -> 'StreamBufferConfig':
+        """
+        :param overrides: JSON object of deployment name to `{"flush_ms": ..., "flush_bytes": ...}`,
+            e.g. `{"gpt-4o": {"flush_ms": 50}, "dall-e-3": {"flush_ms": 0}}`
+        """
+        default = StreamBufferSettings(flush_ms / 1000, flush_bytes)
+        return cls(default, {
+            name: StreamBufferSettings(
+                settings.get("flush_ms", flush_ms) / 1000,
+                settings.get("flush_bytes", flush_bytes),
+            )
+            for name, settings in json.loads(overrides or "{}").items()
+        })
+
+    def settings(self, name: Optional[str]) -> StreamBufferSettings:
+        return self.overrides.get(name, self.default) if name else self.default
+
+    def wrap(self, target: Choice | Stage, name: Optional[str] = None) -> 'BufferedWriter':
+        return BufferedWriter(target, self.settings(name))
+
+
+class BufferedWriter:
+    """
+    Drop-in wrapper of `Choice` or `Stage` that coalesces `append_content` calls: every call to the SDK becomes
+    a separate SSE event, which for token-by-token streaming costs more in serialization and network writes
+    than the content itself. Content is sent when the buffer reaches `flush_bytes` or `flush_interval` after the
+    first buffered piece, so the client sees text at most `flush_interval` later.
+
+    Any other attribute access (stages, attachments, state, close) flushes the buffer first, so the order of
+    chunks is preserved. Callers should call `flush()` when the stream ends.
+    """
+
+    def __init__(self, target: Choice | Stage, settings: StreamBufferSettings):
+        self._target = target
+        self._settings = settings
+        self._kind = "choice" if isinstance(target, Choice) else "stage"
+        self._buffer: list[str] = []
+        self._buffered_bytes = 0
+        self._buffered_appends = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def append_content(self, content: str) -> None:
+        if not content:
+            return
+        self._buffer.append(content)
+        self._buffered_appends += 1
+        self._buffered_bytes += len(content.encode("utf-8"))
+        if self._buffered_bytes >= self._settings.flush_bytes or self._settings.flush_interval <= 0:
+            self.flush()
+        elif self._timer is None:
+            try:
+                self._timer = asyncio.get_running_loop().call_later(self._settings.flush_interval, self.flush)
+            except RuntimeError:
+                # no event loop to flush later from
+                self.flush()
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        content = "".join(self._buffer)
+        self._buffer.clear()
+        self._buffered_bytes = 0
+        STREAM_APPENDS.inc(self._buffered_appends, target=self._kind)
+        STREAM_EVENTS.inc(target=self._kind)
+        self._buffered_appends = 0
+        self._target.append_content(content)
+
+    def __getattr__(self, name: str) -> Any:
+        self.flush()
+        return getattr(self._target, name)
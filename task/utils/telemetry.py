@@ -0,0 +1,349 @@
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+QUANTILES = (0.5, 0.95, 0.99)
+# Number of recent samples per label set used for in-process quantiles
+QUANTILE_WINDOW = int(os.getenv('METRICS_QUANTILE_WINDOW', 1024))
+TRACE_LOG_SPANS = os.getenv('TRACE_LOG_SPANS', 'false').lower() == 'true'
+
+LabelValues = tuple[str, ...]
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+
+    def __init__(self, name: str, description: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values: dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def items(self) -> list[tuple[LabelValues, float]]:
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for key, value in self.items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose values are computed on scrape by callback returning {label values: value}."""
+
+    def __init__(
+            self,
+            name: str,
+            description: str,
+            label_names: tuple[str, ...],
+            callback: Callable[[], dict[LabelValues, float]],
+    ):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.callback = callback
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        for key, value in self.callback().items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Prometheus histogram. Besides cumulative buckets it keeps a window of recent samples per label set,
+    so p50/p95/p99 are also available in-process (and exported as `<name>_window_quantile`).
+    """
+
+    def __init__(
+            self,
+            name: str,
+            description: str,
+            label_names: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[LabelValues, tuple[list[int], list[float], deque]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # bucket counts (+Inf last), [sum, count], recent samples
+                series = ([0] * (len(self.buckets) + 1), [0.0, 0], deque(maxlen=QUANTILE_WINDOW))
+                self._series[key] = series
+            counts, totals, window = series
+            counts[bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+            totals[1] += 1
+            window.append(value)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def _quantiles(samples: list[float]) -> dict[float, float]:
+        if not samples:
+            return {}
+        return {q: samples[min(len(samples) - 1, int(math.ceil(q * len(samples))) - 1)] for q in QUANTILES}
+
+    def render(self) -> list[str]:
+        with self._lock:
+            snapshot = [
+                (key, list(counts), list(totals), sorted(window))
+                for key, (counts, totals, window) in self._series.items()
+            ]
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for key, counts, (total_sum, total_count), _ in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {total_count}")
+
+        quantile_name = f"{self.name}_window_quantile"
+        lines.append(f"# HELP {quantile_name} {self.description} Quantiles over last {QUANTILE_WINDOW} samples.")
+        lines.append(f"# TYPE {quantile_name} gauge")
+        for key, _, _, samples in snapshot:
+            for q, value in self._quantiles(samples).items():
+                labels = _format_labels(self.label_names, key, f'quantile="{q}"')
+                lines.append(f"{quantile_name}{labels} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide set of metrics rendered in Prometheus text exposition format."""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Gauge | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, description: str, label_names: tuple[str, ...] = ()) -> Counter:
+        return self._get_or_add(name, lambda: Counter(name, description, label_names))
+
+    def histogram(
+            self,
+            name: str,
+            description: str,
+            label_names: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_add(name, lambda: Histogram(name, description, label_names, buckets))
+
+    def gauge(
+            self,
+            name: str,
+            description: str,
+            label_names: tuple[str, ...],
+            callback: Callable[[], dict[LabelValues, float]],
+    ) -> Gauge:
+        return self._get_or_add(name, lambda: Gauge(name, description, label_names, callback))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _get_or_add(self, name: str, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = factory()
+                self._metrics[name] = metric
+            return metric
+
+
+METRICS = MetricsRegistry()
+
+SPAN_DURATION = METRICS.histogram(
+    "agent_span_duration_seconds", "Duration of traced operations.", ("span",)
+)
+SPAN_ERRORS = METRICS.counter(
+    "agent_span_errors_total", "Traced operations finished with exception.", ("span",)
+)
+TOOL_CALL_DURATION = METRICS.histogram(
+    "agent_tool_call_duration_seconds", "Duration of tool calls.", ("tool",)
+)
+LLM_TTFT = METRICS.histogram(
+    "agent_llm_time_to_first_token_seconds", "Time to first token of LLM calls.", ("deployment",)
+)
+LLM_TOKENS = METRICS.counter(
+    "agent_llm_tokens_total",
+    "Tokens consumed by LLM calls, abandoned_prompt is the estimated prompt of attempts cut off by the router.",
+    ("deployment", "type")
+)
+CACHE_REQUESTS = METRICS.counter(
+    "agent_cache_requests_total", "Cache lookups by result.", ("cache", "result")
+)
+
+
+def _cache_hit_ratios() -> dict[LabelValues, float]:
+    totals: dict[str, list[float]] = {}
+    for (cache, result), value in CACHE_REQUESTS.items():
+        hits_and_total = totals.setdefault(cache, [0.0, 0.0])
+        if result == "hit":
+            hits_and_total[0] += value
+        hits_and_total[1] += value
+    return {(cache,): hits / total for cache, (hits, total) in totals.items() if total}
+
+
+METRICS.gauge("agent_cache_hit_ratio", "Share of cache lookups that were hits.", ("cache",), _cache_hit_ratios)
+
+
+_cache_listeners: list[Callable[[str, bool, int], None]] = []
+
+
+def add_cache_listener(listener: Callable[[str, bool, int], None]) -> None:
+    """Registers callback that receives every recorded cache lookup: cache, hit and count."""
+    _cache_listeners.append(listener)
+
+
+def record_cache(cache: str, hit: bool, count: int = 1) -> None:
+    if count:
+        CACHE_REQUESTS.inc(count, cache=cache, result="hit" if hit else "miss")
+        for listener in _cache_listeners:
+            try:
+                listener(cache, hit, count)
+            except Exception as e:
+                logger.warning("Cache listener failed", extra={"error": str(e)})
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_time: float
+    attributes: dict[str, Any] = field(default_factory=dict)
+    duration: float = 0.0
+    error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_span_exporters: list[Callable[[Span], None]] = []
+
+
+def add_span_exporter(exporter: Callable[[Span], None]) -> None:
+    """Registers callback that receives every finished span."""
+    _span_exporters.append(exporter)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Traces operation: records its duration to `agent_span_duration_seconds{span=name}` and passes finished span
+    to exporters. Nested spans (in the same task or in tasks created inside the span) share the trace id.
+    Works for sync and async code.
+    """
+    parent = _current_span.get()
+    current = Span(
+        name=name,
+        trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+        span_id=uuid.uuid4().hex[:16],
+        parent_id=parent.span_id if parent else None,
+        start_time=time.time(),
+        attributes=attributes,
+    )
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        SPAN_ERRORS.inc(span=name)
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        _current_span.reset(token)
+        SPAN_DURATION.observe(current.duration, span=name)
+        for exporter in _span_exporters:
+            try:
+                exporter(current)
+            except Exception as e:
+                logger.warning("Span exporter failed", extra={"error": str(e)})
+
+
+def _log_span(finished: Span) -> None:
+    logger.info(
+        "Span finished",
+        extra={
+            "span": finished.name,
+            "trace_id": finished.trace_id,
+            "span_id": finished.span_id,
+            "parent_id": finished.parent_id,
+            "duration_ms": round(finished.duration * 1000, 2),
+            "error": finished.error,
+            "attributes": finished.attributes,
+        }
+    )
+
+
+if TRACE_LOG_SPANS:
+    add_span_exporter(_log_span)
@@ -0,0 +1,34 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from task.utils.admission import QUEUE_WAIT
+
+T = TypeVar("T")
+
+
+class WorkPool:
+    """
+    Bounded thread pool for blocking work of one kind (RAG indexing, file extraction), so a request fanning out
+    to dozens of documents occupies at most `workers` threads and queues the rest, instead of taking over
+    the default executor shared by everything else. Tokenizers, numpy, faiss and torch release the GIL,
+    PDF parsing runs in its own process pool.
+    """
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-pool")
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        """Runs `func` in the pool with the caller's context (trace spans), work not started yet is dropped on cancel."""
+        context = contextvars.copy_context()
+        queued = time.perf_counter()
+
+        def call() -> T:
+            QUEUE_WAIT.observe(time.perf_counter() - queued, queue=self.name)
+            return context.run(func, *args)
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
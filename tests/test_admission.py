@@ -0,0 +1,146 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aidial_sdk import HTTPException
+
+from task.app import GeneralPurposeAgentApplication
+from task.utils.admission import UNIDENTIFIED_KEY, AdmissionController, AdmissionRejected
+
+
+class FakeRequests:
+    """Requests holding their slot until `finish` is set, records the order in which they are admitted."""
+
+    def __init__(self, controller: AdmissionController):
+        self.controller = controller
+        self.admitted: list[str] = []
+        self.finish = asyncio.Event()
+
+    async def request(self, key: str, name: str) -> None:
+        async with self.controller.admit(key):
+            self.admitted.append(name)
+            await self.finish.wait()
+
+    def start(self, key: str, name: str) -> asyncio.Task:
+        return asyncio.create_task(self.request(key, name))
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_queued_request_of_a_light_user_goes_ahead_of_a_heavy_users_backlog():
+    async def main():
+        requests = FakeRequests(AdmissionController(max_concurrent=1, max_queued=10, max_queued_per_key=10))
+        tasks = [requests.start("heavy", "heavy-0")]
+        await _settle()
+        tasks += [requests.start("heavy", f"heavy-{number}") for number in range(1, 4)]
+        await _settle()
+        tasks.append(requests.start("light", "light-0"))
+        await _settle()
+        assert (requests.controller.active, requests.controller.queued) == (1, 4)
+
+        requests.finish.set()
+        await asyncio.gather(*tasks)
+        assert (requests.controller.active, requests.controller.queued) == (0, 0)
+        return requests.admitted
+
+    assert asyncio.run(main()) == ["heavy-0", "light-0", "heavy-1", "heavy-2", "heavy-3"]
+
+
+def test_key_holding_its_active_limit_waits_while_other_keys_are_admitted():
+    async def main():
+        controller = AdmissionController(max_concurrent=3, max_queued=10, max_queued_per_key=10, max_active_per_key=1)
+        requests = FakeRequests(controller)
+        tasks = [requests.start("heavy", "heavy-0"), requests.start("heavy", "heavy-1")]
+        await _settle()
+        tasks.append(requests.start("light", "light-0"))
+        await _settle()
+        assert requests.admitted == ["heavy-0", "light-0"]
+        assert (controller.active, controller.queued) == (2, 1)
+
+        requests.finish.set()
+        await asyncio.gather(*tasks)
+        return requests.admitted
+
+    assert asyncio.run(main()) == ["heavy-0", "light-0", "heavy-1"]
+
+
+def test_requests_over_the_queue_limits_are_rejected():
+    async def main():
+        controller = AdmissionController(max_concurrent=1, max_queued=4, max_queued_per_key=1)
+        requests = FakeRequests(controller)
+        tasks = [requests.start("a", "a-0")]
+        await _settle()
+        tasks += [requests.start("a", "a-1"), requests.start("b", "b-1")]
+        await _settle()
+
+        with pytest.raises(AdmissionRejected) as key_queue_full:
+            await requests.request("a", "a-2")
+        # per-key limits don't apply to requests of unknown users
+        tasks += [requests.start(UNIDENTIFIED_KEY, "unknown-1"), requests.start(UNIDENTIFIED_KEY, "unknown-2")]
+        await _settle()
+        assert controller.queued == 4
+        with pytest.raises(AdmissionRejected) as queue_full:
+            await requests.request("c", "c-1")
+
+        requests.finish.set()
+        await asyncio.gather(*tasks)
+        return key_queue_full.value.reason, queue_full.value.reason, sorted(requests.admitted)
+
+    assert asyncio.run(main()) == ("key_queue_full", "queue_full", ["a-0", "a-1", "b-1", "unknown-1", "unknown-2"])
+
+
+def test_cancelled_queued_request_leaves_the_queue():
+    async def main():
+        controller = AdmissionController(max_concurrent=1, max_queued=10, max_queued_per_key=10)
+        requests = FakeRequests(controller)
+        first = requests.start("a", "a-0")
+        await _settle()
+        queued = requests.start("b", "b-0")
+        await _settle()
+        assert controller.queued == 1
+
+        queued.cancel()
+        await _settle()
+        assert (controller.active, controller.queued) == (1, 0)
+
+        requests.finish.set()
+        await first
+        return controller.active, requests.admitted
+
+    assert asyncio.run(main()) == (0, ["a-0"])
+
+
+def test_rejected_request_gets_429_before_processing():
+    app = GeneralPurposeAgentApplication.__new__(GeneralPurposeAgentApplication)
+    app.loop_watchdog = None
+    app.tool_registry = object()
+    app.admission = AdmissionController(max_concurrent=1, max_queued=0, max_queued_per_key=0)
+    processed = []
+    finish = asyncio.Event()
+
+    async def process_request(request, response):
+        processed.append(request.headers["x-user-id"])
+        await finish.wait()
+
+    app._process_request = process_request
+
+    def request(user: str):
+        return SimpleNamespace(headers={"x-user-id": user}, api_key="per-request-key", jwt=None)
+
+    async def main():
+        first = asyncio.create_task(app.chat_completion(request("first"), None))
+        await _settle()
+        with pytest.raises(HTTPException) as rejected:
+            await app.chat_completion(request("second"), None)
+        finish.set()
+        await first
+        return rejected.value
+
+    rejected = asyncio.run(main())
+
+    assert processed == ["first"]
+    assert rejected.status_code == 429
+    assert rejected.headers == {"Retry-After": "1"}
@@ -0,0 +1,118 @@
+import asyncio
+from contextlib import aclosing
+
+import pytest
+
+from task.utils.cancellation import run_until_disconnected
+from task.utils.single_flight import SingleFlight
+
+
+def test_disconnect_cancels_work_and_closes_upstream_stream():
+    events = []
+
+    async def upstream():
+        try:
+            while True:
+                yield "token"
+                await asyncio.sleep(0.01)
+        finally:
+            events.append("stream closed")
+
+    async def work():
+        async with aclosing(upstream()) as stream:
+            async for _ in stream:
+                pass
+        return "finished"
+
+    async def main():
+        started = asyncio.get_running_loop().time()
+
+        async def is_disconnected():
+            return asyncio.get_running_loop().time() - started > 0.05
+
+        return await run_until_disconnected(work(), is_disconnected, poll_interval=0.01)
+
+    assert asyncio.run(main()) is None
+    assert events == ["stream closed"]
+
+
+def test_result_is_returned_while_connected():
+    async def work():
+        await asyncio.sleep(0.01)
+        return "finished"
+
+    async def is_disconnected():
+        return False
+
+    assert asyncio.run(run_until_disconnected(work(), is_disconnected, poll_interval=0.01)) == "finished"
+
+
+def test_shared_call_is_cancelled_only_when_its_last_caller_leaves():
+    started = []
+    cancelled = []
+
+    async def call():
+        started.append(1)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def main():
+        flight = SingleFlight()
+        first = asyncio.create_task(flight.run("key", call))
+        second = asyncio.create_task(flight.run("key", call))
+        await asyncio.sleep(0.01)
+
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled
+
+        second.cancel()
+        await asyncio.sleep(0.01)
+        for caller in (first, second):
+            with pytest.raises(asyncio.CancelledError):
+                await caller
+
+    asyncio.run(main())
+    assert started == [1]
+    assert cancelled == [1]
+
+
+def test_caller_leaving_keeps_result_for_the_others():
+    async def call():
+        await asyncio.sleep(0.02)
+        return "image"
+
+    async def main():
+        flight = SingleFlight()
+        first = asyncio.create_task(flight.run("key", call))
+        second = asyncio.create_task(flight.run("key", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == ("image", True)
+
+
+@pytest.mark.parametrize("steps", [1, 2], ids=["cancelling", "cancelled before done callback"])
+def test_caller_joining_a_cancelled_call_starts_a_new_one(steps):
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def main():
+        flight = SingleFlight()
+        first = asyncio.create_task(flight.run("key", call))
+        await asyncio.sleep(0)
+        # the only caller leaves, its call is cancelled but stays in flight for a loop step or two
+        first.cancel()
+        for _ in range(steps):
+            await asyncio.sleep(0)
+        return await flight.run("key", call)
+
+    assert asyncio.run(main()) == (2, False)
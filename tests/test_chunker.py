@@ -0,0 +1,79 @@
+import pytest
+
+from task.tools.rag.chunker import TextChunker, load_tokenizer
+
+_TEXT = " ".join(
+    f"Sentence {number} has {'a few extra words ' * (number % 3)}words." for number in range(60)
+) + "\nA heading line\n\nLast paragraph without a full stop"
+
+
+def count_words(texts: list[str]) -> list[int]:
+    return [len(text.split()) for text in texts]
+
+
+def _sentences(text: str) -> list[tuple[int, int]]:
+    return list(TextChunker._sentences(text))
+
+
+def test_chunks_fit_the_limit_and_cover_every_sentence():
+    chunker = TextChunker(max_tokens=40, overlap_tokens=10, count_tokens=count_words)
+
+    spans = list(chunker.spans(_TEXT))
+
+    assert len(spans) > 1
+    assert all(count_words([_TEXT[start:end]])[0] <= 40 for start, end in spans)
+    for start, end in _sentences(_TEXT):
+        assert any(chunk_start <= start and end <= chunk_end for chunk_start, chunk_end in spans)
+    assert chunker.split_text(_TEXT) == [_TEXT[start:end] for start, end in spans]
+    assert list(chunker.chunks(_TEXT)) == chunker.split_text(_TEXT)
+
+
+def test_consecutive_chunks_overlap_by_whole_sentences_within_the_overlap():
+    chunker = TextChunker(max_tokens=40, overlap_tokens=10, count_tokens=count_words)
+    sentence_starts = {start for start, _ in _sentences(_TEXT)}
+
+    spans = list(chunker.spans(_TEXT))
+
+    overlaps = 0
+    for (_, previous_end), (start, end) in zip(spans, spans[1:]):
+        assert start in sentence_starts
+        if start < previous_end:
+            overlaps += 1
+            assert count_words([_TEXT[start:previous_end]])[0] <= 10
+    assert overlaps
+
+
+def test_no_overlap():
+    chunker = TextChunker(max_tokens=40, overlap_tokens=0, count_tokens=count_words)
+
+    spans = list(chunker.spans(_TEXT))
+
+    assert all(start >= previous_end for (_, previous_end), (start, _) in zip(spans, spans[1:]))
+
+
+def test_sentence_longer_than_the_limit_is_split_by_words():
+    text = " ".join(f"word{number}" for number in range(25)) + ". Short one."
+    chunker = TextChunker(max_tokens=10, overlap_tokens=0, count_tokens=count_words)
+
+    chunks = chunker.split_text(text)
+
+    assert [count_words([chunk])[0] for chunk in chunks] == [10, 10, 7]
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_overlap_must_be_less_than_the_limit():
+    with pytest.raises(ValueError):
+        TextChunker(max_tokens=16, overlap_tokens=16)
+
+
+def test_tokenizer_counts_match_encoding_whole_texts(tmp_path):
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "the", "door", "open", "##s", "micro", "##wave", ",", "."]
+    (tmp_path / "vocab.txt").write_text("\n".join(vocab))
+    texts = ["The door opens.", "Microwave, the microwave door!", "", "opens opens opens"]
+
+    count_tokens = load_tokenizer(str(tmp_path))
+
+    expected = [len(encoding.ids) for encoding in count_tokens.tokenizer.encode_batch(texts, add_special_tokens=False)]
+    assert count_tokens(texts) == expected
+    # cached word counts give the same result
+    assert count_tokens(texts) == expected
@@ -0,0 +1,66 @@
+import asyncio
+
+import fakeredis
+import numpy as np
+
+from task.tools.rag.document_cache import DocumentCache
+from task.tools.rag.redis_document_cache import RedisDocumentCache
+from task.tools.rag.retrieval import HybridIndex, HybridRetriever
+
+_CHUNKS = [
+    "The microwave oven defrosts frozen food by weight.",
+    "Error code E-21 means the door is not closed.",
+    "Clean the turntable with warm soapy water.",
+]
+
+
+def _index() -> HybridIndex:
+    embeddings = np.random.default_rng(0).random((len(_CHUNKS), 8), dtype=np.float32)
+    return HybridIndex.build(embeddings, _CHUNKS, [0, 52, 98])
+
+
+def test_redis_round_trip_restores_index_in_another_replica():
+    server = fakeredis.FakeServer()
+    index = _index()
+    RedisDocumentCache(fakeredis.FakeRedis(server=server)).set("conversation:file", index, _CHUNKS)
+
+    # another replica: empty in-process cache, same Redis
+    restored = asyncio.run(RedisDocumentCache(fakeredis.FakeRedis(server=server)).aget("conversation:file"))
+
+    assert restored is not None
+    restored_index, restored_chunks = restored
+    assert restored_chunks == _CHUNKS
+    assert restored_index.offsets == index.offsets
+    assert restored_index.vectors.ntotal == len(_CHUNKS)
+    query = np.random.default_rng(1).random((1, 8), dtype=np.float32)
+    retriever = HybridRetriever(top_k=2)
+    assert retriever.search(restored_index, query, "E-21") == retriever.search(index, query, "E-21")
+
+
+def test_redis_entries_expire_and_unknown_keys_miss():
+    client = fakeredis.FakeRedis()
+    cache = RedisDocumentCache(client, ttl_seconds=60)
+    cache.set("conversation:file", _index(), _CHUNKS)
+
+    assert 0 < client.ttl("agent:document:conversation:file") <= 60
+    assert asyncio.run(cache.aget("conversation:other")) is None
+
+
+def test_in_process_hit_does_not_read_redis():
+    client = fakeredis.FakeRedis()
+    cache = RedisDocumentCache(client)
+    cache.set("conversation:file", _index(), _CHUNKS)
+    client.flushall()
+
+    cached = asyncio.run(cache.aget("conversation:file"))
+
+    assert cached is not None and cached[1] == _CHUNKS
+
+
+def test_in_memory_cache_aget():
+    cache = DocumentCache()
+    index = _index()
+    cache.set("conversation:file", index, _CHUNKS)
+
+    assert asyncio.run(cache.aget("conversation:file")) == (index, _CHUNKS)
+    assert asyncio.run(cache.aget("conversation:other")) is None
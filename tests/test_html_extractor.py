@@ -0,0 +1,56 @@
+from pathlib import Path
+
+import pytest
+
+from benchmarks.html_extraction import beautifulsoup_text
+from task.utils import html_extractor
+from task.utils.html_extractor import HtmlTextExtractor
+
+_CORPUS = {path.name: path for path in sorted(Path(__file__).parent.glob("*.html"))}
+
+# Text of malformed_page.html that differs from BeautifulSoup's: lxml recovers broken markup like browsers do.
+# `&unknown;` keeps its semicolon, `</b>` closing the misnested <b><i> doesn't split the italic text, CDATA in HTML
+# is a bogus comment rather than text and textarea content is literal text rather than tags.
+_MALFORMED_PAGE_ONLY_BEAUTIFULSOUP = [
+    "text", "continues here.", "raw cdata text", "Another\xa0line ABC &unknown 5 < 6", "Textarea", "content",
+    "stays literal",
+]
+_MALFORMED_PAGE_ONLY_LXML = [
+    "text continues here.", "Another\xa0line ABC &unknown; 5 < 6", "Textarea <b>content</b> stays literal",
+]
+
+
+@pytest.mark.parametrize("page", sorted(set(_CORPUS) - {"malformed_page.html"}))
+def test_text_is_the_same_as_beautifulsoup(page):
+    content = _CORPUS[page].read_bytes()
+
+    text = HtmlTextExtractor().extract_text(content)
+
+    assert text
+    assert text == beautifulsoup_text(content)
+
+
+def test_malformed_page_differs_from_beautifulsoup_only_in_recovered_markup():
+    content = _CORPUS["malformed_page.html"].read_bytes()
+
+    lines = HtmlTextExtractor().extract_text(content).split("\n")
+    expected = beautifulsoup_text(content).split("\n")
+
+    assert [line for line in expected if line not in lines] == _MALFORMED_PAGE_ONLY_BEAUTIFULSOUP
+    assert [line for line in lines if line not in expected] == _MALFORMED_PAGE_ONLY_LXML
+    # the rest is the same text in the same order
+    assert [line for line in lines if line in expected] == [line for line in expected if line in lines]
+    # invalid UTF-8 is dropped and the script never shows up
+    assert "Invalid bytes: café  here and split € euro" in lines
+    assert not any("popup" in line for line in lines)
+
+
+@pytest.mark.parametrize("page", sorted(_CORPUS))
+def test_feeding_in_small_pieces_gives_the_same_text(page, monkeypatch):
+    content = _CORPUS[page].read_bytes()
+    whole = HtmlTextExtractor().extract_text(content)
+
+    # pieces split tags, entities and multibyte characters
+    monkeypatch.setattr(html_extractor, "_FEED_BYTES", 7)
+
+    assert HtmlTextExtractor().extract_text(content) == whole
@@ -0,0 +1,97 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from aidial_sdk.chat_completion import Attachment
+
+from task.tools.deployment.image_cache import ImageResultCache
+from task.tools.deployment.image_generation_tool import ImageGenerationTool
+from task.tools.models import ToolCallParams
+from task.utils.accounting import RequestAccounting
+from task.utils.telemetry import CACHE_REQUESTS
+
+
+class StubImageGenerationTool(ImageGenerationTool):
+    """Image generation without a deployment: every call waits a bit and returns a new image URL."""
+
+    def __init__(self, cache: ImageResultCache | None = None):
+        super().__init__("http://dial", cache)
+        self.calls: list[tuple[str, dict]] = []
+
+    async def _call_deployment(self, prompt, custom_fields, api_key, stage=None, accounting=None):
+        self.calls.append((prompt, custom_fields))
+        await asyncio.sleep(0.02)
+        if accounting:
+            accounting.record_llm_call(self.deployment_name, prompt_tokens=10, completion_tokens=0)
+        return "", [Attachment(type="image/png", title="Image", url=f"files/image-{len(self.calls)}.png")]
+
+
+class RecordingStage:
+
+    def __init__(self):
+        self.content = ""
+        self.attachments: list[str] = []
+
+    def append_content(self, content: str) -> None:
+        self.content += content
+
+    def add_attachment(self, type: str, title: str, url: str) -> None:
+        self.attachments.append(url)
+
+
+def _params(arguments: dict, user_id: str | None = "user", accounting: RequestAccounting | None = None):
+    return ToolCallParams(
+        tool_call=SimpleNamespace(id="call", function=SimpleNamespace(arguments=json.dumps(arguments))),
+        stage=RecordingStage(),
+        choice=RecordingStage(),
+        api_key="per-request-key",
+        conversation_id="conversation",
+        user_id=user_id,
+        accounting=accounting,
+    )
+
+
+def _cache_requests(cache: str) -> tuple[float, float]:
+    requests = dict(CACHE_REQUESTS.items())
+    return requests.get((cache, "hit"), 0), requests.get((cache, "miss"), 0)
+
+
+def test_concurrent_identical_prompts_make_one_upstream_call():
+    tool = StubImageGenerationTool()
+    accountings = [RequestAccounting() for _ in range(5)]
+    # the same request: whitespace differs and the default size is set explicitly in some of them
+    arguments = [
+        {"prompt": "A red  fox"}, {"prompt": " A red fox", "size": "1024x1024"},
+    ] + [{"prompt": "A red fox"}] * 3
+    hits_before, misses_before = _cache_requests("image_single_flight")
+
+    async def main():
+        params = [_params(args, accounting=accounting) for args, accounting in zip(arguments, accountings)]
+        return await asyncio.gather(*[tool._execute(p) for p in params]), params
+
+    results, params = asyncio.run(main())
+
+    assert tool.calls == [("A red  fox", {})]
+    assert {result.custom_content.attachments[0].url for result in results} == {"files/image-1.png"}
+    assert all(p.stage.attachments == ["files/image-1.png"] for p in params)
+    assert _cache_requests("image_single_flight") == (hits_before + 4, misses_before + 1)
+    # only the request that started the generation pays for it
+    assert sum(accounting.models.get("dall-e-3") is not None for accounting in accountings) == 1
+
+
+def test_repeated_prompt_is_served_from_cache_and_other_users_miss_it():
+    tool = StubImageGenerationTool(ImageResultCache(ttl_seconds=60))
+    hits_before, misses_before = _cache_requests("image_result")
+
+    async def main():
+        first = await tool._execute(_params({"prompt": "A red fox"}))
+        repeated = await tool._execute(_params({"prompt": "A red fox "}))
+        other_user = await tool._execute(_params({"prompt": "A red fox"}, user_id="other"))
+        other_style = await tool._execute(_params({"prompt": "A red fox", "style": "natural"}))
+        return [result.custom_content.attachments[0].url for result in (first, repeated, other_user, other_style)]
+
+    urls = asyncio.run(main())
+
+    assert urls == ["files/image-1.png", "files/image-1.png", "files/image-2.png", "files/image-3.png"]
+    assert len(tool.calls) == 3
+    assert _cache_requests("image_result") == (hits_before + 1, misses_before + 3)
@@ -0,0 +1,134 @@
+import asyncio
+from contextlib import aclosing
+from types import SimpleNamespace
+
+import pytest
+from aidial_client._exception import DialException
+
+from task.utils.accounting import RequestAccounting
+from task.utils.llm_router import LLMRouter
+from task.utils.telemetry import LLM_TOKENS
+
+
+def _chunk(content: str = "", usage=None):
+    delta = SimpleNamespace(content=content or None, tool_calls=None)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=usage)
+
+
+class StubStream:
+    """Streaming completion of a stub deployment: a role chunk, then tokens after `first_token_delay`."""
+
+    def __init__(self, tokens: list[str], first_token_delay: float = 0.0):
+        self.chunks = [_chunk()] + [_chunk(token) for token in tokens]
+        self.first_token_delay = first_token_delay
+        self.position = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.position >= len(self.chunks):
+            raise StopAsyncIteration
+        if self.position == 1:
+            await asyncio.sleep(self.first_token_delay)
+        self.position += 1
+        return self.chunks[self.position - 1]
+
+    async def aclose(self):
+        self.closed = True
+
+
+class StubDeployments:
+
+    def __init__(self, **behaviours):
+        """:param behaviours: deployment -> StubStream or exception raised when the stream is opened"""
+        self.behaviours = behaviours
+        self.opened: list[str] = []
+
+    async def open_stream(self, deployment: str):
+        self.opened.append(deployment)
+        behaviour = self.behaviours[deployment]
+        if isinstance(behaviour, BaseException):
+            raise behaviour
+        return behaviour
+
+
+async def _read(routed) -> str:
+    async with aclosing(routed):
+        return "".join([chunk.choices[0].delta.content or "" async for chunk in routed])
+
+
+def test_first_deployment_answering_in_time_wins_without_hedging():
+    primary, secondary = StubStream(["Hel", "lo"], 0.01), StubStream(["other"])
+    deployments = StubDeployments(primary=primary, secondary=secondary)
+    router = LLMRouter(["primary", "secondary"], first_token_timeout=2.0, min_hedge_delay=0.5)
+
+    async def main():
+        routed = await router.stream(deployments.open_stream)
+        return routed, await _read(routed)
+
+    routed, text = asyncio.run(main())
+
+    assert (routed.deployment, text) == ("primary", "Hello")
+    assert deployments.opened == ["primary"]
+    assert routed.abandoned == []
+
+
+def test_failed_primary_falls_back_to_the_next_deployment():
+    deployments = StubDeployments(primary=DialException("overloaded", 503), secondary=StubStream(["fallback"]))
+    router = LLMRouter(["primary", "secondary"])
+
+    async def main():
+        routed = await router.stream(deployments.open_stream)
+        return routed, await _read(routed)
+
+    routed, text = asyncio.run(main())
+
+    assert (routed.deployment, text) == ("secondary", "fallback")
+    assert deployments.opened == ["primary", "secondary"]
+    # the failed deployment is tried last until its cooldown ends
+    assert router.ranked() == ["secondary", "primary"]
+
+
+def test_invalid_request_is_not_retried_on_other_deployments():
+    deployments = StubDeployments(primary=DialException("bad request", 400), secondary=StubStream(["unused"]))
+    router = LLMRouter(["primary", "secondary"])
+
+    with pytest.raises(DialException):
+        asyncio.run(router.stream(deployments.open_stream))
+    assert deployments.opened == ["primary"]
+
+
+def test_hedge_wins_and_the_losing_stream_is_closed_and_accounted():
+    slow, fast = StubStream(["slow"], first_token_delay=5.0), StubStream(["fast"])
+    deployments = StubDeployments(slow=slow, fast=fast)
+    # no first token samples yet: the hedge goes after half of the first token timeout
+    router = LLMRouter(["slow", "fast"], first_token_timeout=0.2, min_hedge_delay=0.05)
+    abandoned_before = LLM_TOKENS.get(deployment="slow", type="abandoned_prompt")
+    accounting = RequestAccounting()
+
+    async def main():
+        routed = await router.stream(deployments.open_stream)
+        text = await _read(routed)
+        routed.record_abandoned(SimpleNamespace(prompt_tokens=100), accounting)
+        return routed, text
+
+    routed, text = asyncio.run(main())
+
+    assert (routed.deployment, text) == ("fast", "fast")
+    assert deployments.opened == ["slow", "fast"]
+    assert slow.closed and fast.closed
+    assert routed.abandoned == ["slow"]
+    assert LLM_TOKENS.get(deployment="slow", type="abandoned_prompt") == abandoned_before + 100
+    assert accounting.models["slow"].calls == 1 and accounting.models["slow"].prompt_tokens == 100
+
+
+def test_last_attempt_has_no_first_token_deadline():
+    deployments = StubDeployments(only=StubStream(["late"], first_token_delay=0.2))
+    router = LLMRouter(["only"], first_token_timeout=0.05)
+
+    async def main():
+        return await _read(await router.stream(deployments.open_stream))
+
+    assert asyncio.run(main()) == "late"
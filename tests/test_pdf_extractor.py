@@ -0,0 +1,35 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from benchmarks.pdf_extraction import build_pdf
+from task.utils import pdf_extractor
+from task.utils.pdf_extractor import PdfTextExtractor
+
+
+@pytest.fixture(scope="module")
+def pdf_content() -> bytes:
+    return build_pdf(12)
+
+
+def test_parallel_extraction_matches_sequential(pdf_content):
+    sequential = PdfTextExtractor(workers=1).extract_text(pdf_content)
+
+    parallel = PdfTextExtractor(workers=2, pages_per_shard=4).extract_text(pdf_content)
+
+    assert sequential
+    assert parallel == sequential
+
+
+def test_broken_pool_is_replaced(pdf_content, monkeypatch):
+    broken = ProcessPoolExecutor(max_workers=2, mp_context=pdf_extractor._PdfWorkerContext())
+    with pytest.raises(Exception):
+        # a worker dying abruptly breaks the pool for every later task
+        broken.submit(os._exit, 1).result()
+    monkeypatch.setitem(pdf_extractor._executors, 2, broken)
+
+    text = PdfTextExtractor(workers=2, pages_per_shard=4).extract_text(pdf_content)
+
+    assert text == PdfTextExtractor(workers=1).extract_text(pdf_content)
+    assert pdf_extractor._executors[2] is not broken
@@ -0,0 +1,27 @@
+from task.utils.prompt_cache import PROMPT_CACHE_TTFT, PromptCacheStats
+from task.utils.telemetry import METRICS
+
+
+def _ttft_samples(prompt_cache: str) -> int:
+    prefix = f'agent_llm_ttft_by_prompt_cache_seconds_count{{prompt_cache="{prompt_cache}"}} '
+    return next((int(line[len(prefix):]) for line in PROMPT_CACHE_TTFT.render() if line.startswith(prefix)), 0)
+
+
+def test_ttft_is_split_by_prompt_cache_hits_and_missing_ttft_is_not_sampled():
+    stats = PromptCacheStats()
+    hits, misses = _ttft_samples("hit"), _ttft_samples("miss")
+
+    stats.record(prompt_tokens=1000, cached_tokens=800, ttft_ms=120)
+    stats.record(prompt_tokens=1000, cached_tokens=0, ttft_ms=450)
+    stats.record(prompt_tokens=1000, cached_tokens=0, ttft_ms=None)
+
+    assert _ttft_samples("hit") == hits + 1
+    assert _ttft_samples("miss") == misses + 1
+    assert stats.prompt_tokens == 3000
+    assert stats.hit_ratio == 800 / 3000
+
+
+def test_hit_ratio_is_exported():
+    PromptCacheStats()
+
+    assert "agent_prompt_cache_hit_ratio " in METRICS.render()
@@ -0,0 +1,98 @@
+import asyncio
+import copy
+from typing import Any, Optional
+
+import fakeredis
+from aidial_sdk.chat_completion import CustomContent, Message, Role
+
+from task.utils.constants import CONTENT_REF_KEY, TOOL_CALL_HISTORY_COMPRESSED_KEY, TOOL_CALL_HISTORY_KEY
+from task.utils.state_compaction import MISSING_CONTENT, RedisToolResultStore, StateCompactor, ToolResultStore
+
+_LARGE_RESULT = "Microwave manual page. " * 200
+_HISTORY = [
+    {"role": "assistant", "content": None, "tool_calls": [
+        {"id": "call_1", "type": "function", "function": {"name": "rag_search", "arguments": "{}"}},
+        {"id": "call_2", "type": "function", "function": {"name": "web_search", "arguments": "{}"}},
+    ]},
+    {"role": "tool", "tool_call_id": "call_1", "content": _LARGE_RESULT},
+    {"role": "tool", "tool_call_id": "call_2", "content": "Short result " * 100},
+    {"role": "assistant", "content": "The answer."},
+]
+
+
+class FailingToolResultStore(ToolResultStore):
+
+    async def put(self, contents: list[str], api_key: str) -> list[Optional[str]]:
+        return [None] * len(contents)
+
+
+def _round_trip(compactor: StateCompactor, state: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    """Compacted state and the state of an assistant message with it after `expand`."""
+
+    async def main():
+        compacted = await compactor.compact(state, "api-key")
+        # the client sends the state back as JSON
+        message = Message(role=Role.ASSISTANT, content="The answer.", custom_content=CustomContent(
+            state=copy.deepcopy(compacted)
+        ))
+        await compactor.expand([Message(role=Role.USER, content="Question"), message], "api-key")
+        return compacted, message.custom_content.state
+
+    return asyncio.run(main())
+
+
+def test_large_results_are_stored_by_ref_and_restored():
+    state = {TOOL_CALL_HISTORY_KEY: _HISTORY, "other": 1}
+
+    compacted, expanded = _round_trip(StateCompactor(ToolResultStore(), min_chars=2000), state)
+
+    stored = compacted[TOOL_CALL_HISTORY_KEY]
+    assert "content" not in stored[1] and stored[1][CONTENT_REF_KEY].startswith("sha256:")
+    # results under the limit stay inline
+    assert stored[2] == _HISTORY[2]
+    assert compacted["other"] == 1
+    assert expanded == state
+
+
+def test_compressed_history_is_restored():
+    state = {TOOL_CALL_HISTORY_KEY: _HISTORY}
+
+    compacted, expanded = _round_trip(StateCompactor(ToolResultStore(), min_chars=2000, compress=True), state)
+
+    assert TOOL_CALL_HISTORY_KEY not in compacted and compacted[TOOL_CALL_HISTORY_COMPRESSED_KEY]
+    assert expanded == state
+
+
+def test_compression_is_off_by_default_so_older_builds_can_read_the_history():
+    state = {TOOL_CALL_HISTORY_KEY: _HISTORY}
+
+    compacted, expanded = _round_trip(StateCompactor(None), state)
+
+    assert compacted == state
+    assert expanded == state
+
+
+def test_result_that_failed_to_store_stays_inline():
+    state = {TOOL_CALL_HISTORY_KEY: _HISTORY}
+
+    compacted, expanded = _round_trip(StateCompactor(FailingToolResultStore(), min_chars=2000), state)
+
+    assert compacted == state
+    assert expanded == state
+
+
+def test_refs_are_shared_by_replicas_and_missing_ones_are_marked():
+    server = fakeredis.FakeServer()
+    state = {TOOL_CALL_HISTORY_KEY: _HISTORY}
+    writer = StateCompactor(RedisToolResultStore(fakeredis.FakeRedis(server=server)), min_chars=2000, compress=True)
+    compacted = asyncio.run(writer.compact(state, "api-key"))
+
+    def expand(store: ToolResultStore) -> list[dict[str, Any]]:
+        message = Message(role=Role.ASSISTANT, custom_content=CustomContent(state=copy.deepcopy(compacted)))
+        asyncio.run(StateCompactor(store, min_chars=2000).expand([message], "api-key"))
+        return message.custom_content.state[TOOL_CALL_HISTORY_KEY]
+
+    assert expand(RedisToolResultStore(fakeredis.FakeRedis(server=server))) == _HISTORY
+    # expired, or the store is no longer configured
+    assert expand(ToolResultStore())[1]["content"] == MISSING_CONTENT
+    assert expand(None)[1]["content"] == MISSING_CONTENT
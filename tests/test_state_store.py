@@ -0,0 +1,33 @@
+import asyncio
+
+import fakeredis
+
+from task.utils.state_store import ConversationStateStore, RedisConversationStateStore
+
+
+def test_redis_round_trip_is_shared_by_replicas():
+    server = fakeredis.FakeServer()
+    first = RedisConversationStateStore(fakeredis.FakeRedis(server=server))
+    second = RedisConversationStateStore(fakeredis.FakeRedis(server=server))
+
+    asyncio.run(first.set("conversation-1", "interpreter_session_id", "session-42"))
+
+    assert asyncio.run(second.get("conversation-1", "interpreter_session_id")) == "session-42"
+    assert asyncio.run(second.get("conversation-2", "interpreter_session_id")) is None
+
+
+def test_redis_conversation_expires_after_last_write():
+    client = fakeredis.FakeRedis()
+    store = RedisConversationStateStore(client, ttl_seconds=60)
+
+    asyncio.run(store.set("conversation-1", "interpreter_session_id", "session-42"))
+
+    assert 0 < client.ttl("agent:conversation:conversation-1") <= 60
+
+
+def test_in_memory_entries_expire():
+    store = ConversationStateStore(ttl_seconds=0)
+
+    asyncio.run(store.set("conversation-1", "interpreter_session_id", "session-42"))
+
+    assert asyncio.run(store.get("conversation-1", "interpreter_session_id")) is None